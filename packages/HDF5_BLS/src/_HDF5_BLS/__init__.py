@@ -7,3 +7,6 @@ from . import conversion_PSD as conversion_PSD
 from . import errors as errors
 
 from .wrapper import Wrapper
+from .dataset_view import DatasetView
+from .dataset_stream import DatasetStream
+from .treatment_checkpoint import TreatmentCheckpoint
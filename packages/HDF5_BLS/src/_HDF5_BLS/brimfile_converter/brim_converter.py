@@ -153,7 +153,7 @@ class BrimConverter:
         """ 
         Function to do the heavy lifting for loading a brimX file (h5 from HDF5_BLS), scraping the
         relevant quantities from the brimX format (HDF5Flattener class), reshaping as necessary, 
-        and then passing to brim with a file extension dictated by the user input (zarr, zip).
+        and then passing to brim one Measure group at a time with a file extension dictated by the user input (zarr, zip).
         __________
         Input: 
             self (nominally the input file name/path)
@@ -163,21 +163,22 @@ class BrimConverter:
         from .hdf5_flattener import HDF5Flattener 
         flattener = HDF5Flattener()
         
-        # load file_from and enforce flattened dataset shapes for the brimfile pass, then create new brim file
-        data_from_brimX = flattener.flatten(self.filename_from) 
+        # traverse file_from once to plan the conversion of its Measure groups, then create new brim file
+        plans = flattener.build_plan(self.f_from)
         self.f_to = File.create(self.filename_to, store_type=StoreType.AUTO)
 
+        # convert the groups one after the other, the PSD being streamed chunk by chunk from file_from to the brim file
         # assignments to local variables + hardcode as only AS curently, future: potentially add extra dimension if _S exists
-        print(data_from_brimX)
-        for i in range(len(data_from_brimX["PSD"])):
-            PSD = data_from_brimX["PSD"][i]
-            freq = data_from_brimX["frequency"][i]
-            shift = data_from_brimX.get("shift_as", {}).get(i)
-            width = data_from_brimX.get("width_as", {}).get(i)
-            amplitude = data_from_brimX.get("amplitude_as", {}).get(i)
-            dz = data_from_brimX.get("dz", {}).get(i, 1)
-            dy = data_from_brimX.get("dy", {}).get(i, 1)
-            dx = data_from_brimX.get("dx", {}).get(i, 1)
+        for i, group_plan in enumerate(plans):
+            data_from_brimX = flattener.read_group(self.f_from, group_plan)
+            PSD = data_from_brimX["PSD"]
+            freq = data_from_brimX["frequency"]
+            shift = data_from_brimX.get("shift_as")
+            width = data_from_brimX.get("width_as")
+            amplitude = data_from_brimX.get("amplitude_as")
+            dz = data_from_brimX.get("dz", 1)
+            dy = data_from_brimX.get("dy", 1)
+            dx = data_from_brimX.get("dx", 1)
 
             # create data group in brim file, populate with PSD, freq, and spatial info
             d = self.f_to.create_data_group(PSD, freq, (dz, dy, dx), name=f"Group_{i}")
@@ -17,21 +17,50 @@ BT_TO_ATTR = { # Brillouin_type to brimfile attribute pair types, Pierre: Carlo,
 # TODO: AS vs S nuance not captured with Pierre's yet! hardcoding everything to AS above but Carlo's will pass both
 # TODO: Pierre's BLT and _std values not captured. Carlo's Offset, R2, RMSE, Cov_matrix are leaked (and AS vs S)
 
+class PSDView:
+    """
+    read-only view of a brimX PSD dataset with the (z, y, x, spectrum) dimensions of brimfile, the missing
+    spatial dimensions of 1D-to-3D Brillouin data being added in front (carlo). Only the regions that are 
+    indexed are read from the file, so that brimfile can stream the PSD chunk by chunk into the brim store
+    """
+    def __init__(self, dataset):
+        if dataset.ndim > 4:
+            raise ValueError(f"PSD of shape {dataset.shape} is not supported")
+        self.dataset = dataset
+        self.n_missing = 4 - dataset.ndim
+        self.shape = (1,) * self.n_missing + tuple(dataset.shape)
+        self.ndim = 4
+        self.dtype = dataset.dtype
+        self.itemsize = self.dtype.itemsize
+        self.size = int(np.prod(self.shape))
+        self.nbytes = self.size * self.itemsize
+
+    def __getitem__(self, key):
+        # complete the region with full slices and only read its part on the dimensions of the dataset
+        if not isinstance(key, tuple):
+            key = (key,)
+        if key == (Ellipsis,):
+            key = ()
+        if not all(isinstance(k, slice) for k in key):
+            raise IndexError("PSDView can only be indexed with slices")
+        key = key + (slice(None),) * (4 - len(key))
+        region = tuple(len(range(*k.indices(n))) for k, n in zip(key, self.shape))
+        return np.asarray(self.dataset[key[self.n_missing:]]).reshape(region)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
 class HDF5Flattener:
     """
     class that wraps the flatten() function to prepare brimX files for conversion to brimfile :)
+    the file is traversed once to build a conversion plan (paths of the Brillouin datasets and metadata 
+    of each Measure group), the groups are then read one after the other following this plan
         __________
         Returns:
             a dictionary of brim-ready arrays containing the Brillouin data, invoked by .flatten() in driver
         TODO: currently leaks Impulse response and Calibration data sets
     """
     def __init__(self):
-        self.acq_path_to_index = {}
-        self.acq_path_to_metadata_index = {}
-        self.flat_shape = {}
-        self.data_index = 0
-        self.data_metadata_index = 0
-
         self.frequency = {}
         self.PSD = {}
         self.x = {}
@@ -50,44 +79,35 @@ class HDF5Flattener:
         self.blt_std_as = {}
 
         self.metadata = {}
-        self.dataset_queue = []  # store all datasets for ordered processing
 
-        # Store paths of groups that are of Brillouin_type == "Measure"
+        # Store paths of groups that are of Brillouin_type == "Measure" and the conversion plan of each of them
         self.measure_paths = set()
+        self.plan = {}
 
-    def collect_measure_groups(self, name, obj):
-        """Pre-scan to find all group paths that are 'Measure' acquisition groups"""
-        if isinstance(obj, h5py.Group):
-            #rint(f"\nVisited group: {name}")
-            #for attr_key in obj.attrs:
-                #if not attr_key.startswith("Process"):
-                    #print(f"  ↳ Attribute: {attr_key} = {obj.attrs[attr_key]}")      
-
-            attr_type = obj.attrs.get("Brillouin_type", None)
-            if attr_type == "Measure": # should I make one for Impulse_response and Calibration_spectrum as well?
-                self.measure_paths.add(name)
-                #print(f"Found 'Measure' group: {name}")  # highlight matched groups
+    def plan_conversion(self, name, obj):
+        """
+        single traversal of the brimX file: finds the 'Measure' acquisition groups (visited before their
+        children) and collects the metadata and the paths of the Brillouin datasets of each of them, 
+        without reading any data
+        """
+        if isinstance(obj, h5py.Group) and obj.attrs.get("Brillouin_type", None) == "Measure": # should I make one for Impulse_response and Calibration_spectrum as well?
+            self.measure_paths.add(name)
 
-    def collect_metadata(self, name, obj):
         base_acq = self.get_base_acquisition_path(name)
         if base_acq is None:
             return
-        
-        # Get or assign index
-        if base_acq not in self.acq_path_to_metadata_index:
-            self.acq_path_to_metadata_index[base_acq] = self.data_metadata_index
-            self.data_metadata_index += 1
-
-        jdx = self.acq_path_to_metadata_index[base_acq]
-
-        # Initialize dictionary for this idx
-        if jdx not in self.metadata:
-            self.metadata[jdx] = {}
+        if base_acq not in self.plan:
+            self.plan[base_acq] = {"metadata": {}, "datasets": {}}
+        group_plan = self.plan[base_acq]
 
         # Filter and collect metadata
         for attr_key in obj.attrs:
             if attr_key.startswith(("FILEPROP", "MEASURE", "SPECTROMETER")): # Pierre's end
-                self.metadata[jdx][attr_key] = obj.attrs[attr_key] 
+                group_plan["metadata"][attr_key] = obj.attrs[attr_key]
+
+        # The key-word on Pierre's end is datasets with Brillouin_type attributes
+        if isinstance(obj, h5py.Dataset) and "Brillouin_type" in obj.attrs:
+            group_plan["datasets"][obj.attrs["Brillouin_type"]] = name
 
     def get_base_acquisition_path(self, name):
         """Returns acquisition path if it is a child of a 'Measure' group"""
@@ -98,73 +118,56 @@ class HDF5Flattener:
                 return candidate
         return None   
 
-    def copy_dataset(self, name, obj):
+    def build_plan(self, f_src):
         """
-        visit directories that have been identified as containing Brillouin datasets, then based on 
-        what is found, scrape the data, reshape it if necessary (e.g. PSD), then store locally for
-        output in flatten() and then the pass to brimfile in brim_converter.py
+        __________
+        Input: 
+            the opened brimX file (h5py.File)
+        Returns:
+            the conversion plans of the Measure groups containing a PSD, in the order of the traversal
         """
-        if not isinstance(obj, h5py.Dataset):
-            return     
+        f_src.visititems(self.plan_conversion)
+        plans = [group_plan for group_plan in self.plan.values() if "PSD" in group_plan["datasets"]]
+        if not plans:
+            raise Exception(f"No PSD Brillouin_type attribute found in {f_src.filename}. PSD is required to convert to brimfile.") 
+        return plans
 
-        # identify path to high level base paths that containing low level Brillouin datasets
-        base_acq = self.get_base_acquisition_path(name)
-        if base_acq is None:
-            return
-
-        if base_acq not in self.acq_path_to_index:
-            self.acq_path_to_index[base_acq] = self.data_index
-            self.flat_shape = {}
-            self.data_index += 1
+    def read_group(self, f_src, group_plan):
+        """
+        read the datasets of one Measure group following its plan and reshape them if necessary. The PSD 
+        is returned as a PSDView, only read region by region when it is written
+        __________
+        Input: 
+            the opened brimX file (h5py.File) and the plan of the group
+        Returns:
+            a dictionary with the keys of the dictionary returned by flatten(), holding the data of the group
+        """
+        datasets = group_plan["datasets"]
+        group = {"PSD": PSDView(f_src[datasets["PSD"]]), "metadata": group_plan["metadata"]}
+
+        # spectral and spatial axes
+        for bt, key in (("Frequency", "frequency"), ("Abscissa_0_1", "x"), ("Abscissa_1_2", "y"), ("Abscissa_2_3", "z")): # TODO: correctly scrape abscissa from brim
+            if bt in datasets:
+                group[key] = f_src[datasets[bt]][()]
+
+        # treatment maps, making sure to add dummy dimensions correctly as/if needed
+        for bt in TREATMENT_LEVEL:
+            if bt in datasets:
+                value = f_src[datasets[bt]][()]
+                if not 1 <= value.ndim <= 3:
+                    raise ValueError(f"{bt} of shape {value.shape} is not supported")
+                group[BT_TO_ATTR[bt]] = value[(None,) * (3 - value.ndim)]
+
+        # shape checks
+        if "shift_as" in group and group["PSD"].shape[:-1] != group["shift_as"].shape:
+            raise ValueError(f"Shape mismatch for index {datasets['PSD']}: the non-spectral dimensions of PSD {group['PSD'].shape[:-1]} do not match the dimensions of your shift! {group['shift_as'].shape}")
 
-        idx = self.acq_path_to_index[base_acq]
+        # safely deactivate dx, dy, or dz if they don't exist, because they're still needed in brimfile
+        group["dx"] = np.mean(np.diff(group["x"])) if "x" in group else 1 # needs to be None instead?
+        group["dy"] = np.mean(np.diff(group["y"])) if "y" in group else 1
+        group["dz"] = np.mean(np.diff(group["z"])) if "z" in group else 1
+        return group
 
-        # The key-word on Pierre's end is datasets with Brillouin_type attributes
-        bt = obj.attrs.get("Brillouin_type")
-
-        # prepare for possibility that PSD could be representative of 1D-to-4D Brillouin data
-        if bt == "PSD" and not self.flat_shape:
-            if len(obj.shape) == 1:
-                self.flat_shape = 1
-                #xdim, ydim, zdim = 1, 1, 1 # pierre
-                zdim, ydim, xdim = 1, 1, 1 # carlo
-            elif len(obj.shape) == 2:
-                self.flat_shape = obj.shape[0]
-                #xdim, ydim, zdim = obj.shape[0], 1, 1 # pierre
-                zdim, ydim, xdim = 1, 1, obj.shape[0] # carlo
-            elif len(obj.shape) == 3:
-                self.flat_shape = obj.shape[0] * obj.shape[1]
-                #xdim, ydim, zdim = obj.shape[0], obj.shape[1], 1 # pierre
-                zdim, ydim, xdim = 1, obj.shape[0], obj.shape[1] # carlo
-            elif len(obj.shape) == 4:
-                self.flat_shape = obj.shape[0] * obj.shape[1] * obj.shape[2]
-                #xdim, ydim, zdim = obj.shape[0], obj.shape[1], obj.shape[2] # pierre
-                zdim, ydim, xdim = obj.shape[0], obj.shape[1], obj.shape[2] # carlo
-
-        # if a dataset is found, store it locally for future pass to brim
-        if bt == "Frequency":
-            self.frequency[idx] = obj[()]
-        elif bt == "PSD":
-            self.PSD[idx] = np.reshape(obj, (zdim, ydim, xdim, obj.shape[-1])) # this needs to be as is
-        #elif obj.attrs["Brillouin_data"] == "Raw_data": # should I just pass this through un-reshaped?
-         #   self.Raw_data[idx] = np.reshape(obj, (d)) # TODO: raw data?
-        elif bt == "Abscissa_0_1": # TODO: correctly scrape this from brim
-            self.x[idx] = obj[()] # what about for 2D case?
-        elif bt == "Abscissa_1_2":
-            self.y[idx] = obj[()]
-        elif bt == "Abscissa_2_3":
-            self.z[idx] = obj[()]
-        elif bt in TREATMENT_LEVEL: # making sure to add dummy dimensions correctly as/if needed
-            self_tmp = getattr(self, BT_TO_ATTR[bt])
-            if len(obj.shape) == 1: # 1D input dataset
-                self_tmp[idx] = (obj[()])[None, None, ...]
-            elif len(obj.shape) == 2: # 2D input dataset
-                self_tmp[idx] = (obj[()])[None, ...]
-            elif len(obj.shape) == 3: # 3D input dataset
-                self_tmp[idx] = obj[()]
-            else:
-                raise ValueError(f"{bt} of shape {obj.shape} is not supported")            
-        
     # sees the outside world
     def flatten(self, src_path):
         """
@@ -174,26 +177,12 @@ class HDF5Flattener:
         Returns:
             a dictionary containing the reshaped Brillouin data that brim_converter unpackages and passes to brim        
         """
-
-        # heavy lifting
         with h5py.File(src_path, 'r') as f_src:
-            f_src.visititems(self.collect_measure_groups)  # find Measure groups
-            f_src.visititems(self.collect_metadata)    # collect metadata
-            f_src.visititems(self.copy_dataset) # do heavy lifting for extracting/reshaping
-
-        # final checks for PSD existence and shape checks
-        if not self.PSD:
-            raise Exception(f"No PSD Brillouin_type attribute found in {src_path}. PSD is required to convert to brimfile.") 
-        for k in self.PSD:
-            if k in self.shift_as:
-                if self.PSD[k].shape[:len(self.PSD[k].shape)-1] != self.shift_as[k].shape[:len(self.shift_as[k].shape)]:
-                    raise ValueError(f"Shape mismatch for index {k}: the non-spectral dimensions of PSD {self.PSD[k].shape[:len(self.PSD[k].shape)-1]} do not match the dimensions of your shift! {self.shift_as[k].shape[:len(self.shift_as[k].shape)]}")
-        
-        # safely deactivate dx, dy, or dz if they don't exist, because they're still needed in brimfile
-        for j in range(self.data_index):
-            self.dx[j] = np.mean(np.diff(self.x[j])) if self.x else 1 # needs to be None instead?
-            self.dy[j] = np.mean(np.diff(self.y[j])) if self.y else 1
-            self.dz[j] = np.mean(np.diff(self.z[j])) if self.z else 1
+            for idx, group_plan in enumerate(self.build_plan(f_src)):
+                group = self.read_group(f_src, group_plan)
+                group["PSD"] = np.asarray(group["PSD"]) # the file is closed on return
+                for key, value in group.items():
+                    getattr(self, key)[idx] = value
 
         return {
             "frequency": self.frequency,
@@ -0,0 +1,75 @@
+import numpy as np
+
+from .errors import WrapperError_ArgumentType
+
+class DatasetStream:
+    """
+    Writer appending spectra or frames to a resizable dataset of a wrapper while an acquisition is running. The dataset grows along its first dimension, each element of this dimension being one spectrum (or one frame). When spectra are appended, the "MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()" attribute of the parent group is updated as the data is appended. Streams are created with Wrapper.open_stream.
+
+    Attributes
+    ----------
+    wrapper: Wrapper
+        The wrapper the dataset belongs to.
+    path: str
+        The path to the dataset in the file.
+    dataset: h5py.Dataset
+        The resizable dataset the data is appended to.
+    element_shape: tuple
+        The shape of a single spectrum or frame.
+    sampling_matrix: tuple or None
+        The shape (Nx, Ny, Nz) of the map being acquired, None if unknown. Only Ny and Nz are used to count the lines acquired so far, so Nx can be None if the number of lines is not known in advance.
+    count: int
+        The number of spectra or frames appended so far.
+    """
+    def __init__(self, wrapper, path, dataset, sampling_matrix = None):
+        self.wrapper = wrapper
+        self.path = path
+        self.dataset = dataset
+        self.element_shape = tuple(dataset.shape[1:])
+        self.sampling_matrix = sampling_matrix
+        self.count = dataset.shape[0]
+
+    def append(self, block):
+        """Appends one or several spectra (or frames) at the end of the dataset.
+
+        Parameters
+        ----------
+        block : array-like
+            The data to append. Its last dimensions must match the shape of a single spectrum (or frame). Any leading dimension is flattened, so that a single spectrum, a line of spectra or a whole plane can be appended at once.
+
+        Raises
+        ------
+        WrapperError_ArgumentType
+            Raises an error if the shape of the block does not match the shape of the spectra of the dataset.
+        """
+        block = np.asarray(block, dtype = self.dataset.dtype)
+        nb_dims = len(self.element_shape)
+        if block.ndim < nb_dims or block.shape[block.ndim - nb_dims:] != self.element_shape:
+            raise WrapperError_ArgumentType(f"The block of shape {block.shape} can't be appended to spectra of shape {self.element_shape}.")
+        block = block.reshape((-1,) + self.element_shape)
+
+        # Grow the dataset and write the block at its end
+        self.wrapper._invalidate_cache(self.path)
+        self.dataset.resize(self.count + block.shape[0], axis = 0)
+        self.dataset[self.count:] = block
+        self.count += block.shape[0]
+
+        self.update_sampling_matrix()
+
+    def update_sampling_matrix(self):
+        """Updates the "MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()" attribute of the parent group with the number of spectra acquired so far. If the shape of the map was not given, the spectra are considered as a single line. Otherwise only the complete lines (along the first dimension of the map) are counted. The attribute is not written when frames are appended, as the wrapper reshapes the dataset to the sampling matrix followed by a single dimension, which would flatten the frames.
+        """
+        if len(self.element_shape) > 1:
+            return
+        if self.sampling_matrix is None:
+            shape = (self.count, 1, 1)
+        else:
+            nb_line = int(np.prod(self.sampling_matrix[1:]))
+            shape = (self.count // nb_line,) + tuple(self.sampling_matrix[1:])
+        value = ",".join(str(int(e)) for e in shape)
+
+        # Only write the attribute when it changes
+        parent = self.dataset.parent
+        if parent.attrs.get("MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()", None) != value:
+            self.wrapper._invalidate_cache(parent.name)
+            parent.attrs["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"] = value
@@ -0,0 +1,196 @@
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+class DatasetView(NDArrayOperatorsMixin):
+    """
+    Lazy view on a dataset of a wrapper. The view has the shape of the dataset after it is reshaped with the "MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()" attribute, but no data is read from the file until the view is sliced or converted to a numpy array. Slicing the view with integers and slices only reads the corresponding hyperslab of the dataset, so that a single spectrum of a large map can be accessed without loading the whole map in memory.
+
+    Attributes
+    ----------
+    wrapper: Wrapper
+        The wrapper the dataset belongs to.
+    path: str
+        The path to the dataset in the file.
+    shape: tuple
+        The shape of the dataset once reshaped.
+    dtype: numpy.dtype
+        The type of the data.
+
+    Example
+    -------
+    >>> view = wrp["Brillouin/Measure/PSD"] # Nothing is read from the file
+    >>> spectrum = view[10, 20] # Only the spectrum at position (10, 20) is read
+    >>> data = np.asarray(view) # The whole dataset is read
+    """
+    def __init__(self, wrapper, path, stored_shape, dtype, shape = None):
+        self.wrapper = wrapper
+        self.path = path
+        self.stored_shape = tuple(stored_shape)
+        self.dtype = dtype
+        if shape is None:
+            shape = self.stored_shape
+        self.shape = tuple(shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        if self.ndim == 0:
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"<DatasetView '{self.path}': shape {self.shape}, type '{self.dtype}'>"
+
+    def __array__(self, dtype = None, copy = None):
+        data = self.read()
+        if dtype is not None:
+            data = data.astype(dtype, copy = False)
+        return data
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        # Views are converted to arrays before applying any numpy operation
+        inputs = tuple(np.asarray(e) if isinstance(e, DatasetView) else e for e in inputs)
+        if "out" in kwargs:
+            kwargs["out"] = tuple(np.asarray(e) if isinstance(e, DatasetView) else e for e in kwargs["out"])
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getitem__(self, key):
+        """Reads the part of the dataset selected by a numpy-style key.
+
+        Parameters
+        ----------
+        key : int, slice, tuple or array
+            The selection to read, expressed on the reshaped dataset.
+
+        Returns
+        -------
+        numpy array
+            The selected data.
+        """
+        normalized = self._normalize_key(key)
+
+        # Keys that can't be converted to a hyperslab are applied on the whole data
+        if normalized is None:
+            return self.read()[key]
+        key = normalized
+
+        # If the dataset is not reshaped, the key is directly given to h5py when possible
+        if self.shape == self.stored_shape:
+            return self._read_selection(key)
+
+        # Find the leading dimensions of the view that are flattened in the first dimension of the dataset
+        nb_tail = 0
+        while nb_tail < min(len(self.shape), len(self.stored_shape)) and self.shape[-1-nb_tail] == self.stored_shape[-1-nb_tail]:
+            nb_tail += 1
+        lead_shape = self.shape[:len(self.shape)-nb_tail]
+        if len(self.stored_shape) - nb_tail != 1:
+            return self.read()[key]
+
+        # Convert the selection on the leading dimensions into a selection of rows of the dataset
+        lead_key, tail_key = key[:len(lead_shape)], key[len(lead_shape):]
+        selected, lead_result_shape = [], []
+        for k, n in zip(lead_key, lead_shape):
+            if isinstance(k, slice):
+                k = np.arange(*k.indices(n))
+                lead_result_shape.append(len(k))
+            elif isinstance(k, np.ndarray):
+                lead_result_shape.append(len(k))
+            else:
+                k = np.array([k])
+            selected.append(k)
+        rows = np.ravel_multi_index(np.ix_(*selected), lead_shape).ravel()
+
+        # Read the rows and the tail of the dataset, then give the leading dimensions their shape
+        data = self._read_selection((rows,) + tail_key)
+        return data.reshape(tuple(lead_result_shape) + data.shape[1:])
+
+    def read(self):
+        """Reads the whole dataset and reshapes it.
+
+        Returns
+        -------
+        numpy array
+            The data of the dataset.
+        """
+        with self.wrapper._open('r') as file:
+            data = file[self.path][()]
+        return data.reshape(self.shape)
+
+    def _normalize_key(self, key):
+        # Express the key as a tuple with one non-negative integer, slice or integer array per dimension, or return None if it is not possible
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(e is None or (isinstance(e, np.ndarray) and e.dtype == bool) for e in key):
+            return None
+        ellipsis = [i for i, e in enumerate(key) if e is Ellipsis]
+        if len(ellipsis) > 1:
+            return None
+        elif len(ellipsis) == 1:
+            i = ellipsis[0]
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i+1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices for array: array is {self.ndim}-dimensional, but {len(key)} were indexed")
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        normalized, nb_arrays = [], 0
+        for k, n in zip(key, self.shape):
+            if isinstance(k, slice):
+                # Slices with a negative step are kept as such as their normalized bounds can't be used for indexing
+                start, stop, step = k.indices(n)
+                normalized.append(slice(start, stop, step) if step > 0 else k)
+            elif isinstance(k, (int, np.integer)):
+                if not -n <= k < n:
+                    raise IndexError(f"index {k} is out of bounds for axis with size {n}")
+                normalized.append(int(k) % n)
+            else:
+                k = np.asarray(k)
+                if k.ndim != 1 or not np.issubdtype(k.dtype, np.integer):
+                    return None
+                if np.any(k >= n) or np.any(k < -n):
+                    raise IndexError(f"index out of bounds for axis with size {n}")
+                normalized.append(k % n)
+                nb_arrays += 1
+        # Numpy broadcasts several integer arrays together, which is not a hyperslab
+        if nb_arrays > 1:
+            return None
+        return tuple(normalized)
+
+    def _read_selection(self, key):
+        # Read a selection of the dataset, using h5py for integers, increasing slices and increasing unique lists, and numpy for the rest
+        h5_key, np_key = [], []
+        for k in key:
+            if isinstance(k, int):
+                h5_key.append(k)
+            elif isinstance(k, slice) and k.step is not None and k.step > 0:
+                h5_key.append(k)
+                np_key.append(slice(None))
+            elif isinstance(k, slice):
+                h5_key.append(slice(None))
+                np_key.append(k)
+            else:
+                # Regular sequences of indices are read as slices, other ones as a sorted list of unique indices
+                if len(k) > 1 and np.all(np.diff(k) == k[1] - k[0]) and k[1] > k[0]:
+                    h5_key.append(slice(int(k[0]), int(k[-1]) + 1, int(k[1] - k[0])))
+                    np_key.append(slice(None))
+                elif len(k) == 1:
+                    h5_key.append(slice(int(k[0]), int(k[0]) + 1))
+                    np_key.append(slice(None))
+                elif len(k) == 0:
+                    h5_key.append(slice(0, 0))
+                    np_key.append(slice(None))
+                else:
+                    unique, inverse = np.unique(k, return_inverse = True)
+                    h5_key.append(list(unique))
+                    np_key.append(inverse)
+
+        with self.wrapper._open('r') as file:
+            data = file[self.path][tuple(h5_key)]
+        if any(not (isinstance(k, slice) and k == slice(None)) for k in np_key):
+            data = data[tuple(np_key)]
+        return np.asarray(data)
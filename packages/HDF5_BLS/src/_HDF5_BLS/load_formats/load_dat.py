@@ -7,6 +7,8 @@ import logging
 
 from .load_errors import LoadError_parameters
 
+BLOCK_SIZE_TIMEDOMAIN = 2**22 # Number of points of the TimeDomain traces loaded or processed at once, which bounds the size of the temporary arrays
+
 class PipelineLogger(logging.Handler):
     def __init__(self):
         super().__init__()
@@ -454,30 +456,24 @@ def load_dat_TimeDomain(filepath, parameters = None):
     def basic_process(attributes, filepath):
         n_traces = attributes["TIMEDOMAIN.n_traces"]
         points_per_trace = attributes["TIMEDOMAIN.points_per_trace"]
-        bytes_per_point = attributes["TIMEDOMAIN.bytes_per_point"]
         fmt = attributes["TIMEDOMAIN.fmt"]
         Nx_steps = attributes["TIMEDOMAIN.Nx_steps"]
         Ny_steps = attributes["TIMEDOMAIN.Ny_steps"]
         vgain = attributes["TIMEDOMAIN.vgain"]
         voff = attributes["TIMEDOMAIN.voff"]
         ac_gain = attributes["TIMEDOMAIN.ac_gain"]
-        # load and basic process for .dat file
-        with open(filepath, 'r') as fi:
-            # Create an array of traces
-            traces = np.arange(1, n_traces + 1)
-            # Initialize the data array
-            data_tmp = np.zeros((len(traces), points_per_trace))
-            # Loop through each trace and read data
-            print('Loading time domain data...')
-            for i, trace in enumerate(traces):
-                # Move the file pointer to the correct position
-                fi.seek((trace - 1) * points_per_trace * bytes_per_point)
-                # Read the data for the current trace
-                data_tmp[i, :] = np.fromfile(fi, dtype=fmt, count=points_per_trace)
-
-            data_tmp2 = data_tmp.reshape(Nx_steps, Ny_steps, points_per_trace, order='F')
-            # apply appropriate voltage gain and voltage offset from meta file
-            data_ac = (data_tmp2 * vgain + voff)/ac_gain
+        # map the binary .dat file in memory without reading it, one trace per row
+        print('Loading time domain data...')
+        traces = np.memmap(filepath, dtype=fmt, mode='r', shape=(n_traces, points_per_trace))
+        # the traces are stored along x first: trace x + Nx*y is the trace at position (x, y)
+        traces = traces[:Nx_steps * Ny_steps].reshape(Ny_steps, Nx_steps, points_per_trace)
+        # apply appropriate voltage gain and voltage offset from meta file, reading the file by blocks of lines of the scan to limit the memory used by the temporary arrays
+        data_ac = np.empty((Nx_steps, Ny_steps, points_per_trace), dtype=np.float32)
+        lines_per_block = max(1, BLOCK_SIZE_TIMEDOMAIN // (Nx_steps * points_per_trace))
+        for start in range(0, Ny_steps, lines_per_block):
+            block = traces[start:start + lines_per_block]
+            data_ac[:, start:start + lines_per_block] = ((block * vgain + voff) / ac_gain).transpose(1, 0, 2)
+        del traces
 
         # reverse left-right time trace if needed
         if attributes["TIMEDOMAIN.bool_reverse_data"]:
@@ -490,15 +486,17 @@ def load_dat_TimeDomain(filepath, parameters = None):
         Ny_steps = attributes["TIMEDOMAIN.Ny_steps"]
         if os.path.isfile(filepath_dc):
             print('DC data found: ', filepath_dc)
-            with open(filepath_dc, 'rb') as fi:
-                # Read all data as float32
-                tmp_dc = np.fromfile(fi, dtype=np.float32)        
+            # map the float32 DC data in memory, the samples of all the positions of the scan being stored one after the other
+            tmp_dc = np.memmap(filepath_dc, dtype=np.float32, mode='r')
             dc_samples = int(len(tmp_dc) / (Nx_steps * Ny_steps))
-            data_dc = np.mean(tmp_dc.reshape(Nx_steps, Ny_steps, dc_samples, order='F'), 2)
-            data_mod = data_ac / data_dc.reshape(Nx_steps, Ny_steps, 1, order='F')
+            tmp_dc = tmp_dc[:dc_samples * Nx_steps * Ny_steps].reshape(dc_samples, Ny_steps, Nx_steps)
+            data_dc = np.mean(tmp_dc, axis=0, dtype=np.float64).T
+            del tmp_dc
+            # normalize the AC data in place
+            data_ac /= data_dc[:, :, np.newaxis]
         else:
             print('Could not find a valid DC data file, using AC data only')
-            data_mod = data_ac
+        data_mod = data_ac
         return data_mod
 
     def find_copeaks(attributes, data_mod):
@@ -545,6 +543,14 @@ def load_dat_TimeDomain(filepath, parameters = None):
         dt = data_t[1]
         return data_t, dt
 
+    def blocks(traces, points_per_trace = None):
+        # yield slices of the traces (one trace per row) holding about BLOCK_SIZE_TIMEDOMAIN points (counted on traces of points_per_trace points if given), so that the temporary arrays of the processing stay small whatever the shape of the scan
+        if points_per_trace is None:
+            points_per_trace = traces.shape[-1]
+        traces_per_block = max(1, BLOCK_SIZE_TIMEDOMAIN // max(1, points_per_trace))
+        for start in range(0, traces.shape[0], traces_per_block):
+            yield slice(start, start + traces_per_block)
+
     def LPfilter(attributes, data_in, dt):
         # Sampling frequency (Hz) from the time vector
         fs = 1 / dt
@@ -559,34 +565,32 @@ def load_dat_TimeDomain(filepath, parameters = None):
             normalized_cutoff = LP / nyquist_freq  
             # Design a Butterworth lowpass filter
             b, a = butter(butter_order, normalized_cutoff, btype='low')
-            for i in range(data_in.shape[0]):  
-                for j in range(data_in.shape[1]):  
-                    # Apply the filter using filtfilt (zero-phase filtering)
-                    data_in[i, j, :] = filtfilt(b, a, data_in[i, j, :])
+            traces = data_in.reshape(-1, data_in.shape[-1])
+            for block in blocks(traces):
+                # Apply the filter using filtfilt (zero-phase filtering) on all the traces of the block at once
+                traces[block] = filtfilt(b, a, traces[block], axis=-1)
+            data_in = traces.reshape(data_in.shape)
         return data_in   
 
-    def polyfit_removal(atttributes, data_in):
+    def polyfit_removal(attributes, data_in):
         print('Beginning polynomial fit removal...')
         # polynomial fit and removal
         degree = int(attributes["TIMEDOMAIN.polyfit_order"])
         # Create x values for fitting (scaled to the range [-1, 1])
         xfit = np.linspace(-1, 1, data_in.shape[2])  
-        # Create a placeholder for fitted coefficients (for each fit along the third dimension)
-        coeffs = np.zeros((data_in.shape[0], data_in.shape[1], degree + 1))  
-        mod_poly = np.zeros((data_in.shape[0], data_in.shape[1], len(xfit)))  
-        # Fit a Chebyshev polynomial to each slice along the third dimension
-        for i in range(data_in.shape[0]):
-            for j in range(data_in.shape[1]):
-                # Fit a Chebyshev polynomial of degree `degree` to the data in the third dimension
-                cheb_fit = Chebyshev.fit(xfit, data_in[i, j, :], degree)
-                coeffs[i, j, :] = cheb_fit.coef  # Store the coefficients
-                # Create the Chebyshev object for the current coefficients
-                cheb_poly = Chebyshev(coeffs[i, j, :])        
-                # Evaluate the polynomial at the new points
-                mod_poly[i, j, :] = cheb_poly(xfit)# Initialize an array to store the evaluated values
-        # Subtract polynomial fit from signal          
-        data_pro = data_in - mod_poly
-        return data_pro, mod_poly   
+        # The Chebyshev polynomials evaluated on xfit are shared by all the traces, their columns are scaled to a unit norm as in Chebyshev.fit
+        vander = np.polynomial.chebyshev.chebvander(xfit, degree)
+        scale = np.sqrt(np.sum(vander**2, axis=0))
+        traces = data_in.reshape(-1, data_in.shape[2])
+        mod_poly = np.empty(traces.shape, dtype=data_in.dtype)
+        for block in blocks(traces):
+            # Fit a Chebyshev polynomial of degree `degree` to all the traces of the block with a single least-squares solve
+            coeffs = np.linalg.lstsq(vander / scale, traces[block].T, rcond=None)[0] / scale[:, np.newaxis]
+            # Evaluate the polynomials at the fitted points and subtract them from the signal
+            mod_poly[block] = (vander @ coeffs).T
+            traces[block] -= mod_poly[block]
+        data_pro = traces.reshape(data_in.shape)
+        return data_pro, mod_poly.reshape(data_in.shape)   
 
     def HPfilter(attributes, data_in, dt):
         # Sampling frequency (Hz) from the time vector
@@ -599,9 +603,10 @@ def load_dat_TimeDomain(filepath, parameters = None):
             HP = attributes["TIMEDOMAIN.HPfilter"] * 1e9
             normalized_cutoff = HP / nyquist_freq  
             b, a = butter(butter_order, normalized_cutoff, btype='high')
-            for i in range(data_in.shape[0]):  
-                for j in range(data_in.shape[1]):  
-                    data_in[i, j, :] = filtfilt(b, a, data_in[i, j, :]) 
+            traces = data_in.reshape(-1, data_in.shape[-1])
+            for block in blocks(traces):
+                traces[block] = filtfilt(b, a, traces[block], axis=-1)
+            data_in = traces.reshape(data_in.shape)
         return data_in 
 
     def take_FFT(attributes, data_in, dt):
@@ -613,37 +618,38 @@ def load_dat_TimeDomain(filepath, parameters = None):
         fmax_plot = attributes["TIMEDOMAIN.fmax_plot"] * 1e9
         Nx_steps = attributes["TIMEDOMAIN.Nx_steps"]
         Ny_steps = attributes["TIMEDOMAIN.Ny_steps"]
-        fB_GHz = np.zeros((Nx_steps, Ny_steps))
-        for i in range(data_in.shape[0]):  
-            for j in range(data_in.shape[1]): 
-                signal_now = data_in[i, j, :]
-                fft_out = (2/len(signal_now))*abs(np.fft.fft(signal_now, zp)) # calculate zero-padded and amplitude normalised fft
-                fft_shifted= np.fft.fftshift(fft_out)
-                if i == 0 and j == 0:
-                    freqs = np.fft.fftfreq(len(fft_shifted), d=dt) # calculate the frequency axis information based on the time-step
-                    freqs_shifted = np.fft.fftshift(freqs)
-                    # Below separates frequency spectrum into two arrays:
-                    # - *roi* one with a narrow band where the fB will be searched
-                    # - *plot* one with a wider band that will be used for plotting and main output
-                    roi_idx = np.where((freqs_shifted >= fmin_search) & (freqs_shifted <= fmax_search)) # original spectrum spans +/- 1/dt centred on the rayleigh peak (f=0)
-                    plot_idx = np.where((freqs_shifted >= fmin_plot) & (freqs_shifted <= fmax_plot)) # original spectrum spans +/- 1/dt centred on the rayleigh peak (f=0)
-                    plot_fft = np.zeros((Nx_steps, Ny_steps, np.size(plot_idx)))
-                    freqs_plot_GHz = freqs_shifted[plot_idx] * 1e-9
-                    freqs_roi_GHz = freqs_shifted[roi_idx] * 1e-9
-                data_fft = fft_shifted[roi_idx]
-                plot_fft[i, j, :] = fft_shifted[plot_idx]
-                # below not strictly needed b/c they're calculated in treat() I think
-                max_idx = np.argmax(data_fft) # find frequency of peak with max amplitude
-                # store found Brillouin frequency measurements
-                fB_GHz[i, j] = freqs_roi_GHz[max_idx]
-
-                ## Sal, add timedomain specific fwhm measurements here?
-                #fft_norm = fft_pos/max(fft_pos) # normalise peak amplitude to one
-                #ifwhm = np.where(fft_norm >= 0.5) # rough definition for fwhm
-                #fpeak = freqs_GHz[ifwhm]
-                #fwhm = fpeak[-1] - fpeak[0]  
-
-        return plot_fft, freqs_plot_GHz, fB_GHz
+        freqs = np.fft.fftfreq(zp, d=dt) # calculate the frequency axis information based on the time-step
+        freqs_shifted = np.fft.fftshift(freqs)
+        # Below separates frequency spectrum into two arrays:
+        # - *roi* one with a narrow band where the fB will be searched
+        # - *plot* one with a wider band that will be used for plotting and main output
+        roi_idx = np.where((freqs_shifted >= fmin_search) & (freqs_shifted <= fmax_search))[0] # original spectrum spans +/- 1/dt centred on the rayleigh peak (f=0)
+        plot_idx = np.where((freqs_shifted >= fmin_plot) & (freqs_shifted <= fmax_plot))[0] # original spectrum spans +/- 1/dt centred on the rayleigh peak (f=0)
+        freqs_plot_GHz = freqs_shifted[plot_idx] * 1e-9
+        freqs_roi_GHz = freqs_shifted[roi_idx] * 1e-9
+        # the traces being real, the amplitude at frequency -f is the one at +f: the shifted bins are read on the one-sided spectrum given by rfft
+        rfft_bins = np.abs(np.fft.fftshift(np.fft.fftfreq(zp, d=1/zp))).round().astype(int)
+        traces = data_in.reshape(-1, data_in.shape[2])
+        plot_fft = np.zeros((traces.shape[0], len(plot_idx)))
+        fB_GHz = np.zeros(traces.shape[0])
+        # the zero-padded transforms of a block hold zp points per trace
+        for block in blocks(traces, max(zp, data_in.shape[2])):
+            # calculate zero-padded and amplitude normalised fft of all the traces of the block
+            fft_out = (2/data_in.shape[2])*np.abs(np.fft.rfft(traces[block], zp, axis=-1))
+            plot_fft[block] = fft_out[:, rfft_bins[plot_idx]]
+            # find frequency of peak with max amplitude and store found Brillouin frequency measurements
+            max_idx = np.argmax(fft_out[:, rfft_bins[roi_idx]], axis=-1)
+            fB_GHz[block] = freqs_roi_GHz[max_idx]
+            # free the transforms of the block before the ones of the next block are computed
+            del fft_out
+
+            ## Sal, add timedomain specific fwhm measurements here?
+            #fft_norm = fft_pos/max(fft_pos) # normalise peak amplitude to one
+            #ifwhm = np.where(fft_norm >= 0.5) # rough definition for fwhm
+            #fpeak = freqs_GHz[ifwhm]
+            #fwhm = fpeak[-1] - fpeak[0]  
+
+        return plot_fft.reshape(Nx_steps, Ny_steps, len(plot_idx)), freqs_plot_GHz, fB_GHz.reshape(Nx_steps, Ny_steps)
 
     if parameters is None:
         parameters_list = ["ac_gain", 
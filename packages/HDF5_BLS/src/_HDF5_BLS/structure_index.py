@@ -0,0 +1,240 @@
+import h5py
+
+class StructureIndex:
+    """
+    In-memory index of the structure of an HDF5 file. The index is built in a single pass over the file and stores, for each element, its kind (group or dataset), its Brillouin type, its shape and its dtype, together with the ordered list of children of each group. Queries on the structure are then answered without accessing the file.
+    The index is updated incrementally: the paths modified in the file are marked as stale with the "invalidate" method and only the corresponding subtrees are read again the next time the index is refreshed.
+
+    Attributes
+    ----------
+    elements: dict
+        The description of each element of the file, indexed by its path. Each description is a dictionary with the keys "Kind" ("Group" or "Dataset"), "Brillouin_type" (None if the element has no Brillouin type), "Shape" and "Dtype" (None for groups).
+    children: dict
+        The ordered list of the names of the children of each group, indexed by the path of the group. The root of the file is stored under the empty path "".
+    stale: set
+        The paths of the elements that have been modified since the index was last refreshed.
+    built: bool
+        A flag indicating whether the index has been built.
+    """
+    def __init__(self):
+        self.elements = {}
+        self.children = {}
+        self.stale = set()
+        self.built = False
+
+    def build(self, file):
+        """Builds the index from scratch by visiting all the elements of the file.
+
+        Parameters
+        ----------
+        file : h5py.File
+            The opened file to index.
+        """
+        self.elements = {}
+        self.children = {"": list(file.keys())}
+        file.visititems(lambda name, obj: self._record(name, obj))
+        self.stale = set()
+        self.built = True
+
+    def clear(self):
+        """Empties the index, which will be built again at the next refresh.
+        """
+        self.elements = {}
+        self.children = {}
+        self.stale = set()
+        self.built = False
+
+    def invalidate(self, path):
+        """Marks an element and all its children as modified.
+
+        Parameters
+        ----------
+        path : str
+            The path to the element that is modified.
+        """
+        if self.built:
+            self.stale.add(path.strip("/"))
+
+    def refresh(self, file):
+        """Updates the index by reading again the subtrees that were marked as modified. If the index was not built, it is built.
+
+        Parameters
+        ----------
+        file : h5py.File
+            The opened file to index.
+        """
+        if not self.built:
+            self.build(file)
+            return
+
+        # Process the parents before their children so that a subtree is only read once
+        done = []
+        for path in sorted(self.stale, key = len):
+            # Go up to the first element whose parent is indexed, in case parent groups were created
+            while "/" in path and path.rsplit("/", 1)[0] not in self.elements:
+                path = path.rsplit("/", 1)[0]
+            if any(path == e or path.startswith(e + "/") for e in done):
+                continue
+            done.append(path)
+
+            # Remove the subtree from the index and read it again if it still exists
+            self._remove(path)
+            if path in file:
+                obj = file[path]
+                self._record(path, obj)
+                if isinstance(obj, h5py.Group):
+                    obj.visititems(lambda name, o: self._record(f"{path}/{name}", o))
+
+            # Update the list of children of the parent
+            parent = path.rsplit("/", 1)[0] if "/" in path else ""
+            if parent in self.children:
+                self.children[parent] = list(file[parent].keys()) if parent else list(file.keys())
+        self.stale = set()
+
+    def get(self, path):
+        """Returns the description of an element.
+
+        Parameters
+        ----------
+        path : str
+            The path to the element.
+
+        Returns
+        -------
+        dict
+            The description of the element.
+
+        Raises
+        ------
+        KeyError
+            If the path does not lead to an element of the file.
+        """
+        path = path.strip("/")
+        if path not in self.elements:
+            raise KeyError(f"The path '{path}' does not exist in the file.")
+        return self.elements[path]
+
+    def get_children(self, path, brillouin_type = None):
+        """Returns the names of the children of a group, optionally only the ones with given Brillouin types.
+
+        Parameters
+        ----------
+        path : str
+            The path to the group. If the path leads to a dataset, an empty list is returned.
+        brillouin_type : str or list of str, optional
+            The Brillouin type(s) of the children to return, by default None returns all the children.
+
+        Returns
+        -------
+        list
+            The names of the children.
+        """
+        path = path.strip("/")
+        self.get(path)
+        children = self.children.get(path, [])
+        if brillouin_type is None:
+            return list(children)
+        if isinstance(brillouin_type, str):
+            brillouin_type = [brillouin_type]
+        return [e for e in children if self.elements[f"{path}/{e}"]["Brillouin_type"] in brillouin_type]
+
+    def get_descendants(self, path, brillouin_type = None):
+        """Returns the paths of all the elements located under a given group, in the order of the file, optionally only the ones with given Brillouin types.
+
+        Parameters
+        ----------
+        path : str
+            The path to the group.
+        brillouin_type : str or list of str, optional
+            The Brillouin type(s) of the elements to return, by default None returns all the elements.
+
+        Returns
+        -------
+        list
+            The paths of the elements.
+        """
+        def walk(group):
+            # Go through the children in the order of the file, each group being directly followed by its own children
+            for e in self.children.get(group, []):
+                p = f"{group}/{e}"
+                if brillouin_type is None or self.elements[p]["Brillouin_type"] in brillouin_type:
+                    descendants.append(p)
+                if p in self.children:
+                    walk(p)
+
+        if isinstance(brillouin_type, str):
+            brillouin_type = [brillouin_type]
+
+        path = path.strip("/")
+        self.get(path)
+        descendants = []
+        walk(path)
+        return descendants
+
+    def get_nearest(self, path, brillouin_type):
+        """Returns the path of the element with given Brillouin type that is the closest to a given element. The siblings of the element are looked at first, then the children of the groups above it.
+
+        Parameters
+        ----------
+        path : str
+            The path to the element.
+        brillouin_type : str or list of str
+            The Brillouin type(s) of the element to find.
+
+        Returns
+        -------
+        str or None
+            The path of the closest element, None if no element with the given Brillouin type exists.
+        """
+        path = path.strip("/")
+        self.get(path)
+        while "/" in path:
+            parent = path.rsplit("/", 1)[0]
+            for e in self.get_children(parent, brillouin_type):
+                if f"{parent}/{e}" != path:
+                    return f"{parent}/{e}"
+            path = parent
+        return None
+
+    def get_structure(self, path = ""):
+        """Returns the structure of the file as nested dictionaries with the types of each element in the "Brillouin_type" key. Elements without a Brillouin type are considered as "Root" for groups and "Raw_data" for datasets. The content of "Metadata" groups and elements named "Structure" are not returned.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path to the group from which the structure is returned, by default the root of the file.
+
+        Returns
+        -------
+        dict
+            The structure of the file.
+        """
+        dic = {}
+        for key in self.children.get(path, []):
+            # Skip the structure key
+            if key == "Structure": continue
+            element = self.elements[f"{path}/{key}" if path else key]
+            # If the key has no Brillouin type, we set the default group type to "Root" and dataset type to "Raw_data"
+            brillouin_type = element["Brillouin_type"]
+            if brillouin_type is None:
+                brillouin_type = "Root" if element["Kind"] == "Group" else "Raw_data"
+            dic[key] = {"Brillouin_type": brillouin_type}
+            # If the element is a group, we iterate over it
+            if element["Kind"] == "Group" and brillouin_type != "Metadata":
+                dic[key].update(self.get_structure(f"{path}/{key}" if path else key))
+        return dic
+
+    def _record(self, path, obj):
+        # Store the description of an element, and the list of its children if it is a group
+        brillouin_type = obj.attrs.get("Brillouin_type", None)
+        if isinstance(obj, h5py.Group):
+            self.elements[path] = {"Kind": "Group", "Brillouin_type": brillouin_type, "Shape": None, "Dtype": None}
+            self.children[path] = list(obj.keys())
+        else:
+            self.elements[path] = {"Kind": "Dataset", "Brillouin_type": brillouin_type, "Shape": obj.shape, "Dtype": obj.dtype}
+
+    def _remove(self, path):
+        # Remove an element and all its children from the index
+        for dic in (self.elements, self.children):
+            for key in [k for k in dic.keys() if k == path or k.startswith(path + "/")]:
+                del dic[key]
@@ -0,0 +1,76 @@
+import numpy as np
+
+class TreatmentCheckpoint:
+    """
+    Checkpoint storing the results of a treatment in a "Treatment" group of a wrapper while the treatment is running, so that an interrupted treatment can be resumed where it stopped. The results are stored with the same names as the ones used by Wrapper.add_treated_data, so that they can be viewed before the treatment is over, together with a "Completed" dataset marking the spectra whose results are stored. Checkpoints are created with Wrapper.open_checkpoint and given to the treatment with Treat.silent_set_checkpoint.
+
+    Attributes
+    ----------
+    wrapper: Wrapper
+        The wrapper the group belongs to.
+    path: str
+        The path to the "Treatment" group in the file.
+    block_size: int
+        The number of elements of the first dimension of the map treated between two saves of the results.
+    """
+    # The attributes of the treatment stored in the group, with the name and the Brillouin type of their dataset
+    DATASETS = {"shift": ("Shift", "Shift"),
+                "linewidth": ("Linewidth", "Linewidth"),
+                "amplitude": ("Amplitude", "Amplitude"),
+                "shift_var": ("Shift error", "Shift_err"),
+                "linewidth_var": ("Linewidth error", "Linewidth_err"),
+                "amplitude_var": ("Amplitude error", "Amplitude_err"),
+                "offset": ("Offset", "Other")}
+
+    def __init__(self, wrapper, path, block_size = 1):
+        self.wrapper = wrapper
+        self.path = path
+        self.block_size = block_size
+
+    def load(self):
+        """Returns the results stored in the group.
+
+        Returns
+        -------
+        dict or None
+            The stored arrays, with the names of the attributes of the treatment ("shift", "linewidth", ...) as keys, and the "completed" boolean array marking the spectra whose results are stored. None if no results are stored yet.
+        """
+        with self.wrapper._open('r') as file:
+            group = file[self.path]
+            if "Completed" not in group:
+                return None
+            results = {name: group[dataset_name][()] for name, (dataset_name, _) in self.DATASETS.items() if dataset_name in group}
+            results["completed"] = group["Completed"][()].astype(bool)
+        return results
+
+    def save(self, results, start, end):
+        """Writes the results of the spectra located between two indices of the first dimension of the map, and marks them as completed. The datasets are created when the first results are saved, the results of the spectra not yet treated being NaN.
+
+        Parameters
+        ----------
+        results : dict
+            The arrays of the whole map, with the names of the attributes of the treatment ("shift", "linewidth", ...) as keys, and the "completed" boolean array marking the spectra whose results are stored.
+        start : int
+            The first index of the first dimension of the map to write.
+        end : int
+            The index following the last index of the first dimension of the map to write.
+        """
+        self.wrapper._invalidate_cache(self.path)
+        with self.wrapper._open('a') as file:
+            group = file[self.path]
+            # The completion map is written last so that the spectra are only marked as completed once all their results are written
+            for name, (dataset_name, brillouin_type) in list(self.DATASETS.items()) + [("completed", ("Completed", "Other"))]:
+                data = np.asarray(results[name])
+
+                # Create the dataset with the shape of the whole map, following the storage policy of its Brillouin type
+                if dataset_name not in group:
+                    options = self.wrapper._get_storage_options(data.shape, data.dtype, brillouin_type)
+                    fillvalue = False if data.dtype == bool else np.nan
+                    dataset = group.create_dataset(dataset_name, shape = data.shape, dtype = data.dtype, fillvalue = fillvalue, **options)
+                    dataset.attrs["Brillouin_type"] = brillouin_type
+
+                group[dataset_name][start:end] = data[start:end]
+            self.wrapper._record_storage_policy(file)
+
+            # Make sure the results are written on the disk even if the file is kept open by a session
+            file.flush()
@@ -6,12 +6,20 @@ import json
 import csv
 import os
 import shutil
+import copy
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from types import MappingProxyType
 import pandas as pd
 import matplotlib.pyplot as plt
 
 from .brimfile_converter.brim_converter import BrimConverter
 
 from .load_data import load_general
+from .structure_index import StructureIndex
+from .dataset_view import DatasetView
+from .dataset_stream import DatasetStream
+from .treatment_checkpoint import TreatmentCheckpoint
 from .wrapper_compatibility import brillouin_type_update
 from .errors import WrapperError, WrapperError_FileNotFound, WrapperError_StructureError, WrapperError_Overwrite, WrapperError_ArgumentType, WrapperError_Save
 
@@ -58,6 +66,24 @@ class Wrapper:
     
     BRILLOUIN_TYPES_GROUPS = ["Calibration_spectrum", "Impulse_response", "Measure", "Root", "Treatment"]
 
+    # Storage of the datasets in the file depending on their Brillouin type. "Chunks" is either "Spectrum" (chunks of a few spectra along the last axis), "Tile" (2D tiles on the last two axes) or None (contiguous storage), "Compression" is either "gzip", "lzf" or None.
+    STORAGE_POLICY_SPECTRA = {"Chunks": "Spectrum", "Spectra_per_chunk": 8, "Compression": "gzip", "Compression_opts": 4, "Shuffle": True}
+    STORAGE_POLICY_MAPS = {"Chunks": "Tile", "Tile_size": 64, "Compression": "gzip", "Compression_opts": 4, "Shuffle": True}
+    STORAGE_POLICY = {"Frequency": STORAGE_POLICY_SPECTRA,
+                      "PSD": STORAGE_POLICY_SPECTRA,
+                      "Raw_data": STORAGE_POLICY_SPECTRA,
+                      "Amplitude": STORAGE_POLICY_MAPS,
+                      "Amplitude_err": STORAGE_POLICY_MAPS,
+                      "BLT": STORAGE_POLICY_MAPS,
+                      "BLT_err": STORAGE_POLICY_MAPS,
+                      "Linewidth": STORAGE_POLICY_MAPS,
+                      "Linewidth_err": STORAGE_POLICY_MAPS,
+                      "Shift": STORAGE_POLICY_MAPS,
+                      "Shift_err": STORAGE_POLICY_MAPS}
+
+    # Attributes of the root group describing how the file is stored, which are not properties of the data and are therefore not inherited by the elements of the file
+    FILE_ATTRIBUTES = ["HDF5_BLS_storage_policy"]
+
     ##########################
     #     Magic methods      #
     ##########################
@@ -109,6 +135,16 @@ class Wrapper:
                 group.attrs["HDF5_BLS_version"] = HDF5_BLS_Version
             return filepath
 
+        # Initializes the handle shared by all the methods when a session is open
+        self._session_file = None
+        # Initializes the storage policy of the datasets
+        self.storage_policy = copy.deepcopy(self.STORAGE_POLICY)
+        # Initializes the cache of the attributes inherited by each element and the signature of the file it refers to
+        self._attributes_cache = {}
+        self._cache_signature = None
+        # Initializes the in-memory index of the structure of the file
+        self._structure_index = StructureIndex()
+
         # If no file are given, create a temporary HDF5 file with a single group "Brillouin"
         if filepath is None:
             self.filepath = no_filepath()
@@ -135,28 +171,39 @@ class Wrapper:
 
         Returns
         -------
-        numpy array or closed h5py.Group
-            The data or group corresponding to the path
+        DatasetView or closed h5py.Group
+            A lazy view on the data or the group corresponding to the path. The view is reshaped following the "MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()" attribute, and data is only read from the file when the view is sliced or converted to a numpy array with np.asarray.
 
         Raises
         ------
         WrapperError_StructureError
             If the path does not lead to an element.    
+
+        Example
+        -------
+        >>> wrp["Brillouin/Measure/PSD"][10, 20] # Reads only the spectrum at position (10, 20)
+        >>> np.asarray(wrp["Brillouin/Measure/PSD"]) # Reads the whole dataset
         """
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if key not in file:
                 raise WrapperError_StructureError(f"The path '{key}' does not exist in the file.")
             item = file[key]
-            if isinstance(item, h5py.Dataset):
-                data = item[()]
-                try:
-                    shape = self.get_attributes(path=key)["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"]
-                    shape = [int(i) for i in shape.split(",")] + [-1]
-                    return data.reshape(shape)
-                except:
-                    # It would be better to return a new wrapper with only the selected group. But in this case we need to make sure that we will not overwrite temp.h5 by mistake.
-                    return data
-            return item
+            if not isinstance(item, h5py.Dataset):
+                return item
+            stored_shape, dtype = item.shape, item.dtype
+        
+        # Reshape the data virtually following the sampling matrix, if it is given and compatible with the data
+        view = DatasetView(self, key, stored_shape, dtype)
+        try:
+            shape = self.get_attributes(path=key)["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"]
+            shape = [int(i) for i in shape.split(",")]
+            size = int(np.prod(stored_shape))
+            if size % int(np.prod(shape)) == 0:
+                view.shape = tuple(shape + [size // int(np.prod(shape))])
+        except:
+            # It would be better to return a new wrapper with only the selected group. But in this case we need to make sure that we will not overwrite temp.h5 by mistake.
+            pass
+        return view
         
     def __add__(self, other): # Test made 16.09.25
         """Magic method to add two wrappers together
@@ -190,9 +237,9 @@ class Wrapper:
             raise WrapperError_FileNotFound("Please use wrappers that are not temporary and are saved on the disk.")
 
         # Checking the versions of the two files
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             version_self = file["Brillouin"].attrs["HDF5_BLS_version"]
-        with h5py.File(other.filepath, 'r') as file:
+        with other._open('r') as file:
             version_other = file["Brillouin"].attrs["HDF5_BLS_version"]
         if version_self != version_other:
             raise WrapperError_StructureError("The two files have different versions of the HDF5_BLS package.")
@@ -230,22 +277,23 @@ class Wrapper:
         # try:
         # Combining the wrappers
         keys1, keys2 = [], []  
-        with h5py.File(new_wrapper.filepath, 'a') as new_file:
+        new_wrapper._invalidate_cache("Brillouin")
+        with new_wrapper._open('a') as new_file:
             group = new_file["Brillouin"]
-            with h5py.File(other.filepath, 'r') as file:
+            with other._open('r') as file:
                 for key in file["Brillouin"].keys():
                     if isinstance(file[f"Brillouin/{key}"], h5py.Group):
                         new_file.copy(file[f"Brillouin/{key}"], group, key)
                         keys2.append(key)
                     else:
-                        group.create_dataset(key, data=file[f"Brillouin/{key}"])
-            with h5py.File(self.filepath, 'r') as file:
+                        new_wrapper._create_dataset(group, key, file[f"Brillouin/{key}"], file[f"Brillouin/{key}"].attrs.get("Brillouin_type", None))
+            with self._open('r') as file:
                 for key in file["Brillouin"].keys():
                     if isinstance(file[f"Brillouin/{key}"], h5py.Group):
                         new_file.copy(file[f"Brillouin/{key}"], group, key)
                         keys1.append(key)
                     else:
-                        group.create_dataset(key, data=file[f"Brillouin/{key}"])
+                        new_wrapper._create_dataset(group, key, file[f"Brillouin/{key}"], file[f"Brillouin/{key}"].attrs.get("Brillouin_type", None))
 
         # Adding common attributes to root              
         new_wrapper.add_attributes(attributes=attr_combine, parent_group="Brillouin", overwrite=True)
@@ -286,6 +334,193 @@ class Wrapper:
         lines = build_structure(structure)
         return "\n".join(lines)
         
+    ##########################
+    #    Private methods     # 
+    ##########################
+
+    @contextmanager
+    def _open(self, mode = 'r'):
+        """Opens the HDF5 file of the wrapper. If a session is open, its handle is returned instead of opening the file again.
+
+        Parameters
+        ----------
+        mode : str, optional
+            The mode used to open the file if no session is open, by default 'r'.
+
+        Yields
+        ------
+        h5py.File
+            The opened file.
+
+        Raises
+        ------
+        WrapperError
+            Raises an error if the file needs to be modified while the session is read-only.
+        """
+        # Reuse the handle of the session if any
+        if self._session_file is not None:
+            if mode != 'r' and self._session_file.mode == 'r':
+                raise WrapperError(f"The file '{self.filepath}' is opened in a read-only session and cannot be modified.")
+            yield self._session_file
+            return
+        
+        # Otherwise open the file for the duration of the call
+        if mode != 'r':
+            self._check_cache()
+        try:
+            with h5py.File(self.filepath, mode) as file:
+                yield file
+        finally:
+            # Keep track of the state of the file after our own modifications
+            if mode != 'r':
+                self._cache_signature = self._file_signature()
+
+    def _check_cache(self):
+        """Empties the caches if the file was modified outside of the wrapper since they were built. The modification is detected from the modification time and the size of the file. This check is not performed inside a session as the file is then kept open by the wrapper.
+        """
+        if self._session_file is not None:
+            return
+        signature = self._file_signature()
+        if signature != self._cache_signature:
+            self._attributes_cache.clear()
+            self._structure_index.clear()
+            self._cache_signature = signature
+
+    def _create_dataset(self, group, name, data, brillouin_type = None):
+        """Creates a dataset following the storage policy associated to its Brillouin type, and records the storage policy in the attributes of the file.
+
+        Parameters
+        ----------
+        group : h5py.Group
+            The group where to create the dataset.
+        name : str
+            The name of the dataset.
+        data : array-like
+            The data to store.
+        brillouin_type : str, optional
+            The Brillouin type of the dataset, by default None. If given, it is also stored as the "Brillouin_type" attribute of the dataset.
+
+        Returns
+        -------
+        h5py.Dataset
+            The created dataset.
+        """
+        if not hasattr(data, "dtype"):
+            data = np.array(data)
+        dataset = group.create_dataset(name, data=data, **self._get_storage_options(data.shape, data.dtype, brillouin_type))
+        if brillouin_type is not None:
+            dataset.attrs["Brillouin_type"] = brillouin_type
+
+        self._record_storage_policy(group.file)
+        return dataset
+
+    def _get_storage_options(self, shape, dtype, brillouin_type):
+        """Returns the arguments to give to h5py to create a dataset following the storage policy associated to its Brillouin type.
+
+        Parameters
+        ----------
+        shape : tuple
+            The shape of the dataset.
+        dtype : numpy.dtype
+            The type of the data.
+        brillouin_type : str
+            The Brillouin type of the dataset.
+
+        Returns
+        -------
+        dict
+            The keyword arguments of h5py.Group.create_dataset.
+        """
+        policy = self.storage_policy.get(brillouin_type, None)
+        # Scalars, empty arrays and non-numerical data are stored as such
+        if policy is None or len(shape) == 0 or 0 in shape:
+            return {}
+        if not (np.issubdtype(dtype, np.number) or np.issubdtype(dtype, np.bool_)):
+            return {}
+        
+        options = {}
+        # Chunks of a few spectra along the last axis
+        if policy.get("Chunks", None) == "Spectrum":
+            if len(shape) == 1:
+                options["chunks"] = tuple(shape)
+            else:
+                options["chunks"] = (1,) * (len(shape) - 2) + (min(shape[-2], policy.get("Spectra_per_chunk", 1)), shape[-1])
+        # 2D tiles on the last two axes
+        elif policy.get("Chunks", None) == "Tile":
+            size = policy.get("Tile_size", 64)
+            if len(shape) == 1:
+                options["chunks"] = (min(shape[0], size * size),)
+            else:
+                options["chunks"] = (1,) * (len(shape) - 2) + (min(shape[-2], size), min(shape[-1], size))
+        
+        # Compression of the chunks
+        if policy.get("Compression", None) is not None:
+            options["compression"] = policy["Compression"]
+            if policy["Compression"] == "gzip":
+                options["compression_opts"] = policy.get("Compression_opts", 4)
+            options["shuffle"] = policy.get("Shuffle", False)
+        return options
+
+    def _file_signature(self):
+        """Returns a signature of the file on the disk used to detect modifications made outside of the wrapper.
+
+        Returns
+        -------
+        tuple or None
+            The modification time in nanoseconds and the size of the file, None if the file does not exist.
+        """
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _get_index(self):
+        """Returns the index of the structure of the file, after updating the elements that were modified since its last use.
+
+        Returns
+        -------
+        StructureIndex
+            The up-to-date index of the structure of the file.
+        """
+        self._check_cache()
+        if not self._structure_index.built or self._structure_index.stale:
+            with self._open('r') as file:
+                self._structure_index.refresh(file)
+        return self._structure_index
+
+    def _invalidate_cache(self, path = None):
+        """Removes the cached attributes of an element and of all its children, and marks them as modified in the structure index. This function has to be called by every method modifying attributes or elements in the file.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path to the element that is modified, by default None empties the whole cache.
+        """
+        if path is None:
+            self._attributes_cache.clear()
+            self._structure_index.clear()
+            return
+        
+        path = path.strip("/")
+        self._structure_index.invalidate(path)
+        for key in list(self._attributes_cache.keys()):
+            if key == path or key.startswith(path + "/"):
+                del self._attributes_cache[key]
+
+    def _record_storage_policy(self, file):
+        """Records the storage policy in the "HDF5_BLS_storage_policy" attribute of the root group of a file, if it is not already the case.
+
+        Parameters
+        ----------
+        file : h5py.File
+            The opened file.
+        """
+        policy = json.dumps(self.storage_policy, sort_keys = True)
+        if "Brillouin" in file and file["Brillouin"].attrs.get("HDF5_BLS_storage_policy", None) != policy:
+            self._invalidate_cache("Brillouin")
+            file["Brillouin"].attrs["HDF5_BLS_storage_policy"] = policy
+
     ##########################
     #     Main methods       # 
     ##########################
@@ -329,7 +564,7 @@ class Wrapper:
         name = os.path.basename(filepath).split(".")[0]
 
         # Checks if the "parent_group" path exists in the file and if not choose the first parent group.
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             # Check if the parent group exists
             if parent_group not in file:
                 file.create_group(parent_group)
@@ -338,7 +573,8 @@ class Wrapper:
                 parent_group = "/".join(parent_group.split("/")[:-1])
                     
         # Checks if the name of the HDF5 file we want to add is not already in the selected group. If so, check if overwrite is set to True. If so, overwrite. 
-        with h5py.File(self.filepath, 'a') as file:
+        self._invalidate_cache(f"{parent_group}/{name}")
+        with self._open('a') as file:
             group = file[parent_group]
             if name in file[parent_group].keys() and overwrite:
                 self.delete_element(path = f"{parent_group}/{name}")
@@ -355,13 +591,14 @@ class Wrapper:
                 with h5py.File(filepath, 'r') as file_copy:
                     # Try copying all the attributes of the HDF5 file to add to the group.
                     for key, value in file_copy["Brillouin"].attrs.items():
-                        new_group.attrs[key] = value
+                        if key not in self.FILE_ATTRIBUTES:
+                            new_group.attrs[key] = value
 
                     for key in file_copy["Brillouin"].keys():
                         if isinstance(file_copy[f"Brillouin/{key}"], h5py.Group):
                             file.copy(file_copy[f"Brillouin/{key}"], new_group, key)
                         else:
-                            new_group.create_dataset(key, data=file_copy[f"Brillouin/{key}"])
+                            self._create_dataset(new_group, key, file_copy[f"Brillouin/{key}"], file_copy[f"Brillouin/{key}"].attrs.get("Brillouin_type", None))
             except Exception as e:
                 raise WrapperError(f"A problem occured when adding the data to the file '{self.filepath}'. Error message: {e}")
 
@@ -411,7 +648,7 @@ class Wrapper:
             if parent_group == name_group:
                 only_parent = True
 
-            with h5py.File(self.filepath, 'r') as file:
+            with self._open('r') as file:
                 # Check if the parent group exists
                 if parent_group not in file:
                     raise WrapperError_StructureError(f"The parent group '{parent_group}' does not exist in the file.")
@@ -421,7 +658,7 @@ class Wrapper:
 
         # If the name is not specified, we set it by default to the "Data_i"
         if name_group is None: 
-            with h5py.File(self.filepath, 'a') as file:
+            with self._open('a') as file:
                 group = file[parent_group]
                 i = 0
                 while f"Data_{i}" in group.keys(): i+=1
@@ -431,7 +668,7 @@ class Wrapper:
             pass
         # If the name is specified, we check if it already exists
         else:
-            with h5py.File(self.filepath, 'a') as file:
+            with self._open('a') as file:
                 group = file[parent_group]
                 if name_group in group.keys():
                     for key in dic.keys():
@@ -452,7 +689,8 @@ class Wrapper:
                     self.create_group(name_group, parent_group=parent_group, brillouin_type = "Measure")
 
         # Adding the data and the abscissa to the wrapper
-        with h5py.File(self.filepath, 'a') as file:
+        self._invalidate_cache(parent_group if only_parent else f"{parent_group}/{name_group}")
+        with self._open('a') as file:
             if only_parent: 
                 new_group = file[parent_group]
             else:
@@ -465,14 +703,12 @@ class Wrapper:
                         raise WrapperError_ArgumentType("The abscissa should be a dictionnary with the keys 'Name', 'Data', 'Unit', 'Dim_start' and 'Dim_end'.")
                     
                     name_dataset = value["Name"]
-                    dataset = new_group.create_dataset(name_dataset, data=np.array(value["Data"]))
-                    dataset.attrs["Brillouin_type"] = "Abscissa_" + str(value["Dim_start"]) + "_" + str(value["Dim_end"])
+                    dataset = self._create_dataset(new_group, name_dataset, np.array(value["Data"]), "Abscissa_" + str(value["Dim_start"]) + "_" + str(value["Dim_end"]))
                     dataset.attrs["Unit"] = value["Unit"]
                 elif type(value) is dict and key in self.BRILLOUIN_TYPES_DATASETS:
                     name_dataset = value["Name"]
                     value = np.array(value["Data"])
-                    dataset = new_group.create_dataset(name_dataset, data=np.array(value))
-                    dataset.attrs["Brillouin_type"] = key
+                    dataset = self._create_dataset(new_group, name_dataset, value, key)
                 elif key == "Attributes":
                     for k, v in value.items():
                         try:
@@ -526,12 +762,13 @@ class Wrapper:
         >>> wrp.add_dictionary(dic, parent_group = "Brillouin/Group", create_group = True, brillouin_type_parent_group = "Measure") # Adds the PSD and Frequency arrays to "Brillouin/Group".
         """
         def check_parent_group(parent_group):
-            with h5py.File(self.filepath, 'a') as file:
+            with self._open('a') as file:
                 # Check if parent group is in the file
                 if parent_group not in file:
                     # if not but "create_group" is True, create the group with the given Brillouin_type
                     if create_group:
                         if not type(brillouin_type_parent_group) is None and brillouin_type_parent_group in self.BRILLOUIN_TYPES_GROUPS:
+                            self._invalidate_cache(parent_group)
                             group = file.create_group(parent_group)
                             group.attrs["Brillouin_type"] = brillouin_type_parent_group
                         else:
@@ -548,7 +785,7 @@ class Wrapper:
 
         def retrieve_brillouin_type(brillouin_type):
             # Retrieve existing Brillouin type is none was provided
-            with h5py.File(self.filepath, 'r') as file:
+            with self._open('r') as file:
                 group = file[parent_group]
                 brillouin_type = group.attrs["Brillouin_type"]
 
@@ -578,7 +815,7 @@ class Wrapper:
                     assert (l == ["Data","Name"]), WrapperError_ArgumentType(f"The key '{k}' does not have the correct format. It should be a dictionary with the following keys: 'Data', 'Name'.")
 
         def check_raw_data():
-            with h5py.File(self.filepath, 'a') as file:
+            with self._open('a') as file:
                 group = file[parent_group]
                 for elt in group:
                     elt = group[elt]
@@ -591,7 +828,7 @@ class Wrapper:
 
         def check_name():
             delete_keys = []
-            with h5py.File(self.filepath, 'r') as file:
+            with self._open('r') as file:
                 group = file[parent_group]
                 for key in dic.keys():
                     if "Attribute" not in key and dic[key]["Name"] in group.keys():
@@ -618,7 +855,8 @@ class Wrapper:
         check_name()
 
         # Add the data and the attributes to the file
-        with h5py.File(self.filepath, 'a') as file:
+        self._invalidate_cache(parent_group)
+        with self._open('a') as file:
             group = file[parent_group]
             # Go through the dictionary
             for key, value in dic.items():
@@ -635,14 +873,15 @@ class Wrapper:
                                 raise WrapperError_StructureError(f"The brillouin_type '{brillouin_type_parent_group}' should be 'Calibration_spectrum', 'Impulse_response' or 'Measure' if you want to add a dataset with type '{key}'.")
                             else:
                                 self.change_brillouin_type(path = f"{parent_group}", brillouin_type = "Measure")
+                                # Changing the type refreshes the index, the group is marked as modified again for the datasets created next
+                                self._invalidate_cache(parent_group)
                     # If everything is OK, create the dataset with the right Brillouin type
                     if value["Name"] in group.keys():
                         if overwrite:
                             self.delete_element(path = f"{parent_group}/{value['Name']}", file = file)
                         else:
                             raise WrapperError_Overwrite(f"The dataset '{value['Name']}' already exists in the group '{parent_group}'.")
-                    dataset = group.create_dataset(value["Name"], data=value["Data"])
-                    dataset.attrs["Brillouin_type"] = key
+                    dataset = self._create_dataset(group, value["Name"], value["Data"], key)
                 # If the key is an attribute type
                 elif "Attribute" in key:
                     # Go through the attributes
@@ -657,8 +896,7 @@ class Wrapper:
                 # If the key is an abscissa type
                 elif key.split("_")[0] == "Abscissa":
                     # Create the dataset and give it the right Brillouin type
-                    dataset = group.create_dataset(value["Name"], data=value["Data"])
-                    dataset.attrs["Brillouin_type"] = f"Abscissa_{value['Dim_start']}_{value['Dim_end']}"
+                    dataset = self._create_dataset(group, value["Name"], value["Data"], f"Abscissa_{value['Dim_start']}_{value['Dim_end']}")
                     # Add the units as attribute
                     if "Units" in value.keys():
                         dataset.attrs["Units"] = value["Units"]
@@ -688,7 +926,7 @@ class Wrapper:
         """
         def check_path():
             # Check if the path is a valid path
-            with h5py.File(self.filepath, 'r') as file:
+            with self._open('r') as file:
                 if path not in file:
                     raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
         
@@ -703,7 +941,8 @@ class Wrapper:
                 raise WrapperError_ArgumentType(f"The brillouin type '{brillouin_type}' is not valid.")
         
         # Change the brillouin type
-        with h5py.File(self.filepath, 'a') as file:
+        self._invalidate_cache(path)
+        with self._open('a') as file:
             file[path].attrs["Brillouin_type"] = brillouin_type
 
     def change_name(self, path, name): # Test made 16.09.25
@@ -725,11 +964,12 @@ class Wrapper:
         if name == path.split("/")[-1]:
             return
         
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             # Check if the path is a valid path
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
             new_path = "/".join(path.split("/")[:-1])+"/"+name
+            self._invalidate_cache(new_path)
             file[new_path] = file[path]
             self.delete_element(path)   
 
@@ -741,6 +981,10 @@ class Wrapper:
         delete_temp_file : bool, optional
             If True, the temporary file is deleted, by default False
         """
+        # The file cannot be removed or repacked while a session keeps it open
+        if self._session_file is not None:
+            raise WrapperError(f"The wrapper cannot be closed while a session is open on '{self.filepath}'.")
+
         # If the save flag is raised
         if self.save:
             # If delete_temp_file is set to True and the file is temporary, the user wants to delete the temporary file without saving
@@ -773,8 +1017,9 @@ class Wrapper:
                 raise WrapperError_ArgumentType(f"The datasets '{dataset}' are not datasets.")
 
         # Check if the name is not already in use
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             if parent_group not in file:
+                self._invalidate_cache(parent_group)
                 file.create_group(parent_group)
                 file[parent_group].attrs["Brillouin_type"] = "Measure"
         if name in self.get_children_elements(path = parent_group):
@@ -791,7 +1036,7 @@ class Wrapper:
     
         # Create the new dataset
         tpe = self.get_type(path = datasets[0], return_Brillouin_type = True)
-        new_dataset = [self[dataset][()] for dataset in datasets]
+        new_dataset = [np.asarray(self[dataset]) for dataset in datasets]
         new_dataset = np.array(new_dataset)
         dic = {tpe: {"Name": name,
                      "Data": new_dataset}}
@@ -802,7 +1047,8 @@ class Wrapper:
         """
         Applies changes from previous versions of the wrapper to newest versions using the compat module.
         """
-        with h5py.File(self.filepath, "a") as f:
+        self._invalidate_cache()
+        with self._open("a") as f:
             # Update the Brillouin_type attribute
             f.visititems(brillouin_type_update)
 
@@ -824,16 +1070,17 @@ class Wrapper:
         None
         """
         # Checks that both the path to the dataset and the path to the group where to place the dataset are in the file
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
             if copy_path not in file:
                 raise WrapperError_StructureError(f"The path '{copy_path}' does not exist in the file.")
         
         # Copies the dataset to the desired location
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             new_name = file[path].name.split("/")[-1]
-            file[copy_path].create_dataset(name = new_name, data = file[path][()])
+            self._invalidate_cache(f"{copy_path}/{new_name}")
+            self._create_dataset(file[copy_path], new_name, file[path][()], file[path].attrs.get("Brillouin_type", None))
             for e in file[path].attrs.keys():
                 file[copy_path+"/"+new_name].attrs[e] = file[path].attrs[e]
 
@@ -860,7 +1107,8 @@ class Wrapper:
         if parent_group is None: 
             parent_group = "Brillouin"
 
-        with h5py.File(self.filepath, 'a') as file:
+        self._invalidate_cache(f"{parent_group}/{name}")
+        with self._open('a') as file:
             # Check if the parent group exists
             if parent_group not in file:
                 raise WrapperError_StructureError(f"The parent group '{parent_group}' does not exist in the HDF5 file.")
@@ -897,9 +1145,10 @@ class Wrapper:
         """
         # If the path is not specified, we delete every element of the file and then create a new root Brillouin group.
         if path is None: 
+            self._invalidate_cache()
             paths = []
             if file is None:
-                with h5py.File(self.filepath, 'r') as file:
+                with self._open('r') as file:
                     for key in file["Brillouin"].keys():
                         paths.append(key)
             else:
@@ -909,7 +1158,7 @@ class Wrapper:
                 if file is None: self.delete_element(f"Brillouin/{path}")
                 else: self.delete_element(f"Brillouin/{path}", file)
             if file is None:
-                with h5py.File(self.filepath, 'a') as file:
+                with self._open('a') as file:
                     group = file["Brillouin"]
                     for attr in list(group.attrs.keys()):
                         del group.attrs[attr]
@@ -924,8 +1173,9 @@ class Wrapper:
             return
 
         # Check if the path leads to an element
+        self._invalidate_cache(path)
         if file is None:
-            with h5py.File(self.filepath, 'a') as file:
+            with self._open('a') as file:
                 if path not in file:
                     raise WrapperError_StructureError(f"The path '{path}' does not lead to an element.")
                 # If the path leads to an element, we delete it
@@ -978,7 +1228,7 @@ class Wrapper:
         assert export_type in [".npy", ".csv", ".xlsx"], WrapperError_ArgumentType(f"The export type '{export_type}' is not supported. Supported types are: '.npy', '.csv', '.xlsx'.")
 
         # Extract the dataset from the file
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             assert path in file, WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
             assert isinstance(file[path], HDF5_dataset), WrapperError_ArgumentType(f"The path '{path}' does not lead to a dataset.")
             dataset = file[path][()]
@@ -1022,7 +1272,7 @@ class Wrapper:
             filepath += ".h5"
         
         # Ensure the path is a valid path
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
 
@@ -1048,7 +1298,7 @@ class Wrapper:
             else:
                 raise WrapperError_Overwrite(f"File at path: {filepath} already exists. Set overwrite to True to overwrite.")
 
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             with h5py.File(filepath, 'w') as new_file:
                 group = new_file.require_group("Brillouin")
                 group.attrs["Brillouin_type"] = "Root"
@@ -1084,7 +1334,7 @@ class Wrapper:
         -------
         None
         """
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             data = file[path][()]
 
             # Reshape the element to avoid singleton dimensions
@@ -1128,7 +1378,7 @@ class Wrapper:
                     plt.savefig(filepath)
 
     def get_attributes(self, path=None): # Test made 18.09.25
-        """Returns the attributes associated to a given path. The attributes are retireved hierarchically, meaning that the attributes of all the groups above the given path are also retrieved, and their value is only changed if they are redefined at a lower level.
+        """Returns the attributes associated to a given path. The attributes are retireved hierarchically, meaning that the attributes of all the groups above the given path are also retrieved, and their value is only changed if they are redefined at a lower level. The attributes describing how the file is stored (FILE_ATTRIBUTES) are not returned.
 
         Parameters
         ----------
@@ -1137,30 +1387,41 @@ class Wrapper:
 
         Returns
         -------
-        attr : dict
-            The attributes of the data
+        attr : mappingproxy
+            A read-only view on the attributes of the data. The merged attributes of every element are cached so that successive calls do not read the file again, as long as the file is not modified.
         """
+        def merge_attributes(file, path_temp):
+            # Return the cached attributes of the element if they exist
+            if path_temp in self._attributes_cache:
+                return self._attributes_cache[path_temp]
+            
+            # Otherwise, start from the merged attributes of the parent and update them with the attributes of the element
+            attr = {}
+            if "/" in path_temp:
+                attr.update(merge_attributes(file, path_temp.rsplit("/", 1)[0]))
+            for e, v in file[path_temp].attrs.items():
+                if e not in self.FILE_ATTRIBUTES:
+                    attr[e] = v
+            
+            self._attributes_cache[path_temp] = MappingProxyType(attr)
+            return self._attributes_cache[path_temp]
+
         # If the path is not specified, we set it to the root of the file
         if path is None: path = "Brillouin"
+        path = path.strip("/")
 
-        # We retrieve the paths of the attributes and store them in a list
-        attr = {}
+        # Empty the cache if the file was modified outside of the wrapper
+        self._check_cache()
+        if path in self._attributes_cache:
+            return self._attributes_cache[path]
 
         # We start by opening the file and going through the given path
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             # If the element of the path does not exist, we raise an error
             if not path in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the HDF5 file.")
         
-            path = path.split("/")
-            path_temp = path.pop(0)
-            for e in file[path_temp].attrs.keys(): 
-                attr[e] = file[path_temp].attrs[e]
-            for e in path:
-                path_temp += "/" + e
-                for e in file[path_temp].attrs.keys(): 
-                    attr[e] = file[path_temp].attrs[e]
-        return attr
+            return merge_attributes(file, path)
 
     def get_children_elements(self, path=None, Brillouin_type = None): # Test made 18.09.25
         """Returns the children elements of a given path. If Brillouin_type is specified, only the children elements with the given Brillouin_type are returned.
@@ -1169,7 +1430,7 @@ class Wrapper:
         ----------
         path : str, optional
             The path to the element, by default None which means the root of the file ("Brillouin" group)
-        Brillouin_type : str, optional
+        Brillouin_type : str or list of str, optional
             The type of the element, by default None which means all the elements are returned
 
         Returns
@@ -1179,15 +1440,51 @@ class Wrapper:
         """
         if path is None: path = "Brillouin"
 
-        with h5py.File(self.filepath, 'r') as file:
-            if isinstance(file[path], HDF5_group):
-                children = list(file[path].keys())
-            else:
-                children = []
-        if Brillouin_type is None:
-            return list(children)
-        else:
-            return [e for e in children if self.get_type(path=f"{path}/{e}", return_Brillouin_type=True) == Brillouin_type]
+        return self._get_index().get_children(path, Brillouin_type)
+
+    def get_descendants(self, path = None, Brillouin_type = None):
+        """Returns the paths of all the elements located under a given group, in the order of the file. If Brillouin_type is specified, only the elements with the given Brillouin_type are returned.
+
+        Parameters
+        ----------
+        path : str, optional
+            The path to the group, by default None which means the root of the file ("Brillouin" group)
+        Brillouin_type : str or list of str, optional
+            The type of the elements, by default None which means all the elements are returned
+
+        Returns
+        -------
+        list
+            The list of the paths of the elements
+        
+        Example
+        -------
+        >>> wrp.get_descendants("Brillouin/Measure", Brillouin_type = "PSD") # Returns the paths to all the PSD datasets located under the "Brillouin/Measure" group
+        """
+        if path is None: path = "Brillouin"
+
+        return self._get_index().get_descendants(path, Brillouin_type)
+
+    def get_nearest(self, path, Brillouin_type):
+        """Returns the path of the element of given Brillouin_type that is the closest to a given element. The siblings of the element are looked at first, then the elements of the groups above it.
+
+        Parameters
+        ----------
+        path : str
+            The path to the element
+        Brillouin_type : str or list of str
+            The type of the element to find
+
+        Returns
+        -------
+        str or None
+            The path of the closest element, None if no element of the given type was found
+        
+        Example
+        -------
+        >>> wrp.get_nearest("Brillouin/Measure/PSD", Brillouin_type = "Frequency") # Returns the path to the frequency array associated to the PSD
+        """
+        return self._get_index().get_nearest(path, Brillouin_type)
 
     def get_special_groups_hierarchy(self, path = None, brillouin_type = None): # Test made 18.09.25
         """
@@ -1208,7 +1505,7 @@ class Wrapper:
         if path is None: path = "Brillouin"
         if brillouin_type is None: brillouin_type = "Root"
 
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
 
@@ -1247,30 +1544,15 @@ class Wrapper:
         """
         if filepath is None: filepath = self.filepath
 
-        def iteration(file):
-            dic = {}
-            for key in file.keys():
-                # Skip the structure key
-                if key == "Structure": continue
-                try:
-                    # If the key has the attribute "Brillouin_type", we add it to the dictionary
-                    dic[key] = {"Brillouin_type": file[key].attrs["Brillouin_type"]}
-                except:
-                    # If the key does not have the attribute "Brillouin_type", we set the default group type to "Root" and dataset type to "Raw_data"
-                    if isinstance(file[key], h5py.Group):
-                        dic[key] = {"Brillouin_type": "Root"}
-                    else:
-                        dic[key] = {"Brillouin_type": "Raw_data"}
-                # If the element is a group, we iterate over it
-                if isinstance(file[key], h5py.Group):
-                    if file[key].attrs["Brillouin_type"] != "Metadata":
-                        temp = iteration(file[key])
-                        if temp: dic[key].update(temp)
-            else: return dic
-
+        # The structure of the file of the wrapper is taken from its index
+        if filepath == self.filepath:
+            return self._get_index().get_structure()
+        
+        # The structure of any other file is read from a dedicated index
+        index = StructureIndex()
         with h5py.File(filepath, 'r') as file:
-            structure = iteration(file)
-            return structure
+            index.build(file)
+        return index.get_structure()
 
     def get_type(self, path=None, return_Brillouin_type = False): # Test made 18.09.25
         """Returns the type of the element
@@ -1288,11 +1570,125 @@ class Wrapper:
         if path is None:
             path = "Brillouin"
 
-        with h5py.File(self.filepath, 'r') as file:
-            if return_Brillouin_type:
-                return file[path].attrs["Brillouin_type"]
+        element = self._get_index().get(path)
+        if return_Brillouin_type:
+            if element["Brillouin_type"] is None:
+                raise KeyError(f"The element '{path}' has no Brillouin type.")
+            return element["Brillouin_type"]
+        elif element["Kind"] == "Group":
+            return HDF5_group
+        else:
+            return HDF5_dataset
+
+    def import_directory(self, directory, parent_group = "Brillouin", extension = None, creator = None, parameters = None, recursive = True, workers = 1, processes = False, batch_size = 16, overwrite = False, progress_callback = None):
+        """Imports all the files of a directory in the HDF5 file. As when files are added to a "Root" group in the GUI, each file is stored in a "Measure" group named after it, as a "Raw data" dataset or, if the file gives a PSD, as a "PSD" and a "Frequency" dataset, together with its attributes. The sub-directories are stored as "Root" groups with the same name.
+        The files are listed once, then read by a pool of threads (or processes) while the data already read are written in the file, by batches of files, with the file kept open during the whole import. An error raised while importing a file doesn't stop the import of the other files: it is reported for this file only.
+
+        Parameters
+        ----------
+        directory : str
+            The path to the directory to import.
+        parent_group : str, optional
+            The path to the group where to store the content of the directory, by default "Brillouin". The groups of the path that don't exist are created with the Brillouin type "Root".
+        extension : str, optional
+            The extension of the files to import (for example "npy"), by default None means that all the files are imported, except hidden ones.
+        creator : str, optional
+            The structure of the files, given to load_general, by default None.
+        parameters : dict, optional
+            The parameters used to load the files, given to load_general, by default None.
+        recursive : bool, optional
+            If True, the sub-directories are imported as well, by default True.
+        workers : int, optional
+            The number of threads (or processes) reading the files, by default 1.
+        processes : bool, optional
+            If True, the files are read by processes instead of threads, which is faster for loaders that don't release the GIL but requires the data to be copied between processes, by default False.
+        batch_size : int, optional
+            The number of files read in advance and written in the file before it is flushed, by default 16.
+        overwrite : bool, optional
+            If True, the "Measure" groups that already exist with the name of a file are replaced, by default False.
+        progress_callback : function, optional
+            A function called after each file is imported, as progress_callback(count, total, filepath, error) where error is the exception raised while importing the file or None, by default None.
+
+        Returns
+        -------
+        dict
+            The path of the group created for each imported file, or the exception raised while importing it, stored with the path of the file as key.
+
+        Raises
+        ------
+        WrapperError_FileNotFound
+            If the directory does not exist.
+
+        Example
+        -------
+        >>> report = wrp.import_directory("measures", parent_group = "Brillouin/Day 1", extension = "npy", workers = 4)
+        >>> errors = {f: e for f, e in report.items() if isinstance(e, Exception)}
+        """
+        def list_files():
+            # List the files to import with the group where they are stored, following the order of the names
+            files = []
+            for root, directories, names in os.walk(directory):
+                directories[:] = sorted(d for d in directories if not d.startswith(".")) if recursive else []
+                relative = os.path.relpath(root, directory)
+                group = parent_group if relative == "." else "/".join([parent_group] + relative.split(os.sep))
+                for name in sorted(names):
+                    if name.startswith("."):
+                        continue
+                    if extension is not None and name.split(".")[-1].lower() != extension.lstrip(".").lower():
+                        continue
+                    files.append((os.path.join(root, name), group))
+            return files
+
+        def create_groups(path):
+            # Create the groups of the path that don't exist yet as "Root" groups
+            parts = path.split("/")
+            for i in range(1, len(parts)):
+                with self._open('r') as file:
+                    exists = "/".join(parts[:i+1]) in file
+                if not exists:
+                    self.create_group(parts[i], parent_group = "/".join(parts[:i]), brillouin_type = "Root")
+
+        def write(filepath, group, dic):
+            # Store the data of the file in a "Measure" group named after the file
+            create_groups(group)
+            name = os.path.basename(filepath).split(".")[0]
+            path = f"{group}/{name}"
+            self.create_group(name, parent_group = group, brillouin_type = "Measure", overwrite = overwrite)
+            if "Raw_data" in dic:
+                self.add_raw_data(dic["Raw_data"]["Data"], path, name = "Raw data", overwrite = overwrite)
             else:
-                return type(file[path])
+                self.add_PSD(dic["PSD"]["Data"], path, name = "PSD", overwrite = overwrite)
+                self.add_frequency(dic["Frequency"]["Data"], path, name = "Frequency", overwrite = overwrite)
+            self.add_attributes(dic["Attributes"], path, overwrite = overwrite)
+            return path
+
+        if not os.path.isdir(directory):
+            raise WrapperError_FileNotFound(f"The directory '{directory}' does not exist.")
+
+        files = list_files()
+        batches = [files[i:i+max(1, batch_size)] for i in range(0, len(files), max(1, batch_size))]
+        report = {}
+
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with self.session('a'), pool(max_workers = max(1, workers)) as executor:
+            def submit(batch):
+                return [(filepath, group, executor.submit(load_general, filepath, creator = creator, parameters = parameters)) for filepath, group in batch]
+
+            # The next batch of files is read while the current one is written
+            pending = submit(batches[0]) if batches else []
+            for i in range(len(batches)):
+                current, pending = pending, (submit(batches[i+1]) if i+1 < len(batches) else [])
+                for filepath, group, future in current:
+                    try:
+                        report[filepath] = write(filepath, group, future.result())
+                        error = None
+                    except Exception as e:
+                        report[filepath] = error = e
+                    if progress_callback is not None:
+                        progress_callback(len(report), len(files), filepath, error)
+                self._session_file.flush()
+
+        return report
 
     def move(self, path, new_path): # Test made 19.09.25
         """
@@ -1310,13 +1706,14 @@ class Wrapper:
         WrapperError_StructureError
             If the path does not lead to an element.
         """
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
             if new_path not in file:
                 file.create_group(new_path)
             group = file[new_path]
             name_group = path.split("/")[-1]
+            self._invalidate_cache(f"{new_path}/{name_group}")
             group.create_group(name_group)
             for k,v in file[path].attrs.items():
                 group[name_group].attrs[k] = v
@@ -1336,7 +1733,7 @@ class Wrapper:
             The dimension of the channel. Default is None, which means the channel dimension is the last dimension.
         """
         # Check if the path exists
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
         
@@ -1345,7 +1742,7 @@ class Wrapper:
             raise WrapperError_ArgumentType(f"The path '{path}' does not lead to a dataset.")
 
         # Extract the data
-        data = self[path]
+        data = np.asarray(self[path])
 
         # If nothing has to be done on the data (either no channel dimension or the channel dimension is the last dimension), return
         if channel_dimension is None or channel_dimension == data.ndim - 1:
@@ -1355,13 +1752,145 @@ class Wrapper:
         data = np.moveaxis(data, channel_dimension, -1)
 
         # Replace the dataset, starting by extracting all its attributes, deleting the dataset and creating a new one
-        with h5py.File(self.filepath, 'a') as file:
-            attributes = file[path].attrs
+        with self._open('a') as file:
+            attributes = dict(file[path].attrs)
             self.delete_element(path)
-            file.create_dataset(path, data=data)
+            self._create_dataset(file, path, data, attributes.get("Brillouin_type", None))
             for k, v in attributes.items():
                 file[path].attrs[k] = v
 
+    def open_checkpoint(self, parent_group, name_group = "Treatment", block_size = 1, overwrite = False):
+        """Returns a checkpoint storing the results of a treatment in a "Treatment" group while the treatment is running, so that it can be resumed if it is interrupted. If the group already exists, the checkpoint gives access to the results it stores and the treatment restarts from there.
+
+        Parameters
+        ----------
+        parent_group : str
+            The path to the group containing the treated data. The format of this group should be "Brillouin/Measure".
+        name_group : str, optional
+            The name of the "Treatment" group storing the results, by default "Treatment".
+        block_size : int, optional
+            The number of elements of the first dimension of the map (for example the number of lines) treated between two saves of the results, by default 1.
+        overwrite : bool, optional
+            If True, an existing group with the same name is replaced, so that the treatment restarts from the beginning, by default False.
+
+        Returns
+        -------
+        TreatmentCheckpoint
+            The checkpoint to give to the treatment.
+
+        Raises
+        ------
+        WrapperError_StructureError
+            Raises an error if the parent group does not exist or if an element with the same name exists and is not a "Treatment" group.
+
+        Example
+        -------
+        >>> checkpoint = wrp.open_checkpoint("Brillouin/Measure", block_size = 10)
+        >>> treat.silent_set_checkpoint(checkpoint)
+        >>> treat.apply_algorithm_on_all() # Saves the results every 10 lines, skipping the lines already stored
+        """
+        path = f"{parent_group}/{name_group}"
+
+        with self.session('a'):
+            if parent_group not in self._session_file:
+                raise WrapperError_StructureError(f"The parent group '{parent_group}' does not exist in the HDF5 file.")
+
+            # Replace the group if needed, or check that it can store the results
+            if name_group in self._session_file[parent_group]:
+                if overwrite:
+                    self.delete_element(path)
+                elif self._session_file[path].attrs.get("Brillouin_type", None) != "Treatment":
+                    raise WrapperError_StructureError(f"The element '{path}' already exists and is not a 'Treatment' group.")
+
+            # Create the group
+            if name_group not in self._session_file[parent_group]:
+                self._invalidate_cache(path)
+                group = self._session_file[parent_group].create_group(name_group)
+                group.attrs["Brillouin_type"] = "Treatment"
+
+        # If the file is temporary set save flag to True
+        if is_tempfile(self.filepath):
+            self.save = True
+
+        return TreatmentCheckpoint(self, path, block_size)
+
+    @contextmanager
+    def open_stream(self, parent_group, brillouin_type = "PSD", spectrum_len = None, name = None, sampling_matrix = None, dtype = np.float64, overwrite = False):
+        """Creates a resizable dataset and returns a stream to append spectra (or frames) to it while an acquisition is running, without having to store the whole map in memory. The file is kept open while the stream is used and the dataset follows the storage policy of its Brillouin type.
+
+        Parameters
+        ----------
+        parent_group : str
+            The path to the group where to store the dataset. If the group does not exist, it is created with the Brillouin type "Measure".
+        brillouin_type : str, optional
+            The Brillouin type of the dataset, by default "PSD".
+        spectrum_len : int or tuple
+            The number of points of a single spectrum, or the shape of a single frame.
+        name : str, optional
+            The name of the dataset, by default the Brillouin type with "_" replaced by spaces ("PSD", "Raw data", ...).
+        sampling_matrix : tuple, optional
+            The shape (Nx, Ny, Nz) of the map being acquired, by default None considers the spectra as a single line. Nx can be None if the number of lines is not known in advance. The sampling matrix is only written for spectra, not for frames.
+        dtype : numpy.dtype, optional
+            The type of the data, by default np.float64.
+        overwrite : bool, optional
+            If True, an existing element with the same name is replaced, by default False.
+
+        Yields
+        ------
+        DatasetStream
+            The stream used to append data to the dataset.
+
+        Raises
+        ------
+        WrapperError_ArgumentType
+            Raises an error if the Brillouin type or the shape of the spectra is not valid.
+        WrapperError_Overwrite
+            Raises an error if an element with the same name already exists and overwrite is False.
+
+        Example
+        -------
+        >>> with wrp.open_stream("Brillouin/Measure", "PSD", spectrum_len = 512, sampling_matrix = (None, 100, 1)) as stream:
+        ...     for line in acquisition:
+        ...         stream.append(line) # Appends a line of 100 spectra
+        """
+        if brillouin_type not in self.BRILLOUIN_TYPES_DATASETS:
+            raise WrapperError_ArgumentType(f"The brillouin type '{brillouin_type}' is not valid.")
+        if spectrum_len is None:
+            raise WrapperError_ArgumentType("The length of the spectra (or the shape of the frames) must be given.")
+        element_shape = (int(spectrum_len),) if np.isscalar(spectrum_len) else tuple(int(e) for e in spectrum_len)
+        if name is None:
+            name = brillouin_type.replace("_", " ")
+        path = f"{parent_group}/{name}"
+
+        with self.session('a'):
+            # Create the parent group if needed and check that the name is free
+            if parent_group not in self._session_file:
+                self._invalidate_cache(parent_group)
+                group = self._session_file.create_group(parent_group)
+                group.attrs["Brillouin_type"] = "Measure"
+            if name in self._session_file[parent_group]:
+                if overwrite:
+                    self.delete_element(path)
+                else:
+                    raise WrapperError_Overwrite(f"An element with the name '{name}' already exists in the group '{parent_group}'.")
+
+            # Create an empty dataset that can grow along its first dimension, chunked following the storage policy
+            self._invalidate_cache(path)
+            options = self._get_storage_options((self.storage_policy.get(brillouin_type, {}).get("Spectra_per_chunk", 1),) + element_shape, np.dtype(dtype), brillouin_type)
+            if "chunks" not in options:
+                options["chunks"] = True
+            dataset = self._session_file[parent_group].create_dataset(name, shape = (0,) + element_shape, maxshape = (None,) + element_shape, dtype = dtype, **options)
+            dataset.attrs["Brillouin_type"] = brillouin_type
+            self._record_storage_policy(self._session_file)
+
+            # If the file is temporary set save flag to True
+            if is_tempfile(self.filepath):
+                self.save = True
+
+            stream = DatasetStream(self, path, dataset, sampling_matrix)
+            stream.update_sampling_matrix()
+            yield stream
+
     def repack(self, force_repack = False): # Test made 19.09.25
         """
         Repacks the wrapper to minimize its size.
@@ -1398,10 +1927,13 @@ class Wrapper:
                 if isinstance(file[group][key], h5py.Group):
                     copy_group(file, group+"/"+key, new_file, new_group+"/"+key)
                 else:
-                    dataset = new_file[new_group].create_dataset(key, data=file[group][key])
-                    dataset.attrs["Brillouin_type"] = file[group][key].attrs["Brillouin_type"]
+                    dataset = self._create_dataset(new_file[new_group], key, file[group][key][()], file[group][key].attrs["Brillouin_type"])
         
         if self.need_for_repack or force_repack:
+            # The file is replaced on the disk, which is not possible while a session keeps it open
+            if self._session_file is not None:
+                raise WrapperError(f"The file '{self.filepath}' cannot be repacked while a session is open.")
+
             # Create a blank HDF5 file to store the data
             _, temporary_file = tempfile.mkstemp(suffix = ".h5")
             with h5py.File(temporary_file, 'w') as file:
@@ -1410,7 +1942,7 @@ class Wrapper:
                 group.attrs["HDF5_BLS_version"] = HDF5_BLS_Version
 
             # Create a new file to store the data
-            with h5py.File(self.filepath, 'r') as file_old:
+            with self._open('r') as file_old:
                 # Create a new file to store the data
                 with h5py.File(temporary_file, 'w') as new_file:
                     # Copy the data and attributes from the wrapper to the new file
@@ -1450,9 +1982,13 @@ class Wrapper:
         if os.path.isfile(filepath) and not overwrite:
             raise WrapperError_Overwrite(f"The file '{filepath}' already exists.")
         
+        # The current file might be removed, which is not possible while a session keeps it open
+        if self._session_file is not None:
+            raise WrapperError_Save(f"The file '{self.filepath}' cannot be saved to a new location while a session is open.")
+
         # Copy the current file to the new location and update filepath attribute
         try:
-            with h5py.File(self.filepath, 'r') as src_file:
+            with self._open('r') as src_file:
                 with h5py.File(filepath, 'w') as dst_file:
                     src_file.copy('/Brillouin', dst_file)
             # Remove the old file if specified
@@ -1492,7 +2028,7 @@ class Wrapper:
         if save_filepath is None: return
 
         # Check if the path exists in the file
-        with h5py.File(self.filepath, 'r') as file:
+        with self._open('r') as file:
             if path not in file:
                 raise WrapperError_StructureError(f"The path '{path}' does not exist in the file.")
             if attribute_name not in file[path].attrs.keys():
@@ -1530,6 +2066,94 @@ class Wrapper:
                     writer.writerow([base])
                 writer.writerow([k, v])
 
+    @contextmanager
+    def session(self, mode = 'a'):
+        """Keeps the HDF5 file open for the duration of a "with" block. All the methods of the wrapper called inside the block reuse the same file handle instead of opening and closing the file at each call, which makes batches of small operations (adding attributes, importing many datasets, browsing the tree) much faster. The file is flushed and closed when the block exits, even if an error is raised. Nested sessions reuse the handle of the outermost one.
+
+        Parameters
+        ----------
+        mode : str, optional
+            The mode used to open the file, by default 'a'. Use 'r' to only read the file, in which case any method modifying the file raises an error.
+
+        Yields
+        ------
+        Wrapper
+            The wrapper itself.
+
+        Raises
+        ------
+        WrapperError
+            Raises an error if a writable session is requested inside a read-only one.
+        
+        Example
+        -------
+        >>> with wrp.session():
+        ...     for i in range(100):
+        ...         wrp.add_attributes({f"MEASURE.Attribute_{i}": i}, parent_group="Brillouin")
+        """
+        # If a session is already open, reuse its handle
+        if self._session_file is not None:
+            if mode != 'r' and self._session_file.mode == 'r':
+                raise WrapperError(f"A writable session cannot be opened inside the read-only session on '{self.filepath}'.")
+            yield self
+            return
+
+        # Open the file once and share the handle with all the methods
+        self._check_cache()
+        self._session_file = h5py.File(self.filepath, mode)
+        try:
+            yield self
+        finally:
+            file, self._session_file = self._session_file, None
+            if file.mode != 'r':
+                file.flush()
+            file.close()
+            if mode != 'r':
+                self._cache_signature = self._file_signature()
+
+    def set_storage_policy(self, brillouin_type, chunks = "Spectrum", compression = "gzip", compression_opts = 4, shuffle = True, spectra_per_chunk = 8, tile_size = 64):
+        """Sets the way the datasets of a given Brillouin type are stored in the file. The policy is applied to all the datasets created afterwards by the wrapper and is recorded in the "HDF5_BLS_storage_policy" attribute of the root group.
+
+        Parameters
+        ----------
+        brillouin_type : str
+            The Brillouin type of the datasets concerned by the policy.
+        chunks : str, optional
+            The chunking of the datasets, by default "Spectrum". Either "Spectrum" to store a few spectra per chunk along the last axis, "Tile" to store 2D tiles of the last two axes or None for a contiguous storage.
+        compression : str, optional
+            The compression filter, by default "gzip". Either "gzip", "lzf" or None for no compression.
+        compression_opts : int, optional
+            The level of the gzip compression (from 0 to 9), by default 4.
+        shuffle : bool, optional
+            If True, the shuffle filter is applied before the compression, by default True.
+        spectra_per_chunk : int, optional
+            The number of spectra stored in each chunk when chunks is "Spectrum", by default 8.
+        tile_size : int, optional
+            The size of the tiles when chunks is "Tile", by default 64.
+
+        Raises
+        ------
+        WrapperError_ArgumentType
+            Raises an error if the Brillouin type, the chunking or the compression are not valid.
+        
+        Example
+        -------
+        >>> wrp.set_storage_policy("PSD", chunks = "Spectrum", compression = "lzf", spectra_per_chunk = 1) # Stores each spectrum of the PSD maps in its own chunk compressed with lzf
+        """
+        if brillouin_type not in self.BRILLOUIN_TYPES_DATASETS and brillouin_type.split("_")[0] != "Abscissa":
+            raise WrapperError_ArgumentType(f"The brillouin type '{brillouin_type}' is not valid.")
+        if chunks not in ["Spectrum", "Tile", None]:
+            raise WrapperError_ArgumentType(f"The chunking '{chunks}' is not valid. Valid chunkings are 'Spectrum', 'Tile' or None.")
+        if compression not in ["gzip", "lzf", None]:
+            raise WrapperError_ArgumentType(f"The compression '{compression}' is not valid. Valid compressions are 'gzip', 'lzf' or None.")
+        
+        self.storage_policy[brillouin_type] = {"Chunks": chunks, 
+                                               "Spectra_per_chunk": int(spectra_per_chunk), 
+                                               "Tile_size": int(tile_size), 
+                                               "Compression": compression, 
+                                               "Compression_opts": int(compression_opts), 
+                                               "Shuffle": bool(shuffle)}
+
     def store_script(self, path: str = None, attribute_name: str = None, script_filepath: str = None):
         """Read the full text of a script, store it on this object at the given path and under the given attribute name.
 
@@ -1607,7 +2231,7 @@ class Wrapper:
         WrapperError_StructureError
             If the parent group does not exist in the HDF5 file.
         """
-        with h5py.File(self.filepath, "r") as file:
+        with self._open("r") as file:
             # Check if the parent group exists
             create_group = False
             if parent_group not in file:
@@ -1650,7 +2274,7 @@ class Wrapper:
         if parent_group is None: parent_group = "Brillouin"
 
         # Updating the attributes
-        with h5py.File(self.filepath, 'a') as file:
+        with self._open('a') as file:
             # Check if the path leads to a valid element, if not create a group at this path of type "Root"
             if  parent_group not in file: 
                 group = file.create_group(parent_group)
@@ -1658,6 +2282,7 @@ class Wrapper:
             # If the path leads to a dataset, we go up one level to get a group
             if type(file[parent_group]) is HDF5_dataset:
                 parent_group = "/".join(parent_group.split("/")[:-1])
+            self._invalidate_cache(parent_group)
             # We update the attributes of the metadata group taking into account the "update" parameter
             try:
                 for k, v in attributes.items():
@@ -1719,7 +2344,7 @@ class Wrapper:
         overwrite : bool, optional
             A flag to overwrite any dataset with the same name, by default False
         """
-        with h5py.File(self.filepath, "r") as file:
+        with self._open("r") as file:
             # Check if the parent group exists
             create_group = False
             if parent_group not in file:
@@ -1891,7 +2516,8 @@ class Wrapper:
             The path to the element to delete the attributes from.
         """
         if self.get_type(path) == HDF5_group:
-            with h5py.File(self.filepath, 'a') as file:
+            self._invalidate_cache(path)
+            with self._open('a') as file:
                 for e in list(file[path].attrs.keys()):
                     if file[path].attrs[e] == "":
                         file[path].attrs.pop(e, None)
@@ -1988,7 +2614,7 @@ class Wrapper:
         if not os.path.isfile(filepath):
             raise WrapperError_FileNotFound(f"The file '{filepath}' does not exist.")
         
-        with h5py.File(self.filepath, 'r') as f:
+        with self._open('r') as f:
             if name in f[parent_group].keys():
                 i=0
                 while f"{name}_{i}" in f[parent_group].keys(): i+=1
@@ -2022,7 +2648,8 @@ class Wrapper:
         """
         def delete_attributes(path, attributes):
             if self.get_type(path) == HDF5_group:
-                with h5py.File(self.filepath, 'a') as file:
+                self._invalidate_cache(path)
+                with self._open('a') as file:
                     for e in list(file[path].attrs.keys()):
                         if e in attributes.keys():
                             file[path].attrs.pop(e, None)
@@ -2,9 +2,48 @@ import pytest
 import sys
 import os
 import datetime
+import numpy as np
+from numpy.polynomial import Chebyshev
+from scipy.signal import butter, filtfilt
 
 from HDF5_BLS.load_data import load_dat_file, load_image_file, load_general, load_npy_file, load_sif_file
-from HDF5_BLS.load_formats.errors import LoadError_creator, LoadError_parameters
+from HDF5_BLS.load_formats.load_errors import LoadError_creator, LoadError_parameters
+from HDF5_BLS.load_formats import load_dat
+from HDF5_BLS.load_formats.load_dat import load_dat_TimeDomain
+
+# The parameters used to load the TimeDomain test file (see TR_test_parameters.rtf)
+TIMEDOMAIN_PARAMETERS = {"ac_gain": 12.5, "bool_reverse_data": True, "bool_forced_copeaks": False, "butter_order": 8, "copeak_start": 2036, "copeak_window": 100,
+                         "delay_rate": 10e3, "file_con": os.path.join(os.path.dirname(__file__), "test_data", "TR_test.con"), "fmin": 0, "fmax": 25, "fmin_plot": 0, "fmax_plot": 20,
+                         "LPfilter": 8, "HPfilter": 4.5, "polyfit_order": 8, "rep_rate": 80e6, "signal_length": 2400, "start_offset": 55, "zp": 65356}
+
+# Processes the traces of a TimeDomain file one by one as the loader did before the traces were memory mapped and processed by blocks, the metadata being the ones scraped by the loader (the file has no DC data)
+def process_TimeDomain_traces(filepath, attributes):
+    a = {k.split(".")[-1]: v for k, v in attributes.items()}
+    Nx, Ny, ppt, L = a["Nx_steps"], a["Ny_steps"], a["points_per_trace"], int(a["signal_length"])
+    traces = np.fromfile(filepath, dtype = a["fmt"], count = a["n_traces"] * ppt).reshape(a["n_traces"], ppt).astype(float)
+    data_ac = (traces.reshape(Nx, Ny, ppt, order = "F") * a["vgain"] + a["voff"]) / a["ac_gain"]
+    if a["bool_reverse_data"]:
+        data_ac = data_ac[:, :, ::-1]
+    t_raw = (np.arange(ppt) * a["hint"] + a["hoff"]) / (a["rep_rate"] / a["delay_rate"])
+    data_t = t_raw[:L] - t_raw[0]
+    dt = data_t[1]
+    b_LP, a_LP = butter(int(a["butter_order"]), a["LPfilter"] * 1e9 / (1 / dt / 2), btype = "low")
+    b_HP, a_HP = butter(int(a["butter_order"]), a["HPfilter"] * 1e9 / (1 / dt / 2), btype = "high")
+    copeak_range = (a["copeak_start"] + np.arange(-a["copeak_window"], a["copeak_window"] + 1)).astype(int)
+    xfit = np.linspace(-1, 1, L)
+    freqs = np.fft.fftshift(np.fft.fftfreq(int(a["zp"]), d = dt))
+    plot_idx = np.where((freqs >= a["fmin_plot"] * 1e9) & (freqs <= a["fmax_plot"] * 1e9))[0]
+    data_pro = np.zeros((Nx, Ny, L))
+    PSD = np.zeros((Nx, Ny, len(plot_idx)))
+    for i in range(Nx):
+        for j in range(Ny):
+            window = data_ac[i, j, copeak_range - 1]
+            start = int(np.argmax(np.abs(window - window[0])) + copeak_range[0] - 1 + a["start_offset"])
+            signal = filtfilt(b_LP, a_LP, data_ac[i, j, start:start + L])
+            signal = signal - Chebyshev.fit(xfit, signal, int(a["polyfit_order"]))(xfit)
+            data_pro[i, j] = filtfilt(b_HP, a_HP, signal)
+            PSD[i, j] = np.fft.fftshift((2 / L) * np.abs(np.fft.fft(data_pro[i, j], int(a["zp"]))))[plot_idx]
+    return data_pro, data_t, PSD, freqs[plot_idx] * 1e-9
 
 def test_load_dat_file():
     filepath = os.path.join(os.path.dirname(__file__), "test_data", "example_GHOST.DAT")
@@ -19,6 +58,33 @@ def test_load_dat_file():
     assert list(dic.keys()) == ["PSD", "Frequency", "Attributes"], "FAIL - test_load_dat_file - Structure of the dictionary is not correct"
     assert dic["PSD"]["Data"].shape == (512,), "FAIL - test_load_dat_file - PSD data shape is not correct"
 
+# Test that the TimeDomain loader gives the signal, the time axis, the PSD and the frequency axis obtained by processing the traces one by one
+def test_load_dat_TimeDomain():
+    filepath = os.path.join(os.path.dirname(__file__), "test_data", "TR_test_count1_scope0.dat")
+    dic = load_dat_TimeDomain(filepath, dict(TIMEDOMAIN_PARAMETERS))
+    data_pro, data_t, PSD, frequency = process_TimeDomain_traces(filepath, dic["Attributes"])
+
+    assert dic["Raw_data"]["Data"].shape == (1, 200, 2400), "FAIL - test_load_dat_TimeDomain - Signal shape is not correct"
+    assert np.array_equal(dic["Abscissa_Time"]["Data"], data_t), "FAIL - test_load_dat_TimeDomain - Time axis is not correct"
+    assert np.array_equal(dic["Frequency"]["Data"], frequency), "FAIL - test_load_dat_TimeDomain - Frequency axis is not correct"
+    # The traces are scaled in single precision
+    assert np.allclose(dic["Raw_data"]["Data"], data_pro, rtol = 0, atol = 1e-4 * np.max(np.abs(data_pro))), "FAIL - test_load_dat_TimeDomain - Signal is not correct"
+    assert np.allclose(dic["PSD"]["Data"], PSD, rtol = 0, atol = 1e-4 * np.max(PSD)), "FAIL - test_load_dat_TimeDomain - PSD is not correct"
+    assert np.array_equal(np.argmax(dic["PSD"]["Data"], axis = -1), np.argmax(PSD, axis = -1)), "FAIL - test_load_dat_TimeDomain - Brillouin peaks are not correct"
+
+# Test that processing the TimeDomain traces by blocks gives the result of processing all the traces at once
+def test_load_dat_TimeDomain_blocks(monkeypatch):
+    filepath = os.path.join(os.path.dirname(__file__), "test_data", "TR_test_count1_scope0.dat")
+    monkeypatch.setattr(load_dat, "BLOCK_SIZE_TIMEDOMAIN", 2**40)
+    unblocked = load_dat_TimeDomain(filepath, dict(TIMEDOMAIN_PARAMETERS))
+    # Blocks of 7 traces for the FFT and of 190 traces for the other steps, which don't divide the 200 traces of the scan
+    monkeypatch.setattr(load_dat, "BLOCK_SIZE_TIMEDOMAIN", 7 * 65356)
+    blocked = load_dat_TimeDomain(filepath, dict(TIMEDOMAIN_PARAMETERS))
+
+    for key in ["Raw_data", "PSD", "Frequency", "Abscissa_Time"]:
+        assert blocked[key]["Data"].shape == unblocked[key]["Data"].shape, f"FAIL - test_load_dat_TimeDomain_blocks - {key} shape is not correct"
+        assert np.allclose(blocked[key]["Data"], unblocked[key]["Data"], rtol = 1e-6, atol = 1e-6 * np.max(np.abs(unblocked[key]["Data"]))), f"FAIL - test_load_dat_TimeDomain_blocks - {key} is not correct"
+
 def test_load_image():
     filepath = os.path.join(os.path.dirname(__file__), "test_data", "example_image.tif")
 
@@ -6,6 +6,7 @@ import shutil
 import tempfile
 import h5py
 from HDF5_BLS.wrapper import Wrapper, HDF5_BLS_Version
+from HDF5_BLS.dataset_view import DatasetView
 from HDF5_BLS.errors import WrapperError, WrapperError_ArgumentType, WrapperError_FileNotFound, WrapperError_Overwrite, WrapperError_Save, WrapperError_StructureError
 
 # Fixture to create a temporary HDF5 file for testing
@@ -54,9 +55,30 @@ def test_getitem_returns_data(wrapper_instance: Wrapper):
     with h5py.File(wrapper_instance.filepath, 'a') as f:
         group = f["Brillouin"]
         group.create_dataset("test_data", data=np.arange(10))
-    assert isinstance(wrapper_instance["Brillouin/test_data"], np.ndarray)
+    assert isinstance(wrapper_instance["Brillouin/test_data"], DatasetView)
     arr = wrapper_instance["Brillouin/test_data"]
+    assert isinstance(np.asarray(arr), np.ndarray)
     assert np.array_equal(arr, np.arange(10))
+    assert np.array_equal(arr[2:8:3], np.arange(10)[2:8:3])
+    assert np.array_equal(arr[::-2], np.arange(10)[::-2])
+    assert arr[-1] == 9
+
+    # Setup: create a map of spectra stored as a 2D array and reshaped with the sampling matrix
+    data = np.random.random((4*3*2, 16))
+    with h5py.File(wrapper_instance.filepath, 'a') as f:
+        group = f["Brillouin"].create_group("Measure")
+        group.attrs["Brillouin_type"] = "Measure"
+        group.attrs["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"] = "4,3,2"
+        group.create_dataset("PSD", data=data)
+    view = wrapper_instance["Brillouin/Measure/PSD"]
+    reference = data.reshape((4,3,2,16))
+    assert view.shape == (4,3,2,16)
+    for key in [(1, 2, 0), (1, slice(None), 1, slice(2, 10)), (slice(None, None, 2), 0), (Ellipsis, 5), ([3, 0, 3], 1), (slice(None), [2, 0], 1, slice(None, None, -1)), (np.array([True, False, True, False]),)]:
+        assert np.array_equal(view[key], reference[key]), f"Wrong selection for key {key}"
+    assert np.array_equal(np.asarray(view), reference)
+    assert np.allclose(np.mean(view, axis=(0, 1, 2)), reference.mean(axis=(0, 1, 2)))
+    assert np.array_equal(view * 2, reference * 2)
+
     os.remove(wrapper_instance.filepath)
 
 # Test __add__ magic method for combining wrappers
@@ -400,6 +422,60 @@ def test_export_dataset(wrapper_instance: Wrapper):
         os.remove(os.path.join(tmp_path, f))
     os.rmdir(tmp_path)
 
+# Converts a brimX file to brim as the converter did before the PSD was streamed: all the arrays of each Measure group are loaded and given to brimfile
+def convert_brimX_in_memory(filepath_from, filepath_to):
+    import brimfile
+    f_to = brimfile.File.create(filepath_to, store_type = brimfile.StoreType.AUTO)
+    with h5py.File(filepath_from, 'r') as f_from:
+        for i, name in enumerate(f_from["Brillouin"]):
+            group = f_from["Brillouin"][name]
+            PSD = group["PSD"][()]
+            PSD = PSD.reshape((1,) * (4 - PSD.ndim) + PSD.shape)
+            dx = np.mean(np.diff(group["x"][()]))
+            treatment = {"shift": group["Treat/Shift"][()], "shift_units": "GHz", "width": group["Treat/Linewidth"][()], "width_units": "GHz", "amplitude": group["Treat/Amplitude"][()]}
+            for k in ["shift", "width", "amplitude"]:
+                treatment[k] = treatment[k][(None,) * (4 - group["PSD"].ndim)]
+            d = f_to.create_data_group(PSD, group["Frequency"][()], (1, 1, dx), name = f"Group_{i}")
+            d.create_analysis_results_group((treatment,), name = f"Group_{i}_analysis")
+    f_to.close()
+
+# Test exporting a brimX file to brim, the PSD being streamed from the brimX file
+def test_export_brim(wrapper_instance: Wrapper, tmp_path: Path):
+    import zarr
+    rng = np.random.default_rng(0)
+    with h5py.File(wrapper_instance.filepath, 'a') as f:
+        for name, shape in [("A", (5, 6, 40)), ("B", (2, 3, 4, 30)), ("C", (7, 25))]:
+            group = f["Brillouin"].create_group(name)
+            group.attrs["Brillouin_type"] = "Measure"
+            group.attrs["MEASURE.Sample"] = name
+            ds = group.create_dataset("PSD", data = rng.random(shape).astype(np.float32), chunks = (1,) * (len(shape) - 1) + (shape[-1],))
+            ds.attrs["Brillouin_type"] = "PSD"
+            ds = group.create_dataset("Frequency", data = np.linspace(-10, 10, shape[-1]))
+            ds.attrs["Brillouin_type"] = "Frequency"
+            ds = group.create_dataset("x", data = np.arange(shape[-2]) * 0.5)
+            ds.attrs["Brillouin_type"] = "Abscissa_0_1"
+            treatment = group.create_group("Treat")
+            treatment.attrs["Brillouin_type"] = "Treatment"
+            for brillouin_type in ["Shift", "Linewidth", "Amplitude"]:
+                ds = treatment.create_dataset(brillouin_type, data = rng.random(shape[:-1]))
+                ds.attrs["Brillouin_type"] = brillouin_type
+
+    wrapper_instance.export_brim(str(tmp_path / "streamed.brim.zarr"))
+    convert_brimX_in_memory(wrapper_instance.filepath, str(tmp_path / "in_memory.brim.zarr"))
+
+    # Both files have the same groups and arrays, with the same attributes and data
+    streamed = zarr.open_group(str(tmp_path / "streamed.brim.zarr"), mode = 'r')
+    in_memory = zarr.open_group(str(tmp_path / "in_memory.brim.zarr"), mode = 'r')
+    assert dict(streamed.attrs) == dict(in_memory.attrs)
+    members = dict(in_memory.members(max_depth = None))
+    assert sorted(dict(streamed.members(max_depth = None))) == sorted(members)
+    assert len([name for name in members if name.endswith("/PSD")]) == 3
+    for name, node in streamed.members(max_depth = None):
+        assert dict(node.attrs) == dict(members[name].attrs), name
+        if isinstance(node, zarr.Array):
+            assert node.shape == members[name].shape and node.dtype == members[name].dtype, name
+            assert np.array_equal(node[...], members[name][...]), name
+
 # Test exporting a group to a file
 def test_export_group(wrapper_instance: Wrapper):
     tmp_path = "/".join(wrapper_instance.filepath.split("/")[:-1])
@@ -496,6 +572,30 @@ def test_get_attributes(wrapper_instance: Wrapper):
     assert attr["MEASURE.Sample"] == "Ethanol", f"The attribute 'MEASURE.Sample' does not have the right value"
     assert attr["SPECTROMETER.Type"] == "TFP", f"The attribute 'SPECTROMETER.Type' does not have the right value"
 
+    # Test that the merged attributes are cached and read-only
+    attr = wrapper_instance.get_attributes(path="Brillouin/Group1/Group2/data")
+    assert wrapper_instance.get_attributes(path="Brillouin/Group1/Group2/data") is attr
+    with pytest.raises(TypeError):
+        attr["MEASURE.Sample"] = "Glycerol"
+
+    # Test that modifying the attributes of a parent updates the attributes of its children
+    wrapper_instance.add_attributes({"MEASURE.Sample": "Glycerol", "MEASURE.Date": "Today"}, parent_group="Brillouin/Group1/Group2", overwrite=True)
+    attr = wrapper_instance.get_attributes(path="Brillouin/Group1/Group2/data")
+    assert attr["MEASURE.Sample"] == "Glycerol"
+    assert attr["MEASURE.Date"] == "Today"
+    assert wrapper_instance.get_attributes(path="Brillouin/Group1")["MEASURE.Sample"] == "Water"
+
+    # Test that renaming an element does not return the attributes of the old element
+    wrapper_instance.change_name("Brillouin/Group1/Group2", "Group3")
+    assert wrapper_instance.get_attributes(path="Brillouin/Group1/Group3/data")["MEASURE.Sample"] == "Glycerol"
+    with pytest.raises(WrapperError_StructureError):
+        wrapper_instance.get_attributes(path="Brillouin/Group1/Group2/data")
+
+    # Test that modifications made outside of the wrapper are detected
+    with h5py.File(wrapper_instance.filepath, 'a') as f:
+        f["Brillouin/Group1"].attrs["SPECTROMETER.Type"] = "VIPA spectrometer"
+    assert wrapper_instance.get_attributes(path="Brillouin/Group1/Group3/data")["SPECTROMETER.Type"] == "VIPA spectrometer"
+
     os.remove(wrapper_instance.filepath)
 
 # Test getting children elements of a group
@@ -520,6 +620,35 @@ def test_get_children_elements(wrapper_instance: Wrapper):
 
     os.remove(wrapper_instance.filepath)
 
+# Test getting the elements of a given type located under a group
+def test_get_descendants(wrapper_instance: Wrapper):
+    # Setup: create groups and datasets
+    wrapper_instance.add_PSD(np.random.random((5,5)), parent_group="Brillouin/Group1", name="PSD")
+    wrapper_instance.add_frequency(np.arange(5), parent_group="Brillouin/Group1", name="Frequency")
+    wrapper_instance.add_frequency(np.arange(5), parent_group="Brillouin/Group2", name="Frequency")
+    wrapper_instance.add_PSD(np.random.random((5,5)), parent_group="Brillouin/Group2/Sub", name="PSD")
+
+    assert wrapper_instance.get_descendants(Brillouin_type="PSD") == ["Brillouin/Group1/PSD", "Brillouin/Group2/Sub/PSD"]
+    assert wrapper_instance.get_descendants("Brillouin/Group1", Brillouin_type=["PSD", "Frequency"]) == ["Brillouin/Group1/Frequency", "Brillouin/Group1/PSD"]
+    assert wrapper_instance.get_descendants("Brillouin/Group2") == ["Brillouin/Group2/Frequency", "Brillouin/Group2/Sub", "Brillouin/Group2/Sub/PSD"]
+
+    # Test that the nearest element is first looked for in the siblings, then in the groups above
+    assert wrapper_instance.get_nearest("Brillouin/Group1/PSD", Brillouin_type="Frequency") == "Brillouin/Group1/Frequency"
+    assert wrapper_instance.get_nearest("Brillouin/Group2/Sub/PSD", Brillouin_type="Frequency") == "Brillouin/Group2/Frequency"
+    assert wrapper_instance.get_nearest("Brillouin/Group2/Sub/PSD", Brillouin_type="Raw_data") is None
+
+    # Test that the index follows the modifications of the file
+    wrapper_instance.delete_element("Brillouin/Group1/Frequency")
+    wrapper_instance.change_name("Brillouin/Group2", "Group3")
+    assert wrapper_instance.get_descendants(Brillouin_type="PSD") == ["Brillouin/Group1/PSD", "Brillouin/Group3/Sub/PSD"]
+    assert wrapper_instance.get_nearest("Brillouin/Group1/PSD", Brillouin_type="Frequency") is None
+    with h5py.File(wrapper_instance.filepath, 'a') as f:
+        ds = f["Brillouin/Group3"].create_dataset("Raw data", data=np.random.random((5,5)))
+        ds.attrs["Brillouin_type"] = "Raw_data"
+    assert wrapper_instance.get_children_elements("Brillouin/Group3", Brillouin_type="Raw_data") == ["Raw data"]
+
+    os.remove(wrapper_instance.filepath)
+
 # Test getting special groups hierarchy
 def test_get_special_groups_hierarchy(wrapper_instance: Wrapper):
     # Setup: create the file
@@ -592,6 +721,47 @@ def test_get_type(wrapper_instance: Wrapper):
 
     os.remove(wrapper_instance.filepath)
 
+# Test importing all the files of a directory
+def test_import_directory(wrapper_instance: Wrapper):
+    # Setup: create a directory with npy files, a sub-directory and a file that can't be loaded
+    directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(directory, "Sub"))
+    np.save(os.path.join(directory, "Measure_1.npy"), np.arange(10))
+    np.save(os.path.join(directory, "Measure_2.npy"), np.arange(20))
+    np.save(os.path.join(directory, "Sub", "Measure_3.npy"), np.ones((3, 5)))
+    with open(os.path.join(directory, "Notes.txt"), "w") as f:
+        f.write("Not a measure")
+
+    # Test importing the npy files only, with threads, reporting the progress
+    progress = []
+    report = wrapper_instance.import_directory(directory, parent_group = "Brillouin/Import", extension = "npy", workers = 2, batch_size = 2, progress_callback = lambda count, total, filepath, error: progress.append((count, total, error)))
+    assert report == {os.path.join(directory, "Measure_1.npy"): "Brillouin/Import/Measure_1",
+                      os.path.join(directory, "Measure_2.npy"): "Brillouin/Import/Measure_2",
+                      os.path.join(directory, "Sub", "Measure_3.npy"): "Brillouin/Import/Sub/Measure_3"}
+    assert progress == [(1, 3, None), (2, 3, None), (3, 3, None)]
+    with h5py.File(wrapper_instance.filepath, "r") as file:
+        assert file["Brillouin/Import"].attrs["Brillouin_type"] == "Root"
+        assert file["Brillouin/Import/Sub"].attrs["Brillouin_type"] == "Root"
+        assert file["Brillouin/Import/Measure_1"].attrs["Brillouin_type"] == "Measure"
+        assert file["Brillouin/Import/Measure_1/Raw data"].attrs["Brillouin_type"] == "Raw_data"
+        assert np.all(file["Brillouin/Import/Measure_2/Raw data"][()] == np.arange(20))
+        assert file["Brillouin/Import/Sub/Measure_3/Raw data"].shape == (3, 5)
+        assert file["Brillouin/Import/Sub/Measure_3"].attrs["FILEPROP.Name"] == "Measure_3"
+
+    # Test that the files that can't be imported are reported without stopping the import
+    report = wrapper_instance.import_directory(directory, parent_group = "Brillouin/Import", recursive = False)
+    assert isinstance(report[os.path.join(directory, "Notes.txt")], Exception)
+    assert isinstance(report[os.path.join(directory, "Measure_1.npy")], WrapperError_Overwrite)
+    assert wrapper_instance.import_directory(directory, parent_group = "Brillouin/Import", extension = "npy", recursive = False, overwrite = True) == {os.path.join(directory, "Measure_1.npy"): "Brillouin/Import/Measure_1",
+                                                                                                                                                  os.path.join(directory, "Measure_2.npy"): "Brillouin/Import/Measure_2"}
+
+    # Test importing a directory that does not exist
+    with pytest.raises(WrapperError_FileNotFound):
+        wrapper_instance.import_directory(os.path.join(directory, "Wrong"))
+
+    shutil.rmtree(directory)
+    os.remove(wrapper_instance.filepath)
+
 # Test moving an element within the file
 def test_move(wrapper_instance: Wrapper):
     # Setup: Create the file
@@ -628,6 +798,68 @@ def test_move(wrapper_instance: Wrapper):
         
     os.remove(wrapper_instance.filepath)
 
+# Test streaming spectra to a resizable dataset
+def test_open_stream(wrapper_instance: Wrapper):
+    data = np.random.random((6, 4, 32))
+
+    # Append the map line by line, the number of lines not being known in advance
+    with wrapper_instance.open_stream("Brillouin/Measure", "PSD", spectrum_len=32, sampling_matrix=(None, 4, 1)) as stream:
+        for i, line in enumerate(data):
+            stream.append(line)
+            assert wrapper_instance.get_attributes("Brillouin/Measure")["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"] == f"{i+1},4,1"
+        stream.append(data[0, 0])
+        try: stream.append(np.zeros(16))
+        except WrapperError_ArgumentType: pass
+    assert stream.count == 25
+    assert wrapper_instance.get_attributes("Brillouin/Measure")["MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()"] == "6,4,1"
+    assert wrapper_instance.get_type("Brillouin/Measure/PSD", return_Brillouin_type=True) == "PSD"
+    with h5py.File(wrapper_instance.filepath, 'r') as f:
+        assert f["Brillouin/Measure/PSD"].shape == (25, 32)
+        assert f["Brillouin/Measure/PSD"].maxshape == (None, 32)
+        assert np.array_equal(f["Brillouin/Measure/PSD"][:24], data.reshape((24, 32)))
+
+    # Test that an existing dataset is not overwritten by default
+    try: 
+        with wrapper_instance.open_stream("Brillouin/Measure", "PSD", spectrum_len=32): pass
+    except WrapperError_Overwrite: pass
+
+    # Append frames to a raw data dataset
+    with wrapper_instance.open_stream("Brillouin/Measure_2", "Raw_data", spectrum_len=(8, 16)) as stream:
+        stream.append(np.ones((3, 8, 16)))
+    assert wrapper_instance["Brillouin/Measure_2/Raw data"].shape == (3, 8, 16)
+    assert "MEASURE.Sampling_Matrix_Size_(Nx,Ny,Nz)_()" not in wrapper_instance.get_attributes("Brillouin/Measure_2")
+
+    os.remove(wrapper_instance.filepath)
+
+# Test storing and reloading the results of a treatment with a checkpoint
+def test_open_checkpoint(wrapper_instance: Wrapper):
+    wrapper_instance.add_dictionary({"PSD": {"Name": "PSD", "Data": np.random.random((4, 3, 16))}}, parent_group="Brillouin/Measure", create_group=True, brillouin_type_parent_group="Measure")
+    results = {name: np.random.random((4, 3, 2)) for name in ["shift", "linewidth", "amplitude", "shift_var", "linewidth_var", "amplitude_var", "offset"]}
+    results["completed"] = np.zeros((4, 3), dtype=bool)
+
+    # Nothing is stored before the first save, then only the saved lines are stored
+    checkpoint = wrapper_instance.open_checkpoint("Brillouin/Measure", block_size=2)
+    assert checkpoint.load() is None
+    results["completed"][:2] = True
+    checkpoint.save(results, 0, 2)
+    assert wrapper_instance.get_type("Brillouin/Measure/Treatment", return_Brillouin_type=True) == "Treatment"
+    assert wrapper_instance.get_type("Brillouin/Measure/Treatment/Shift error", return_Brillouin_type=True) == "Shift_err"
+
+    # Opening the checkpoint again gives access to the stored results
+    stored = wrapper_instance.open_checkpoint("Brillouin/Measure").load()
+    assert np.array_equal(stored["completed"], results["completed"])
+    assert np.array_equal(stored["shift"][:2], results["shift"][:2])
+    assert np.all(np.isnan(stored["shift"][2:]))
+
+    # Overwriting the group restarts the treatment, and a group that is not a treatment can't be used
+    assert wrapper_instance.open_checkpoint("Brillouin/Measure", overwrite=True).load() is None
+    with pytest.raises(WrapperError_StructureError):
+        wrapper_instance.open_checkpoint("Brillouin", name_group="Measure")
+    with pytest.raises(WrapperError_StructureError):
+        wrapper_instance.open_checkpoint("Brillouin/Missing")
+
+    os.remove(wrapper_instance.filepath)
+
 # Test repacking the file (should not raise)
 def test_repack(wrapper_instance: Wrapper):
     # Setup: Create the file
@@ -738,6 +970,78 @@ def test_save_properties_csv(wrapper_instance: Wrapper):
     os.remove(wrapper_instance.filepath)
     os.remove(csv_path)
 
+# Test the storage policy of the datasets
+def test_set_storage_policy(wrapper_instance: Wrapper):
+    # Test the default policy on maps of spectra and maps of shifts
+    wrapper_instance.add_PSD(np.random.random((10, 20, 128)), parent_group="Brillouin/Measure", name="PSD")
+    wrapper_instance.add_treated_data(parent_group="Brillouin/Measure", name_group="Treat_0", shift=np.random.random((100, 200)))
+    with h5py.File(wrapper_instance.filepath, 'r') as f:
+        assert f["Brillouin/Measure/PSD"].chunks == (1, 8, 128)
+        assert f["Brillouin/Measure/PSD"].compression == "gzip"
+        assert f["Brillouin/Measure/PSD"].shuffle
+        assert f["Brillouin/Measure/Treat_0/Shift"].chunks == (64, 64)
+        assert "HDF5_BLS_storage_policy" in f["Brillouin"].attrs
+    assert "HDF5_BLS_storage_policy" not in wrapper_instance.get_attributes()
+    assert "HDF5_BLS_storage_policy" not in wrapper_instance.get_attributes("Brillouin/Measure/PSD")
+    
+    # Test changing the policy
+    try: wrapper_instance.set_storage_policy("PSD", chunks="Wrong")
+    except WrapperError_ArgumentType: pass
+    wrapper_instance.set_storage_policy("PSD", chunks="Spectrum", compression="lzf", spectra_per_chunk=1)
+    wrapper_instance.add_PSD(np.random.random((10, 20, 128)), parent_group="Brillouin/Measure2", name="PSD")
+    wrapper_instance.copy_dataset("Brillouin/Measure2/PSD", "Brillouin/Measure/Treat_0")
+    with h5py.File(wrapper_instance.filepath, 'r') as f:
+        assert f["Brillouin/Measure2/PSD"].chunks == (1, 1, 128)
+        assert f["Brillouin/Measure2/PSD"].compression == "lzf"
+        assert f["Brillouin/Measure/Treat_0/PSD"].compression == "lzf"
+    assert np.array_equal(np.asarray(wrapper_instance["Brillouin/Measure/Treat_0/PSD"]), np.asarray(wrapper_instance["Brillouin/Measure2/PSD"]))
+
+    os.remove(wrapper_instance.filepath)
+
+# Test the session mode sharing a single file handle
+def test_session(wrapper_instance: Wrapper):
+    # Setup: Create the file structure
+    with h5py.File(wrapper_instance.filepath, 'a') as f:
+        group = f["Brillouin"].create_group("Group1")
+        group.attrs["Brillouin_type"] = "Measure"
+        ds = group.create_dataset("Raw data", data=np.arange(5))
+        ds.attrs["Brillouin_type"] = "Raw_data"
+
+    # Several operations reuse the same handle
+    with wrapper_instance.session() as wrp:
+        assert wrp is wrapper_instance
+        handle = wrp._session_file
+        for i in range(10):
+            wrp.add_attributes({f"MEASURE.Attribute_{i}": str(i)}, parent_group="Brillouin/Group1")
+        assert wrp.get_attributes("Brillouin/Group1")["MEASURE.Attribute_9"] == "9"
+        assert np.array_equal(wrp["Brillouin/Group1/Raw data"], np.arange(5))
+        with wrp.session():
+            assert wrp._session_file is handle
+        assert wrp.get_structure()["Brillouin"]["Group1"]["Brillouin_type"] == "Measure"
+        with pytest.raises(WrapperError):
+            wrp.repack(force_repack=True)
+    assert wrapper_instance._session_file is None
+    
+    # The changes are written to the file
+    with h5py.File(wrapper_instance.filepath, 'r') as f:
+        assert f["Brillouin/Group1"].attrs["MEASURE.Attribute_9"] == "9"
+    
+    # A read-only session does not allow modifications
+    with wrapper_instance.session('r') as wrp:
+        with pytest.raises(WrapperError):
+            wrp.add_attributes({"MEASURE.Sample": "Water"}, parent_group="Brillouin/Group1")
+        with pytest.raises(WrapperError):
+            with wrp.session('a'):
+                pass
+    
+    # The file is closed even if an error is raised in the block
+    with pytest.raises(ValueError):
+        with wrapper_instance.session():
+            raise ValueError
+    assert wrapper_instance._session_file is None
+
+    os.remove(wrapper_instance.filepath)
+
 # Test adding abscissa data
 def test_add_abscissa(wrapper_instance: Wrapper):
     # Setup: Create the file structure
@@ -784,7 +784,7 @@ class DataProcessingWindow_Analyse(QDialog):
         for spinbox in self.dimension_spinboxes:
             spinbox.setEnabled(True)
             y_selected = y_selected[int(spinbox.value())]
-        self.processing_object.y = y_selected
+        self.processing_object.y = np.asarray(y_selected)
         self.plot_spectrum()
 
     def plot_spectrum(self, force_clear = False):
@@ -1588,7 +1588,7 @@ class DataProcessingWindow_Treat(QDialog):
         for spinbox in self.dimension_spinboxes:
             spinbox.setEnabled(True)
             y_selected = y_selected[int(spinbox.value())]
-        self.processing_object.y = y_selected
+        self.processing_object.y = np.asarray(y_selected)
         self.plot_spectrum()
 
     def plot_spectrum(self, force_clear = False):
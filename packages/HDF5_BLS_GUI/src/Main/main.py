@@ -717,8 +717,8 @@ class MainWindow(QMainWindow):
             extension, _ = MessageBoxMultipleChoice.get_choice("Please choose the file extension to add from the directories.", extensions)
         filepath = filepaths
 
-        # First check that we have everything we need to add the data
-        for f in os.listdir(filepath):
+        # First check on one file that we have everything we need to add the data
+        for f in sorted(os.listdir(filepath)):
             if not os.path.isdir(os.path.join(filepath, f)) and f.split(".")[-1] == extension:
                 path = os.path.join(filepath, f)
                 try:
@@ -731,26 +731,22 @@ class MainWindow(QMainWindow):
                     except LoadError_parameters as e:
                         QMessageBox.warning(self, "Error", "To do: parameters are needed to import the data.")
                         return
-                    break
                 except LoadError_parameters as e:
                         QMessageBox.warning(self, "Error", "To do: parameters are needed to import the data.")
-
-        # Then go through the directory and add the data
-        for f in os.listdir(filepath):
-            if not os.path.isdir(os.path.join(filepath, f)) and f.split(".")[-1] == extension:
-                path = os.path.join(filepath, f)
-                self.add_data(filepaths = path, 
-                              parent_item = parent_item, 
-                              update_treeview=False,
-                              creator = creator,
-                              parameters = parameters)
-            elif os.path.isdir(os.path.join(filepath, f)):
-                self.add_directory(filepaths = [os.path.join(filepath, f)], 
-                                   parent_item = parent_item, 
-                                   update_treeview = False, 
-                                   extension=extension,
-                                   creator = creator,
-                                   parameters = parameters)
+                break
+
+        # Then import all the files of the directory and of its sub-directories at once
+        report = self.wrp.import_directory(filepath, 
+                                           parent_group = parent_item.data(Qt.UserRole), 
+                                           extension = extension, 
+                                           creator = creator, 
+                                           parameters = parameters, 
+                                           workers = os.cpu_count() or 1)
+        for path, result in report.items():
+            if isinstance(result, Exception):
+                self.log.append(f"<i>{path}</i> could not be imported: {result}")
+            else:
+                self.log.append(f"<i>{path}</i> imported")
 
         index_parent_item = self.architecture_file_model.indexFromItem(parent_item)
         if update_treeview: 
@@ -919,9 +915,8 @@ class MainWindow(QMainWindow):
                     return [parent_group]
                 else:
                     up_group = "/".join(parent_group.split("/")[:-1])
-                    for elt in self.wrp.get_children_elements(path=up_group):
-                        if self.wrp.get_type(path=f"{up_group}/{elt}", return_Brillouin_type=True) in types:
-                            return [f"{up_group}/{elt}"]
+                    for elt in self.wrp.get_children_elements(path=up_group, Brillouin_type=types):
+                        return [f"{up_group}/{elt}"]
                     return []
 
         # Get the paths to all selected items in the treeview
@@ -966,11 +961,12 @@ class MainWindow(QMainWindow):
         frequency = data_process.x
         algorithm = data_process.silent_return_string_algorithm()
 
-        # Add frequency and algorithm to the selected elements
-        for path, index, element in zip(paths, selected_indexes, elements):
-            self.wrp.add_frequency(frequency, parent_group=path, name="Frequency", overwrite=True)
-            self.wrp.add_attributes({"Process_PSD": algorithm}, parent_group=path, overwrite=True)
-            self.wrp.change_brillouin_type(path=element, brillouin_type="PSD")
+        # Add frequency and algorithm to the selected elements, keeping the file open for all of them
+        with self.wrp.session():
+            for path, index, element in zip(paths, selected_indexes, elements):
+                self.wrp.add_frequency(frequency, parent_group=path, name="Frequency", overwrite=True)
+                self.wrp.add_attributes({"Process_PSD": algorithm}, parent_group=path, overwrite=True)
+                self.wrp.change_brillouin_type(path=element, brillouin_type="PSD")
 
         # Get the row and column of the last element and expand the treeview to it
         self.update_treeview()
@@ -995,9 +991,8 @@ class MainWindow(QMainWindow):
                     return [parent_group]
                 else:
                     up_group = "/".join(parent_group.split("/")[:-1])
-                    for elt in self.wrp.get_children_elements(path=up_group):
-                        if self.wrp.get_type(path=f"{up_group}/{elt}", return_Brillouin_type=True) in types:
-                            return [f"{up_group}/{elt}"]
+                    for elt in self.wrp.get_children_elements(path=up_group, Brillouin_type=types):
+                        return [f"{up_group}/{elt}"]
                     return []
 
         # Get the paths to all selected items in the treeview
@@ -1014,11 +1009,10 @@ class MainWindow(QMainWindow):
         if self.wrp.get_type(path = path) == HDF5_dataset:
             path = "/".join(path.split("/")[-1])
         psd, freq = '', ''
-        for child in self.wrp.get_children_elements(path = path):
-            if self.wrp.get_type(path = f"{path}/{child}", return_Brillouin_type = True) == "Frequency":
-                freq = f"{path}/{child}"
-            elif self.wrp.get_type(path = f"{path}/{child}", return_Brillouin_type = True) == "PSD":
-                psd = f"{path}/{child}"
+        for child in self.wrp.get_children_elements(path = path, Brillouin_type = "Frequency"):
+            freq = f"{path}/{child}"
+        for child in self.wrp.get_children_elements(path = path, Brillouin_type = "PSD"):
+            psd = f"{path}/{child}"
         if len(psd)*len(freq) == 0:
             QMessageBox.warning(self, "No PSD or Frequency array", "It seems there either is no PSD to use or no Frequency array associated to it.")
             return
@@ -1,7 +1,8 @@
 from .general import Analyse_general
+from .calibration import quadratic_calibration
 
 import numpy as np
-from scipy.optimize import curve_fit, minimize
+from scipy.optimize import curve_fit
 
 
 class Analyse_VIPA(Analyse_general):
@@ -115,6 +116,7 @@ class Analyse_VIPA(Analyse_general):
     def interpolate_elastic_inelastic(self, shift: float = None, FSR: float = None):
         """
         Uses the elastic peaks, and the positions of the Brillouin peaks on the different orders to obtain a frequency axis by interpolating the position of the peaks with a quadratic polynomial. The user can either enter a value for the shift or the FSR, or both. The shift value is used to calibrate the frequency axis using known values of shifts when using a calibration sample to obtain the frequency axis. The FSR value is used to calibrate the frequency axis using a known values of FSR for the VIPA.
+        The coefficients of the polynomial are obtained exactly with a linear least-squares solver (see quadratic_calibration).
 
         Parameters
         ----------  
@@ -197,10 +199,6 @@ class Analyse_VIPA(Analyse_general):
                     i+=1
             return A, B, C
 
-        def error(params):
-            a, b, c = params
-            return np.sum((a * A + b * B + c + C) ** 2)
-
         if shift is None and FSR is None:
             return
         
@@ -232,7 +230,7 @@ class Analyse_VIPA(Analyse_general):
                     if E[1]-E[0] > E[2]-E[1]:
                         a_max = k*FSR/(p1**2-p0**2)
                     else:
-                        a_min = k*FSR/((p1-p0)(p0+p1-2*len(self.x)))
+                        a_min = k*FSR/((p1-p0)*(p0+p1-2*len(self.x)))
                 elif len(S)>= len(AS):
                     p0 = S[0]
                     p1 = S[-1]
@@ -240,7 +238,7 @@ class Analyse_VIPA(Analyse_general):
                     if S[1]-S[0] > S[2]-S[1]:
                         a_max = k*FSR/(p1**2-p0**2)
                     else:
-                        a_min = k*FSR/((p1-p0)(p0+p1-2*len(self.x)))
+                        a_min = k*FSR/((p1-p0)*(p0+p1-2*len(self.x)))
                 else:
                     p0 = AS[0]
                     p1 = AS[-1]
@@ -248,24 +246,17 @@ class Analyse_VIPA(Analyse_general):
                     if AS[1]-AS[0] > AS[2]-AS[1]:
                         a_max = k*FSR/(p1**2-p0**2)
                     else:
-                        a_min = k*FSR/((p1-p0)(p0+p1-2*len(self.x)))
+                        a_min = k*FSR/((p1-p0)*(p0+p1-2*len(self.x)))
 
         AS_order, S_order = get_order(AS, S, E)
         
         A, B, C = create_matrices(AS, S, E, AS_order, S_order)
 
-        # Converting the lists to numpy arrays
-        A = np.array(A)
-        B = np.array(B)
-        C = np.array(C)
-
-        # Defining the minimization function
+        # Solve the least-squares problem, starting from the same guesses as an iterative minimization when the conditions don't determine the coefficients
         if FSR is None:
-            result = minimize(error, [0, 1, 0])
+            a, b, c = quadratic_calibration(A, B, C, guess = [0, 1, 0])
         else: 
-            result = minimize(error, [0, max(max(AS_order), max(S_order))*FSR/self.x.size, 0], bounds=[(a_min, a_max), (-np.inf, np.inf), (-np.inf, np.inf)])
-        
-        a, b, c = result.x
+            a, b, c = quadratic_calibration(A, B, C, guess = [0, max(max(AS_order), max(S_order))*FSR/self.x.size, 0], bounds = (a_min, a_max))
 
         # Create the new x axis corresponding to the frequency axis fitted
         self.x = a*self.x**2 + b*self.x + c
@@ -381,6 +372,7 @@ class Analyse_VIPA(Analyse_general):
     def interpolate_elastic(self, FSR: float = None):
         """
         Uses positions of the elastic peaks on the different orders, to obtain a frequency axis by interpolating the position of the peaks with a quadratic polynomial. The user has to enter a value for the FSR to calibrate the frequency axis.
+        The coefficients of the polynomial are obtained exactly with a linear least-squares solver (see quadratic_calibration).
 
         Parameters
         ----------  
@@ -398,10 +390,6 @@ class Analyse_VIPA(Analyse_general):
                 C.append(-FSR)
             return A, B, C
 
-        def error(params):
-            a, b, c = params
-            return np.sum((a * A + b * B + c + C) ** 2)
-
         if FSR is None:
             return
         
@@ -415,15 +403,9 @@ class Analyse_VIPA(Analyse_general):
         E.sort()
 
         A, B, C = create_matrices(E)
-       
-        # Converting the lists to numpy arrays
-        A = np.array(A)
-        B = np.array(B)
-        C = np.array(C)
-        # Defining the minimization function
-        result = minimize(error, [0, len(E)*FSR/self.x.size, 0], method='SLSQP')
-        
-        a, b, c = result.x
+
+        # Solve the least-squares problem, starting from the same guess as an iterative minimization when the conditions don't determine the coefficients
+        a, b, c = quadratic_calibration(A, B, C, guess = [0, len(E)*FSR/self.x.size, 0])
 
         # Now we can create the new x axis
         self.x = a*self.x**2 + b*self.x + c
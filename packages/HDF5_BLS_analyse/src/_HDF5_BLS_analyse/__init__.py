@@ -1,3 +1,6 @@
+from .algorithm_plan import AlgorithmPlan
 from .analyse_backend import Analyse_backend
 from .general import Analyse_general
-from .VIPA import Analyse_VIPA
\ No newline at end of file
+from .calibration import quadratic_calibration
+from .VIPA import Analyse_VIPA
+from .batch_conversion import convert_raw_data, convert_raw_data_files
@@ -35,6 +35,7 @@ class Analyse_backend:
     """
     _record_algorithm = True # This attribute is used to record the steps of the analysis
     _save_history = True # This attribute is used to save the effects of the steps of the analysis on the data
+    _function_specs = {} # The description and default parameters of the public functions of the class, filled when a class inheriting from Analyse_backend is defined
 
     def __init__(self, y: np.ndarray, x: np.ndarray = None):
         """Initializes the class with the most basic attributes: the ordinates and abscissa of the data.
@@ -56,8 +57,39 @@ class Analyse_backend:
         self._history_base = {"x": x, "y": y}
         self._algorithm = {}
 
+    def __init_subclass__(cls, **kwargs):
+        """Stores the description and the default parameters of the public functions of a new class inheriting from Analyse_backend, so that they are not extracted from the docstring and the signature of the functions each time they are called.
+        """
+        super().__init_subclass__(**kwargs)
+        cls._function_specs = {}
+        for name in dir(cls):
+            if not name.startswith('_') and not name.startswith('silent_') and callable(getattr(cls, name)):
+                cls._function_specs[name] = Analyse_backend._extract_function_spec(getattr(cls, name))
+
+    @staticmethod
+    def _extract_function_spec(function):
+        """Extracts the description of a function from the first paragraph of its docstring and its default parameters from its signature.
+
+        Parameters
+        ----------
+        function : callable
+            The function to inspect.
+
+        Returns
+        -------
+        2-tuple
+            The description of the function and the dictionary of its default parameters.
+        """
+        docstring = inspect.getdoc(function)
+        description = docstring.split('\n\n')[0] if docstring else ""
+        signature = inspect.signature(function)
+        default_kwargs = {
+            k: v.default for k, v in signature.parameters.items() if v.default is not inspect.Parameter.empty
+        }
+        return description, default_kwargs
+
     def __getattribute__(self, name: str):
-        """This function is used to override the __getattribute__ function of the class. It is used to keep track of the history of the algorithm, its impact on the classes attributes, and to store the algorithm in the _algorithm attribute so as to be able to save it or run it later.
+        """This function is used to override the __getattribute__ function of the class. It is used to keep track of the history of the algorithm, its impact on the classes attributes, and to store the algorithm in the _algorithm attribute so as to be able to save it or run it later. When the algorithm is neither recorded nor stored in the history, the functions are returned as they are so that running them costs nothing more than the function itself.
 
         Parameters
         ----------
@@ -68,65 +100,67 @@ class Analyse_backend:
         -------
         The result of the function call.
         """
-        # If the attribute is a function, we call it with the given arguments
         attribute = super().__getattribute__(name)
-        if callable(attribute) and not name.startswith('_') and not name.startswith('silent_'):
-            def wrapper(*args, **kwargs):
-                # Extract the description of the function from the docstring
-                docstring = inspect.getdoc(attribute)
-                description = docstring.split('\n\n')[0] if docstring else ""
-
-                # Get the default parameter values from the function signature
-                signature = inspect.signature(attribute)
-                default_kwargs = {
-                    k: v.default for k, v in signature.parameters.items() if v.default is not inspect.Parameter.empty
-                }
-
-                # Merge default kwargs with provided kwargs
-                merged_kwargs = {**default_kwargs, **kwargs}
-
-                # If the attribute _record_algorithm is True, add the function to the algorithm
-                if self._record_algorithm:
-                    self._algorithm["functions"].append({
-                        "function": name,
-                        "parameters": merged_kwargs,
-                        "description": description
-                    })
-
-                # Store the attributes of the class in memory to compare them to the ones after the function is run
-                if self._save_history:
-                    temp_x = self.x.copy()
-                    temp_y = self.y.copy()
-                    temp_points = [[p, tp] for [p, tp] in self.points]
-                    temp_windows = [[s, e] for [s, e] in self.windows]
-
-                # Run the function
-                result = attribute(*args, **kwargs)
-
-                # If the attribute _save_history is True, compare the attributes of the class with the ones stored in memory and update the history if needed
-                if self._save_history:
-                    self._history.append({"function": name})
-                    if not np.all(self.x == temp_x):
-                        self._history[-1]["x"] = self.x.copy().tolist()
-                    if not np.all(self.y == temp_y):
-                        self._history[-1]["y"] = self.y.copy().tolist()
-                    if self.points != temp_points:
-                        if self.points == []:
-                            self._history[-1]["points"] = []
-                        else:
-                            self._history[-1]["points"] = self.points.copy()
-                    if self.windows != temp_windows:
-                        if self.windows == []:
-                            self._history[-1]["windows"] = []
-                        else:    
-                            self._history[-1]["windows"] = self.windows.copy()
-                    if len(self._history) == 1:
-                        # This is to store the initial value of the x and y arrays
-                        self._history[0].update(self._history_base)
-                
-                return result
-            return wrapper
-        return attribute
+
+        # Attributes that are not functions, as well as private and silent functions, are returned directly
+        if not callable(attribute) or name[0] == '_' or name.startswith('silent_'):
+            return attribute
+
+        # If the algorithm is not recorded and the history is not stored, the function is run directly
+        if not self._record_algorithm and not self._save_history:
+            return attribute
+
+        # Retrieve the description and the default parameters of the function, stored when the class was defined
+        spec = type(self)._function_specs.get(name)
+        if spec is None:
+            spec = Analyse_backend._extract_function_spec(attribute)
+        description, default_kwargs = spec
+
+        def wrapper(*args, **kwargs):
+            # Merge default kwargs with provided kwargs
+            merged_kwargs = {**default_kwargs, **kwargs}
+
+            # If the attribute _record_algorithm is True, add the function to the algorithm
+            if self._record_algorithm:
+                self._algorithm["functions"].append({
+                    "function": name,
+                    "parameters": merged_kwargs,
+                    "description": description
+                })
+
+            # Store the attributes of the class in memory to compare them to the ones after the function is run
+            if self._save_history:
+                temp_x = self.x.copy()
+                temp_y = self.y.copy()
+                temp_points = [[p, tp] for [p, tp] in self.points]
+                temp_windows = [[s, e] for [s, e] in self.windows]
+
+            # Run the function
+            result = attribute(*args, **kwargs)
+
+            # If the attribute _save_history is True, compare the attributes of the class with the ones stored in memory and update the history if needed
+            if self._save_history:
+                self._history.append({"function": name})
+                if not np.all(self.x == temp_x):
+                    self._history[-1]["x"] = self.x.copy().tolist()
+                if not np.all(self.y == temp_y):
+                    self._history[-1]["y"] = self.y.copy().tolist()
+                if self.points != temp_points:
+                    if self.points == []:
+                        self._history[-1]["points"] = []
+                    else:
+                        self._history[-1]["points"] = self.points.copy()
+                if self.windows != temp_windows:
+                    if self.windows == []:
+                        self._history[-1]["windows"] = []
+                    else:    
+                        self._history[-1]["windows"] = self.windows.copy()
+                if len(self._history) == 1:
+                    # This is to store the initial value of the x and y arrays
+                    self._history[0].update(self._history_base)
+            
+            return result
+        return wrapper
 
     def silent_create_algorithm(self, algorithm_name: str ="Unnamed Algorithm", version: str ="0.1", author: str = "Unknown", description: str = ""):
         """Creates a new JSON algorithm with the given name, version, author and description. This algorithm is stored in the _algorithm attribute. This function also creates an empty history. for the software.
@@ -218,13 +252,19 @@ class Analyse_backend:
         elif len(self._history) >= step:
             self._history = self._history[:step]
 
-    def silent_run_algorithm(self, step: int = None):
-        """Runs the algorithm stored in the _algorithm attribute of the class up to the given step (included). If no step is given, the algorithm is run up to the last step.
+    def silent_run_algorithm(self, step: int = None, plan = None, x: np.ndarray = None, y: np.ndarray = None):
+        """Runs the algorithm stored in the _algorithm attribute of the class up to the given step (included). If no step is given, the algorithm is run up to the last step. Alternatively, an algorithm compiled with AlgorithmPlan can be run on new data, for example to apply a same algorithm to all the frames of a raw VIPA acquisition.
 
         Parameters
         ----------
         step : int, optional
             The number of the function up to which the algorithm has to be run (included), by default None means that all the steps of the algorithm are run.
+        plan : AlgorithmPlan, optional
+            A compiled algorithm. If given, the points and windows are reinitialized and all the steps of the plan are run without storing their effects in the _history attribute, by default None
+        x : np.ndarray, optional
+            The abscissa of the data the plan is run on, by default None means that the initial abscissa of the data is used. Only used with a plan.
+        y : np.ndarray, optional
+            The ordinates of the data the plan is run on, by default None means that the initial ordinates of the data are used. Only used with a plan.
         """
         def run_step_save_history(self, step):
             """Runs the algorithm stored in the _algorithm attribute of the class. This function can also run up to a specific step of the algorithm.
@@ -237,8 +277,8 @@ class Analyse_backend:
             self._save_history = True
             function_name = self._algorithm["functions"][step]["function"]
             parameters = self._algorithm["functions"][step]["parameters"]
-            if hasattr(self, function_name) and callable(getattr(self, function_name)):
-                func_to_call = getattr(self, function_name)
+            func_to_call = getattr(self, function_name, None)
+            if callable(func_to_call):
                 func_to_call(**parameters)
                         
         def extract_parameters_from_history(self, step):
@@ -261,6 +301,23 @@ class Analyse_backend:
                 if "windows" in hist_step.keys():
                     self.windows = hist_step["windows"].copy()
 
+        # If a compiled plan is given, run it on the given data without storing the history
+        if plan is not None:
+            self.points = []
+            self.windows = []
+            self.y = self._history_base["y"] if y is None else y
+            if x is None:
+                x = self._history_base["x"]
+            self.x = np.arange(self.y.size) if x is None else x
+
+            save_history = self._save_history
+            self._save_history = False
+            try:
+                plan.run()
+            finally:
+                self._save_history = save_history
+            return
+
         # If the step is None, set the step to the length of the functions list
         if step is None:
             step = len(self._algorithm["functions"])-1
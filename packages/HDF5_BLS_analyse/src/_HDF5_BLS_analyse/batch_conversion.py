@@ -0,0 +1,136 @@
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .algorithm_plan import AlgorithmPlan
+from .VIPA import Analyse_VIPA
+
+def convert_raw_data(wrapper, algorithm, parent_group = "Brillouin", analyser = Analyse_VIPA, block_size = 64):
+    """Converts all the "Raw_data" datasets located under a group of a wrapper to PSD, using a saved "Process_PSD" algorithm. The algorithm is compiled once and run on the average spectrum of each dataset to obtain its frequency axis. As in the "Get PSD" action of the GUI, the frequency axis is stored as a "Frequency" dataset next to the raw data, the algorithm is stored in the "Process_PSD" attribute of their group and the raw data become the PSD. The file is kept open during the whole conversion.
+
+    Parameters
+    ----------
+    wrapper : Wrapper
+        The wrapper of the file storing the raw data.
+    algorithm : str or dict
+        The algorithm to apply: either the path to a JSON algorithm (for example one of "data/algorithms/Analysis/VIPA spectrometer"), the JSON string of an algorithm or the algorithm itself.
+    parent_group : str, optional
+        The path to the group under which the "Raw_data" datasets are converted, by default "Brillouin".
+    analyser : class, optional
+        The class of the analysis object the algorithm is written for, by default Analyse_VIPA.
+    block_size : int, optional
+        The number of elements of the first dimension of the datasets read at once to compute their average spectrum, by default 64.
+
+    Returns
+    -------
+    list of str
+        The paths of the converted datasets.
+
+    Raises
+    ------
+    ValueError
+        If the algorithm doesn't match the functions of the analysis class.
+
+    Example
+    -------
+    >>> wrp = Wrapper("measures.h5")
+    >>> convert_raw_data(wrp, "data/algorithms/Analysis/VIPA spectrometer/MUW_PB_VIPA_FSR_Shift_v0.json", parent_group = "Brillouin/Sample")
+    """
+    def average_spectrum(path):
+        # Average all the spectra of the dataset, reading the dataset block by block along its first dimension
+        view = wrapper[path]
+        if view.ndim == 1:
+            return np.asarray(view, dtype = float)
+        total = np.zeros(view.shape[-1])
+        for start in range(0, view.shape[0], block_size):
+            block = np.asarray(view[start:start+block_size], dtype = float)
+            total += block.reshape(-1, view.shape[-1]).sum(axis = 0)
+        return total / (view.size // view.shape[-1])
+
+    algorithm = load_algorithm(algorithm)
+    algorithm_str = json.dumps(algorithm, indent = 4)
+
+    converted = []
+    with wrapper.session('a'):
+        processing, plan = None, None
+        for path in wrapper.get_descendants(parent_group, Brillouin_type = "Raw_data"):
+            y = average_spectrum(path)
+            x = np.arange(y.size)
+
+            # Compile the algorithm on the first dataset, the plan is then run on all the datasets
+            if plan is None:
+                processing = analyser(x = x, y = y)
+                processing.silent_open_algorithm(algorithm_str = algorithm_str)
+                plan = AlgorithmPlan(processing)
+            processing.silent_run_algorithm(plan = plan, x = x, y = y)
+
+            # Store the frequency axis and the algorithm, and mark the raw data as PSD
+            group = "/".join(path.split("/")[:-1])
+            wrapper.add_frequency(np.asarray(processing.x), parent_group = group, name = "Frequency", overwrite = True)
+            wrapper.add_attributes({"Process_PSD": algorithm_str}, parent_group = group, overwrite = True)
+            wrapper.change_brillouin_type(path = path, brillouin_type = "PSD")
+            converted.append(path)
+    return converted
+
+def convert_raw_data_files(filepaths, algorithm, parent_group = "Brillouin", analyser = Analyse_VIPA, block_size = 64, workers = 1):
+    """Converts all the "Raw_data" datasets located under a same group of several HDF5 files to PSD with convert_raw_data. The files are distributed on a pool of processes, each process opening the files it converts only once.
+
+    Parameters
+    ----------
+    filepaths : list of str
+        The paths to the HDF5 files to convert.
+    algorithm : str or dict
+        The algorithm to apply: either the path to a JSON algorithm, the JSON string of an algorithm or the algorithm itself.
+    parent_group : str, optional
+        The path to the group under which the "Raw_data" datasets are converted in each file, by default "Brillouin".
+    analyser : class, optional
+        The class of the analysis object the algorithm is written for, by default Analyse_VIPA.
+    block_size : int, optional
+        The number of elements of the first dimension of the datasets read at once to compute their average spectrum, by default 64.
+    workers : int, optional
+        The number of processes converting the files, by default 1 converts the files one after the other in the current process.
+
+    Returns
+    -------
+    dict
+        The paths of the converted datasets of each file, stored with the path of the file as key.
+
+    Example
+    -------
+    >>> convert_raw_data_files(glob.glob("measures/*.h5"), "MUW_PB_VIPA_FSR_Shift_v0.json", workers = 4)
+    """
+    algorithm = load_algorithm(algorithm)
+
+    if workers <= 1 or len(filepaths) <= 1:
+        return {filepath: _convert_file(filepath, algorithm, parent_group, analyser, block_size) for filepath in filepaths}
+
+    with ProcessPoolExecutor(max_workers = min(workers, len(filepaths))) as executor:
+        futures = {filepath: executor.submit(_convert_file, filepath, algorithm, parent_group, analyser, block_size) for filepath in filepaths}
+        return {filepath: future.result() for filepath, future in futures.items()}
+
+def load_algorithm(algorithm):
+    """Returns an algorithm given either as the path to a JSON file, as a JSON string or as a dictionary.
+
+    Parameters
+    ----------
+    algorithm : str or dict
+        The algorithm.
+
+    Returns
+    -------
+    dict
+        The algorithm.
+    """
+    if isinstance(algorithm, dict):
+        return algorithm
+    if os.path.isfile(algorithm):
+        with open(algorithm, 'r') as f:
+            return json.load(f)
+    return json.loads(algorithm)
+
+def _convert_file(filepath, algorithm, parent_group, analyser, block_size):
+    # The wrapper package is only needed when files are converted from their path
+    from HDF5_BLS import Wrapper
+
+    return convert_raw_data(Wrapper(filepath), algorithm, parent_group = parent_group, analyser = analyser, block_size = block_size)
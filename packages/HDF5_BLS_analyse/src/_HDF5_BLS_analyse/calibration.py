@@ -0,0 +1,53 @@
+import numpy as np
+
+def quadratic_calibration(A, B, C, guess = (0, 0, 0), bounds = (-np.inf, np.inf)):
+    """Computes the coefficients (a, b, c) of the quadratic frequency axes a*x**2 + b*x + c from conditions on the frequencies of the peaks, each condition being written a*A + b*B + C = 0. The conditions are differences of frequencies (for example the distance between two neighboring elastic peaks being one FSR), in which the constant c cancels: a and b are obtained by minimizing the sum of squares sum((a*A + b*B + C)**2) and c is kept to its guess. As the sum of squares is linear in (a, b), it is minimized exactly with a linear least-squares solver instead of an iterative optimization. Several calibrations (for example one per frame of an acquisition) can be computed at once by giving arrays with leading dimensions, the last dimension holding the conditions of each calibration.
+
+    Parameters
+    ----------
+    A : array
+        The coefficients of a in the conditions, of shape (..., N_conditions). Conditions set to NaN are ignored, so that calibrations with different numbers of conditions can be computed at once.
+    B : array
+        The coefficients of b in the conditions, of shape (..., N_conditions)
+    C : array
+        The constant terms of the conditions, of shape (..., N_conditions)
+    guess : array, optional
+        The guess of the coefficients (a, b, c), of shape (..., 3). When the conditions don't determine a and b (for example with only two elastic peaks), the solution closest to the guess is returned, as an iterative minimization started from the guess would. By default (0, 0, 0).
+    bounds : 2-tuple of float or array, optional
+        The lower and upper bounds of a, by default (-np.inf, np.inf) means that a is not bounded. As the sum of squares is a convex quadratic function of a once minimized on b, the bounded solution is the one obtained with a set to the exceeded bound.
+
+    Returns
+    -------
+    np.ndarray
+        The coefficients (a, b, c) of each calibration, of shape (..., 3)
+
+    Example
+    -------
+    >>> # Elastic peaks of shape (N_frames, N_orders), one FSR apart
+    >>> params = quadratic_calibration(E[:, 1:]**2 - E[:, :-1]**2, E[:, 1:] - E[:, :-1], np.full(E[:, 1:].shape, -FSR))
+    """
+    def solve(X, y, p0):
+        # Least-squares solution closest to the guess, obtained with the pseudo-inverse of each system
+        residual = y - np.einsum("...ij,...j->...i", X, p0)
+        return p0 + np.einsum("...ij,...j->...i", np.linalg.pinv(X), residual)
+
+    A, B, C = np.broadcast_arrays(*(np.asarray(v, dtype = float) for v in (A, B, C)))
+
+    # Build the linear systems, the ignored conditions being replaced by empty rows
+    valid = ~(np.isnan(A) | np.isnan(B) | np.isnan(C))
+    X = np.where(valid[..., None], np.stack([A, B], axis = -1), 0)
+    y = np.where(valid, -C, 0)
+    guess = np.broadcast_to(np.asarray(guess, dtype = float), X.shape[:-2] + (3,))
+
+    # The columns are scaled to a unit norm so that the pseudo-inverse is computed on a well conditioned system, the guess being scaled accordingly
+    scale = np.linalg.norm(X, axis = -2)
+    scale = np.where(scale > 0, scale, 1)
+    ab = solve(X / scale[..., None, :], y, guess[..., :2] * scale) / scale
+
+    # If a exceeds its bounds, set it to the exceeded bound and solve the system again on b
+    a = np.clip(ab[..., 0], bounds[0], bounds[1])
+    bounded = a != ab[..., 0]
+    if np.any(bounded):
+        b = solve(X[..., 1:] / scale[..., None, 1:], y - a[..., None] * X[..., 0], guess[..., 1:2] * scale[..., 1:]) / scale[..., 1:]
+        ab = np.where(bounded[..., None], np.concatenate([a[..., None], b], axis = -1), ab)
+    return np.concatenate([ab, guess[..., 2:]], axis = -1)
@@ -0,0 +1,72 @@
+import json
+import pytest
+import numpy as np
+from HDF5_BLS_analyse import Analyse_VIPA, convert_raw_data, convert_raw_data_files
+
+FSR = 15
+
+# Returns a Process_PSD algorithm calibrating the frequency axis on three elastic peaks one FSR apart
+def create_algorithm(elastic):
+    functions = [{"function": "add_point", "parameters": {"position_center_window": float(p), "window_width": 8.0, "type_pnt": "Elastic"}} for p in elastic]
+    functions.append({"function": "interpolate_elastic", "parameters": {"FSR": FSR}})
+    return {"name": "Test", "version": "0.0", "author": "None", "description": "Calibration on three elastic peaks", "functions": functions}
+
+# Returns raw VIPA spectra of a given shape, with elastic peaks one FSR apart on a quadratic frequency axis, together with the pixels of the elastic peaks
+def create_raw_data(shape, seed):
+    rng = np.random.default_rng(seed)
+    a, b = 2e-4, 0.1
+    x = np.arange(256)
+    frequency = a*x**2 + b*x
+    elastic = np.array([(-b + np.sqrt(b**2 + 4*a*(k*FSR + 3))) / (2*a) for k in range(3)])
+    spectrum = sum(1 / (1 + ((frequency - a*p**2 - b*p) / 0.3)**2) for p in elastic)
+    return spectrum * rng.uniform(0.5, 1.5, shape + (1,)) + 0.01 * rng.random(shape + (x.size,)), elastic
+
+# Converts a raw dataset as the "Get PSD" action of the GUI does, running the algorithm on the average spectrum
+def convert_spectrum(raw, algorithm):
+    y = raw.reshape(-1, raw.shape[-1]).mean(axis = 0)
+    processing = Analyse_VIPA(x = np.arange(y.size), y = y)
+    processing.silent_open_algorithm(algorithm_str = json.dumps(algorithm))
+    processing.silent_run_algorithm()
+    return np.asarray(processing.x)
+
+# Creates a file with two measures of raw data
+def create_file(filepath):
+    Wrapper = pytest.importorskip("HDF5_BLS").Wrapper
+    wrapper = Wrapper(filepath = str(filepath))
+    raw_1, elastic = create_raw_data((5,), 0)
+    raw_2, _ = create_raw_data((2, 3), 1)
+    wrapper.add_raw_data(raw_1, parent_group = "Brillouin/Measure_1")
+    wrapper.add_raw_data(raw_2, parent_group = "Brillouin/Measure_2")
+    return wrapper, {"Brillouin/Measure_1/Raw data": raw_1, "Brillouin/Measure_2/Raw data": raw_2}, create_algorithm(elastic)
+
+# Test that the conversion of all the raw data of a file gives the frequency axes obtained by converting each dataset individually
+def test_convert_raw_data(tmp_path):
+    wrapper, raw, algorithm = create_file(tmp_path / "raw.h5")
+    converted = convert_raw_data(wrapper, algorithm, block_size = 2)
+    assert sorted(converted) == sorted(raw)
+    for path, data in raw.items():
+        group = path.rsplit("/", 1)[0]
+        assert wrapper.get_attributes(path)["Brillouin_type"] == "PSD"
+        assert np.array_equal(wrapper[path][()], data)
+        assert np.allclose(wrapper[group + "/Frequency"][()], convert_spectrum(data, algorithm), rtol = 1e-9, atol = 1e-9)
+        assert json.loads(wrapper.get_attributes(group)["Process_PSD"])["functions"] == algorithm["functions"]
+
+    # The frequency axis is calibrated
+    frequency = wrapper["Brillouin/Measure_1/Frequency"][()]
+    elastic = [function["parameters"]["position_center_window"] for function in algorithm["functions"][:3]]
+    assert np.allclose(np.diff(np.interp(elastic, np.arange(frequency.size), frequency)), FSR, atol = 0.1)
+
+# Test that the conversion of several files on a pool of processes gives the conversion of each file
+def test_convert_raw_data_files(tmp_path):
+    filepaths = []
+    for i in range(2):
+        _, raw, algorithm = create_file(tmp_path / f"raw_{i}.h5")
+        filepaths.append(str(tmp_path / f"raw_{i}.h5"))
+    converted = convert_raw_data_files(filepaths, algorithm, workers = 2)
+    assert sorted(converted) == sorted(filepaths)
+    Wrapper = pytest.importorskip("HDF5_BLS").Wrapper
+    for filepath in filepaths:
+        assert sorted(converted[filepath]) == sorted(raw)
+        wrapper = Wrapper(filepath = filepath)
+        for path, data in raw.items():
+            assert np.allclose(wrapper[path.rsplit("/", 1)[0] + "/Frequency"][()], convert_spectrum(data, algorithm), rtol = 1e-9, atol = 1e-9)
@@ -0,0 +1,66 @@
+import numpy as np
+from scipy.optimize import minimize
+from HDF5_BLS_analyse import quadratic_calibration
+
+# Returns the pixels of the elastic peaks of the orders k = 0, 1, ... of a spectrometer whose frequency axis is a*x**2 + b*x + c, one FSR apart
+def elastic_pixels(a, b, c, FSR, orders):
+    return np.array([(-b + np.sqrt(b**2 - 4*a*(c - k*FSR))) / (2*a) for k in range(orders)])
+
+# Returns the conditions of the elastic peaks E being one FSR apart
+def elastic_conditions(E, FSR):
+    return E[..., 1:]**2 - E[..., :-1]**2, E[..., 1:] - E[..., :-1], np.full(E[..., 1:].shape, -FSR)
+
+# Returns the sum of squares of the conditions minimized by the calibration
+def sum_of_squares(params, A, B, C):
+    return np.sum((params[0] * A + params[1] * B + C)**2)
+
+# Minimizes the sum of squares of the conditions iteratively as the previous implementation did, the constant c that cancels in the conditions being kept to its guess
+def minimize_calibration(A, B, C, guess, bounds = (-np.inf, np.inf)):
+    bounds = [(None if np.isinf(bounds[0]) else bounds[0], None if np.isinf(bounds[1]) else bounds[1]), (None, None)]
+    result = minimize(lambda params: sum_of_squares(params, A, B, C), guess[:2], bounds = bounds, method = "L-BFGS-B", options = {"ftol": 1e-15, "gtol": 1e-12, "maxiter": 10000})
+    return np.array([result.x[0], result.x[1], guess[2]])
+
+# Test that the coefficients of a known quadratic frequency axis are recovered from its elastic peaks
+def test_known_quadratic():
+    a, b, FSR = 2e-5, 5e-2, 30
+    E = elastic_pixels(a, b, -10, FSR, 4)
+    params = quadratic_calibration(*elastic_conditions(E, FSR), guess = [0, 4*FSR/1000, 0])
+    assert np.allclose(params, [a, b, 0], rtol = 1e-9, atol = 0)
+
+    # With only two elastic peaks, the condition is satisfied exactly by a solution that depends on the guess
+    A, B, C = elastic_conditions(E[:2], FSR)
+    for guess in [[0, 0.05, 0], [1e-5, 0.04, 2]]:
+        params = quadratic_calibration(A, B, C, guess = guess)
+        assert np.isclose(params[0] * A[0] + params[1] * B[0] + C[0], 0, atol = 1e-9)
+        assert params[2] == guess[2]
+
+# Test that the calibrations match the iterative minimization of the previous implementation, with and without bounds on a. The iterative minimization stops close to the minimum of the sum of squares, which is reached exactly by the linear least-squares solution
+def test_previous_implementation():
+    rng = np.random.default_rng(0)
+    FSR = 30
+    guess = np.array([0, 5*FSR/1000, 0])
+    for _ in range(10):
+        E = np.sort(elastic_pixels(rng.uniform(1e-5, 3e-5), rng.uniform(4e-2, 6e-2), -10, FSR, 5) + rng.normal(0, 0.5, 5))
+        A, B, C = elastic_conditions(E, FSR)
+        unbounded = quadratic_calibration(A, B, C, guess = guess)
+        assert np.allclose(unbounded[:2], np.linalg.lstsq(np.stack([A, B], axis = -1), -C, rcond = None)[0], rtol = 1e-9)
+        for bounds in [(-np.inf, np.inf), (unbounded[0] * 1.5, np.inf), (-np.inf, unbounded[0] / 2)]:
+            params = quadratic_calibration(A, B, C, guess = guess, bounds = bounds)
+            previous = minimize_calibration(A, B, C, guess, bounds)
+            assert bounds[0] <= params[0] <= bounds[1]
+            assert np.allclose(params, previous, rtol = 5e-3, atol = 0)
+            assert sum_of_squares(params, A, B, C) <= sum_of_squares(previous, A, B, C) * (1 + 1e-9)
+
+# Test that several calibrations are computed at once, the conditions set to NaN being ignored
+def test_batch_calibrations():
+    rng = np.random.default_rng(1)
+    FSR = 30
+    E = np.sort(np.array([elastic_pixels(2e-5, 5e-2, -10, FSR, 5) + rng.normal(0, 0.5, 5) for _ in range(6)]), axis = -1)
+    A, B, C = elastic_conditions(E, FSR)
+    A[2, -1] = np.nan
+    guess = [0, 5*FSR/1000, 0]
+    params = quadratic_calibration(A, B, C, guess = guess)
+    assert params.shape == (6, 3)
+    for i in range(6):
+        valid = ~np.isnan(A[i])
+        assert np.allclose(params[i], quadratic_calibration(A[i, valid], B[i, valid], C[i, valid], guess = guess))
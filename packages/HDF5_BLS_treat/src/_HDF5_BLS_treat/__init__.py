@@ -1,4 +1,8 @@
+from .algorithm_plan import AlgorithmPlan
 from .treat_backend import Treat_backend
-from .models import Models
+from .models import Models, ModelEntry, MODELS, register_model
 from .errors import TreatmentError
-from .treat import Treat
\ No newline at end of file
+from .batch_fit import batch_curve_fit
+from .frequency_index import FrequencyIndex
+from .impulse_response import ImpulseResponse
+from .treat import Treat
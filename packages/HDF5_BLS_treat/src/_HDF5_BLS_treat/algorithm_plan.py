@@ -0,0 +1,98 @@
+# This module is shared by HDF5_BLS_treat and HDF5_BLS_analyse, which are distributed independently: both packages hold the same copy of it, kept identical by the tests of HDF5_BLS_treat
+import inspect
+
+class AlgorithmPlan:
+    """
+    Algorithm compiled once to be replayed many times, typically on each spectrum of a PSD array (treatment) or on each frame of raw data acquired with the same spectrometer (analysis). When compiled, the functions of the algorithm are resolved into the bound methods of the treatment or analysis object and their parameters are checked against the signature of these methods. Running the plan then calls the methods directly, without looking them up by name, recording them in the algorithm or storing their effects in the history.
+
+    Attributes
+    ----------
+    backend: Treat_backend or Analyse_backend
+        The object the algorithm is run on.
+    steps: list of 3-tuple
+        The name, the bound method and the parameters of each step of the algorithm.
+
+    Example
+    -------
+    >>> plan = AlgorithmPlan(treat)
+    >>> for PSD in spectra:
+    >>>     treat.PSD_sample = PSD
+    >>>     plan.run()
+    >>> plan = AlgorithmPlan(analyser)
+    >>> for frame in frames:
+    >>>     analyser.silent_run_algorithm(plan = plan, y = frame)
+    """
+    def __init__(self, backend, algorithm = None, step = None):
+        """Compiles the algorithm up to the given step (included).
+
+        Parameters
+        ----------
+        backend : Treat_backend or Analyse_backend
+            The object the algorithm is run on.
+        algorithm : dict, optional
+            The algorithm to compile, by default None means that the algorithm stored in the _algorithm attribute of the backend is used.
+        step : int, optional
+            The number of the function up to which the algorithm is compiled (included), by default None means that all the steps of the algorithm are compiled.
+
+        Raises
+        ------
+        ValueError
+            If the step is out of the range of the functions of the algorithm or if the parameters of a step don't match the signature of its function.
+        """
+        if algorithm is None:
+            algorithm = backend._algorithm
+        functions = algorithm["functions"]
+
+        # Ensures that the step is within the range of the functions list, raise an error if not
+        if step is None:
+            step = len(functions)-1
+        if step < 0 or step >= len(functions):
+            raise ValueError(f"The step parameter has to be a positive integer smaller than the number of functions (here {len(functions)}, step = {step}).")
+
+        self.backend = backend
+        self.steps = []
+        for i, function in enumerate(functions[:step+1]):
+            name = function["function"]
+            parameters = dict(function["parameters"])
+
+            # The methods are retrieved without the recording wrapper of the backend. Functions that don't exist are skipped, as when the algorithm is run step by step
+            try:
+                method = object.__getattribute__(backend, name)
+            except AttributeError:
+                continue
+            if not callable(method):
+                continue
+
+            # Check the parameters once, so that an invalid algorithm fails before being run on any data
+            try:
+                inspect.signature(method).bind(**parameters)
+            except TypeError as e:
+                raise ValueError(f"The parameters of step {i} ({name}) don't match the function: {e}")
+
+            self.steps.append((name, method, parameters))
+
+    def set_parameters(self, function_name, **parameters):
+        """Updates the parameters of all the steps calling a given function.
+
+        Parameters
+        ----------
+        function_name : str
+            The name of the function whose parameters are updated.
+        **parameters
+            The new values of the parameters.
+        """
+        for name, _, step_parameters in self.steps:
+            if name == function_name:
+                step_parameters.update(parameters)
+
+    def run(self):
+        """Runs all the steps of the plan on the current state of the backend.
+        """
+        # The steps are not recorded in the algorithm while the plan is run
+        record_algorithm = self.backend._record_algorithm
+        self.backend._record_algorithm = False
+        try:
+            for _, method, parameters in self.steps:
+                method(**parameters)
+        finally:
+            self.backend._record_algorithm = record_algorithm
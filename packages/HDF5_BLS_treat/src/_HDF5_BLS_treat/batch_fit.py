@@ -0,0 +1,133 @@
+import numpy as np
+
+BOUND_STEP = 0.9 # Fraction of the distance to a bound covered by a parameter whose step crosses this bound
+
+def batch_curve_fit(f, xdata, ydata, p0, bounds = (-np.inf, np.inf), jac = None, max_iter = 200, ftol = 1e-8, xtol = 1e-8):
+    """Fits a same model to a batch of curves sharing the same abscissa with a vectorized Levenberg-Marquardt algorithm. All the curves are fitted at once: the jacobians, the normal equations and the steps are computed on arrays of shape (N_curves, ...) and each curve keeps its own damping parameter. Bounds are enforced by moving the parameters whose step would cross a bound close to this bound and solving the step of the other parameters again. The covariance matrix is estimated as in scipy.optimize.curve_fit (with absolute_sigma set to False).
+
+    Parameters
+    ----------
+    f : function
+        The vectorized model. It is called as f(xdata, params) where params is an array of shape (N_curves, N_params) and must return an array of shape (N_curves, len(xdata)).
+    xdata : array
+        The abscissa shared by all the curves, of shape (M,)
+    ydata : array
+        The curves to fit, of shape (N_curves, M)
+    p0 : array
+        The initial guesses, of shape (N_curves, N_params)
+    bounds : 2-tuple of array-like, optional
+        The lower and upper bounds of the parameters, by default no bounds
+    jac : function, optional
+        The vectorized jacobian of the model. It is called as jac(xdata, params) and must return an array of shape (N_curves, len(xdata), N_params). By default None, the jacobian is estimated by finite differences.
+    max_iter : int, optional
+        The maximal number of iterations, by default 200
+    ftol : float, optional
+        The tolerance on the relative decrease of the sum of the squared residuals, by default 1e-8
+    xtol : float, optional
+        The tolerance on the relative change of the parameters, by default 1e-8
+
+    Returns
+    -------
+    3-tuple of arrays
+        popt: the fitted parameters, of shape (N_curves, N_params)
+        pcov: the covariance matrices of the fitted parameters, of shape (N_curves, N_params, N_params)
+        success: a boolean array of shape (N_curves,) indicating which curves converged
+    """
+    def residuals(params, index):
+        return ydata[index] - f(xdata, params)
+
+    def solve(matrix, vector):
+        # Solve a batch of linear systems, using the pseudo-inverse if some of them are singular
+        try:
+            return np.linalg.solve(matrix, vector[:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            return np.einsum("nij,nj->ni", np.linalg.pinv(matrix), vector)
+
+    def jacobian(params):
+        if jac is not None:
+            return jac(xdata, params)
+        # Forward differences, the step being taken towards the inside of the bounds
+        step = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.abs(params))
+        step = np.where(params + step > upper, -step, step)
+        base = f(xdata, params)
+        derivatives = np.empty(params.shape[:1] + xdata.shape + params.shape[1:])
+        for i in range(params.shape[1]):
+            shifted = params.copy()
+            shifted[:, i] += step[:, i]
+            derivatives[:, :, i] = (f(xdata, shifted) - base) / step[:, i, None]
+        return derivatives
+
+    # Initialize the parameters within the bounds
+    xdata = np.asarray(xdata, dtype = float)
+    ydata = np.asarray(ydata, dtype = float)
+    params = np.array(p0, dtype = float)
+    nb_curves, nb_params = params.shape
+    lower = np.broadcast_to(np.asarray(bounds[0], dtype = float), (nb_params,))
+    upper = np.broadcast_to(np.asarray(bounds[1], dtype = float), (nb_params,))
+    params = np.clip(params, lower, upper)
+
+    # Initialize the damping parameters, the costs and the state of each curve
+    damping = np.full(nb_curves, 1e-2)
+    cost = np.sum(residuals(params, np.arange(nb_curves))**2, axis = -1)
+    active = np.isfinite(cost)
+    success = np.zeros(nb_curves, dtype = bool)
+
+    for _ in range(max_iter):
+        index = np.flatnonzero(active)
+        if len(index) == 0:
+            break
+
+        # Build the damped normal equations of the curves that are still being fitted
+        p = params[index]
+        jacobian_matrix = jacobian(p)
+        res = residuals(p, index)
+        jtj = np.einsum("nmi,nmj->nij", jacobian_matrix, jacobian_matrix)
+        jtr = np.einsum("nmi,nm->ni", jacobian_matrix, res)
+        diagonal = np.diagonal(jtj, axis1 = 1, axis2 = 2)
+        damped = jtj + (damping[index, None] * diagonal)[:, :, None] * np.eye(nb_params)
+
+        # Solve the equations, then fix the parameters whose step crosses a bound close to this bound and solve the equations again for the other parameters. The blocked parameters are kept strictly inside the bounds as some models are degenerate on their bounds (for example a null linewidth).
+        step = solve(damped, jtr)
+        blocked = (p + step < lower) | (p + step > upper)
+        if np.any(blocked):
+            blocked_step = np.where(blocked, BOUND_STEP * (np.clip(p + step, lower, upper) - p), 0)
+            free = ~blocked
+            reduced = np.where(free[:, :, None] & free[:, None, :], damped, 0) + blocked[:, :, None] * np.eye(nb_params)
+            rhs = np.where(free, jtr - np.einsum("nij,nj->ni", damped, blocked_step), blocked_step)
+            step = solve(reduced, rhs)
+        new_p = np.clip(p + step, lower, upper)
+
+        # Accept the steps that decrease the cost and adapt the damping accordingly
+        new_cost = np.sum(residuals(new_p, index)**2, axis = -1)
+        accepted = np.isfinite(new_cost) & (new_cost <= cost[index])
+        params[index[accepted]] = new_p[accepted]
+        damping[index] = np.where(accepted, damping[index] / 10, damping[index] * 10)
+
+        # Stop the curves whose cost or parameters don't change anymore
+        small_cost = (cost[index] - new_cost) <= ftol * cost[index]
+        small_step = np.all(np.abs(new_p - p) <= xtol * (xtol + np.abs(p)), axis = 1)
+        cost[index[accepted]] = new_cost[accepted]
+        converged = (accepted & (small_cost | small_step)) | (damping[index] > 1e16)
+        success[index[converged]] = True
+        active[index[converged]] = False
+
+    # Estimate the covariance matrices from the jacobians at the solution
+    pcov = np.full((nb_curves, nb_params, nb_params), np.inf)
+    nb_points = len(xdata)
+    if nb_points > nb_params and np.any(success):
+        index = np.flatnonzero(success)
+        jacobian_matrix = jacobian(params[index])
+        # Curves whose jacobian is not defined at the solution get no covariance
+        finite = np.all(np.isfinite(jacobian_matrix), axis = (1, 2))
+        index, jacobian_matrix = index[finite], jacobian_matrix[finite]
+        # Invert the normal matrix from the singular value decomposition of the jacobian, discarding the negligible singular values
+        _, s, VT = np.linalg.svd(jacobian_matrix, full_matrices = False)
+        threshold = np.finfo(float).eps * max(jacobian_matrix.shape[1:]) * s[:, :1]
+        inverse_s2 = np.where(s > threshold, 1 / np.where(s > threshold, s, 1)**2, 0)
+        pcov[index] = np.einsum("nki,nk,nkj->nij", VT, inverse_s2, VT) * (cost[index] / (nb_points - nb_params))[:, None, None]
+
+    # The curves that did not converge are returned as NaN
+    success &= np.all(np.isfinite(params), axis = 1)
+    params[~success] = np.nan
+    pcov[~success] = np.nan
+    return params, pcov, success
@@ -0,0 +1,86 @@
+import math
+import numpy as np
+from bisect import bisect_left, bisect_right
+
+class FrequencyIndex:
+    """
+    Index of a 1D frequency axis, turning windows and peak positions given as frequency values into indices of the axis. When the axis is a strictly monotonic array of double precision floats, which is the case of the frequency axes of spectrometers, the indices are found with binary searches on a sorted copy of the axis made once, instead of comparing the values to the whole axis for each query. The indices returned are the same as the ones obtained with np.where and np.argmin on the axis.
+
+    Attributes
+    ----------
+    frequency: np.ndarray
+        The frequency axis that is indexed.
+    direction: int
+        1 if the axis is strictly increasing, -1 if it is strictly decreasing, 0 otherwise. In the latter case, the indices are found by comparing the values to the whole axis.
+    """
+    def __init__(self, frequency):
+        self.frequency = frequency
+        step = np.diff(frequency)
+        if frequency.dtype != np.float64 or len(frequency) == 0:
+            self.direction = 0
+        elif np.all(step > 0):
+            self.direction = 1
+        elif np.all(step < 0):
+            self.direction = -1
+        else:
+            self.direction = 0
+
+        # The binary searches are performed on a list of the values of the axis sorted in increasing order, which is faster to search for single values than the array itself
+        if self.direction == 1:
+            self._increasing = frequency.tolist()
+        elif self.direction == -1:
+            self._increasing = frequency[::-1].tolist()
+
+    def window(self, window):
+        """Returns the indices of the values of the axis located within a window, bounds included.
+
+        Parameters
+        ----------
+        window : 2-list of float
+            The lower and upper bounds of the window, given as frequency values.
+
+        Returns
+        -------
+        np.ndarray
+            The indices of the values of the axis within the window, in increasing order.
+        """
+        start, end = float(window[0]), float(window[1])
+
+        # Windows with undefined bounds are treated by comparing the values to the whole axis, which returns an empty array
+        if self.direction == 0 or start != start or end != end:
+            return np.where((self.frequency >= window[0]) & (self.frequency <= window[1]))[0]
+
+        first = bisect_left(self._increasing, start)
+        last = bisect_right(self._increasing, end)
+        if self.direction == 1:
+            return np.arange(first, last)
+        n = len(self._increasing)
+        return np.arange(n - last, n - first)
+
+    def nearest(self, value):
+        """Returns the index of the value of the axis closest to a given frequency.
+
+        Parameters
+        ----------
+        value : float
+            The frequency to look for.
+
+        Returns
+        -------
+        int
+            The index of the closest value of the axis. In case of a tie, the first index is returned.
+        """
+        x = float(value)
+
+        # Undefined and infinite values are treated as np.argmin does
+        if self.direction == 0 or not math.isfinite(x):
+            return np.argmin(np.abs(self.frequency - value))
+
+        # The closest value is one of the two values surrounding the frequency on the sorted axis
+        n = len(self._increasing)
+        i = bisect_left(self._increasing, x)
+        below, above = max(i-1, 0), min(i, n-1)
+        if self.direction == 1:
+            return below if abs(self._increasing[below] - x) <= abs(self._increasing[above] - x) else above
+        # On a decreasing axis, the value above on the sorted axis comes first on the axis
+        return n-1-above if abs(self._increasing[above] - x) <= abs(self._increasing[below] - x) else n-1-below
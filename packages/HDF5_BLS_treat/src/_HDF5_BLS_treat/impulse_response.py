@@ -0,0 +1,50 @@
+import numpy as np
+from scipy import fft
+
+class ImpulseResponse:
+    """
+    Impulse response of the instrument, convolved with the models through the fast Fourier transform. The Fourier transform of the impulse response is computed once for each length of the convolved arrays, on a padded length that is fast to transform, and reused for every evaluation of the models, which makes the cost of a convolution grow as N.log(N) instead of N.M with np.convolve. The convolution returns the same values as np.convolve(data, IR, "same"), up to the rounding errors of the transforms.
+
+    Attributes
+    ----------
+    IR: np.ndarray
+        The impulse response of the instrument.
+    """
+    def __init__(self, IR):
+        self.IR = np.asarray(IR, dtype = float).ravel()
+
+        # The Fourier transforms of the impulse response, with the padded length they were computed on, stored for each length of the convolved arrays
+        self._transforms = {}
+
+    def convolve(self, data, axis = -1):
+        """Convolves arrays with the impulse response along one of their axes, as np.convolve(data, IR, "same") does along a 1D array.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            The arrays to convolve
+        axis : int, optional
+            The axis along which the arrays are convolved, by default -1
+
+        Returns
+        -------
+        np.ndarray
+            The convolved arrays, with the length of the longest of the arrays and the impulse response along the convolved axis
+        """
+        data = np.asarray(data, dtype = float)
+        length = data.shape[axis]
+
+        # Compute the Fourier transform of the impulse response the first time an array of this length is convolved
+        if length not in self._transforms:
+            size = fft.next_fast_len(length + len(self.IR) - 1, real = True)
+            self._transforms[length] = (size, fft.rfft(self.IR, size))
+        size, transform = self._transforms[length]
+
+        # Multiply the transforms, the one of the impulse response being broadcasted along the convolved axis
+        shape = [1] * data.ndim
+        shape[axis] = len(transform)
+        full = fft.irfft(fft.rfft(data, size, axis = axis) * transform.reshape(shape), size, axis = axis)
+
+        # Keep the central part of the full convolution
+        start = (min(length, len(self.IR)) - 1) // 2
+        return np.take(full, np.arange(start, start + max(length, len(self.IR))), axis = axis)
@@ -1,18 +1,22 @@
 import numpy as np
+from types import MappingProxyType
+
+from .impulse_response import ImpulseResponse
 
 class Models():
     """
-    This class repertoriates all the models that can be used for the fit.
+    This class repertoriates the lineshapes that can be used for the fit. These lineshapes are registered in the registry of models MODELS (see register_model), which is the one used by the treatment so that no instance of this class is needed to fit a model. The "models" and "jacobians" attributes are read-only views of the registry, new models being added with register_model.
     """
 
-    models = {}
+    @property
+    def models(self):
+        """The registered models, called as f(nu, *parameters, IR = None)"""
+        return MappingProxyType({name: entry.evaluate for name, entry in MODELS.items()})
 
-    def __init__(self):
-        self.models["Lorentzian"] = lambda nu, b, a, nu0, gamma, IR=None: self.lorentzian(nu, b, a, nu0, gamma, IR)
-        self.models["Lorentzian elastic"] = lambda nu, be, a, nu0, gamma, ae, IR=None: self.lorentzian_elastic(nu, ae, be, a, nu0, gamma, IR)
-        self.models["DHO"] = lambda nu, b, a, nu0, gamma, IR=None: self.DHO(nu, b, a, nu0, gamma, IR)
-        self.models["DHO elastic"] = lambda nu, be, a, nu0, gamma, ae, IR=None: self.DHO_elastic(nu, ae, be, a, nu0, gamma, IR)
-        self.models["Gaussian"] = lambda nu, b, a, nu0, gamma, IR=None: self.gaussian(nu, b, a, nu0, gamma, IR)
+    @property
+    def jacobians(self):
+        """The jacobians of the registered models, with one column per parameter in the order of the parameters of the corresponding model, called as f(nu, *parameters, IR = None)"""
+        return MappingProxyType({name: entry.evaluate_jacobian for name, entry in MODELS.items() if entry.jacobian is not None})
 
     def lorentzian(self, nu, b, a, nu0, gamma, IR = None):
         """Model of a simple lorentzian lineshape
@@ -30,7 +34,7 @@ class Models():
         gamma : float
             The linewidth of the function
         IR : array, optional
-            The impulse response of the instrument, by default None
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
 
         Returns
         -------
@@ -38,7 +42,7 @@ class Models():
             The function associated to the given parameters
         """
         func = b + a*(gamma/2)**2/((nu-nu0)**2+(gamma/2)**2)
-        if IR is not None: return np.convolve(func, IR, "same")
+        if IR is not None: return self.convolve(func, IR)
         return func
     
     def lorentzian_elastic(self, nu, ae, be, a, nu0, gamma, IR = None):
@@ -59,7 +63,7 @@ class Models():
         gamma : float
             The linewidth of the function
         IR : array, optional
-            The impulse response of the instrument, by default None
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
 
         Returns
         -------
@@ -67,7 +71,7 @@ class Models():
             The function associated to the given parameters
         """
         func =  be + ae*nu + a*(gamma/2)**2/((nu-nu0)**2+(gamma/2)**2)
-        if IR is not None: return np.convolve(func, IR, "same")
+        if IR is not None: return self.convolve(func, IR)
         return func
     
     def DHO(self, nu, b, a, nu0, gamma, IR = None):
@@ -86,7 +90,7 @@ class Models():
         gamma : float
             The linewidth of the function
         IR : array, optional
-            The impulse response of the instrument, by default None
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
 
         Returns
         -------
@@ -94,12 +98,9 @@ class Models():
             The function associated to the given parameters
         """
         func = b + a * (gamma*nu0)**2/((nu**2-nu0**2)**2+(gamma*nu)**2)
-        # This is to only generate one peak and not a doublet
-        if np.sign(nu0) == -1: 
-            func = func*(nu<=0)
-        else: 
-            func = func*(nu>=0)
-        if IR is not None: return np.convolve(func, IR, "same")
+        # This is to only generate one peak and not a doublet (written elementwise so that arrays of parameters can be given)
+        func = func*np.where(np.sign(nu0) == -1, nu<=0, nu>=0)
+        if IR is not None: return self.convolve(func, IR)
         return func 
     
     def DHO_elastic(self, nu, ae, be, a, nu0, gamma, IR = None):
@@ -120,7 +121,7 @@ class Models():
         gamma : float
             The linewidth of the function
         IR : array, optional
-            The impulse response of the instrument, by default None
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
 
         Returns
         -------
@@ -128,7 +129,7 @@ class Models():
             The function associated to the given parameters
         """
         func = ae*nu + self.DHO(nu, be, a, nu0, gamma)
-        if IR is not None: return np.convolve(func, IR, "same")
+        if IR is not None: return self.convolve(func, IR)
         return func
   
     def gaussian(self, nu, b, a, nu0, gamma, IR = None):
@@ -146,7 +147,7 @@ class Models():
         gamma : float
             The linewidth of the function
         IR : array, optional
-            The impulse response of the instrument, by default None
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
         Returns
         -------
         function
@@ -154,6 +155,427 @@ class Models():
         """
         gamma = 2*np.log(2)/gamma
         func = b + a*np.exp(-(nu-nu0)**2/(2*gamma**2))
-        if IR is not None: return np.convolve(func, IR, "same")
-        return func 
+        if IR is not None: return self.convolve(func, IR)
+        return func
+
+    def convolve(self, func, IR, axis = -1):
+        """Convolves a model with the impulse response of the instrument through the fast Fourier transform, as np.convolve(func, IR, "same") does. Giving an ImpulseResponse instead of an array allows the Fourier transform of the impulse response to be computed once for all the evaluations of a fit.
+
+        Parameters
+        ----------
+        func : array
+            The values of the model, or of its derivatives
+        IR : array or ImpulseResponse
+            The impulse response of the instrument
+        axis : int, optional
+            The axis of the frequency, by default -1
+
+        Returns
+        -------
+        array
+            The convolved values
+        """
+        return _convolve(func, IR, axis = axis)
+
+    def vectorized(self, model, nb_peaks = 1, IR = None):
+        """Returns a vectorized version of a model, evaluating the model for a batch of parameter sets at once. When more than one peak is given, the contributions of all the peaks are summed.
+
+        Parameters
+        ----------
+        model : str
+            The name of the model in the registry of models
+        nb_peaks : int, optional
+            The number of peaks of the model, the parameters of each peak following each other, by default 1
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, convolved with the sum of the contributions of the peaks, by default None
+
+        Returns
+        -------
+        function
+            A function f(nu, params) where nu is the frequency array of shape (M,) and params an array of shape (N, N_params), returning an array of shape (N, M)
+        """
+        return MODELS[model].vectorized(nb_peaks, IR)
+
+    def vectorized_jacobian(self, model, nb_peaks = 1, IR = None):
+        """Returns a vectorized version of the jacobian of a model, evaluating the jacobian for a batch of parameter sets at once. When more than one peak is given, the jacobians of the peaks are concatenated, following the order of the parameters given to the function returned by "vectorized".
+
+        Parameters
+        ----------
+        model : str
+            The name of the model in the registry of models
+        nb_peaks : int, optional
+            The number of peaks of the model, the parameters of each peak following each other, by default 1
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, convolved with the jacobian of each parameter, by default None
+
+        Returns
+        -------
+        function
+            A function f(nu, params) where nu is the frequency array of shape (M,) and params an array of shape (N, N_params), returning an array of shape (N, M, N_params)
+        """
+        return MODELS[model].vectorized_jacobian(nb_peaks, IR)
+
+    # Jacobians of the models
+
+    def jacobian_lorentzian(self, nu, b, a, nu0, gamma, IR = None):
+        """Jacobian of the lorentzian model with respect to its parameters
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        b : float
+            The constant offset of the data
+        a : float
+            The amplitude of the peak
+        nu0 : float
+            The center position of the function
+        gamma : float
+            The linewidth of the function
+        IR : array, optional
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the function with respect to b, a, nu0 and gamma, stacked along the last axis
+        """
+        half_width = gamma/2
+        denominator = (nu-nu0)**2+half_width**2
+        d_b = np.ones_like(nu, dtype = float)
+        d_a = half_width**2/denominator
+        d_nu0 = 2*a*half_width**2*(nu-nu0)/denominator**2
+        d_gamma = a*half_width*(nu-nu0)**2/denominator**2
+        return self._stack_jacobian([d_b, d_a, d_nu0, d_gamma], IR)
+
+    def jacobian_lorentzian_elastic(self, nu, ae, be, a, nu0, gamma, IR = None):
+        """Jacobian of the lorentzian model with elastic correction with respect to its parameters
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        ae : float
+            The slope of the first order Taylor expansion of the elastic peak at the position of the peak fitted
+        be : float
+            The constant offset of the data
+        a : float
+            The amplitude of the peak
+        nu0 : float
+            The center position of the function
+        gamma : float
+            The linewidth of the function
+        IR : array, optional
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the function with respect to be, a, nu0, gamma and ae, stacked along the last axis
+        """
+        jacobian = self.jacobian_lorentzian(nu, be, a, nu0, gamma)
+        d_ae = np.broadcast_to(nu, jacobian.shape[:-1])
+        return self._stack_jacobian([jacobian[..., i] for i in range(4)] + [d_ae], IR)
+
+    def jacobian_DHO(self, nu, b, a, nu0, gamma, IR = None):
+        """Jacobian of the DHO model with respect to its parameters
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        b : float
+            The constant offset of the data
+        a : float
+            The amplitude of the peak
+        nu0 : float
+            The center position of the function
+        gamma : float
+            The linewidth of the function
+        IR : array, optional
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the function with respect to b, a, nu0 and gamma, stacked along the last axis
+        """
+        numerator = (gamma*nu0)**2
+        denominator = (nu**2-nu0**2)**2+(gamma*nu)**2
+        # The same mask as in the model restricts the function to a single peak
+        mask = np.where(np.sign(nu0) == -1, nu<=0, nu>=0)
+        d_b = mask*np.ones_like(nu, dtype = float)
+        d_a = mask*numerator/denominator
+        d_nu0 = mask*a*(2*gamma**2*nu0*denominator + 4*numerator*nu0*(nu**2-nu0**2))/denominator**2
+        d_gamma = mask*a*(2*gamma*nu0**2*denominator - 2*numerator*gamma*nu**2)/denominator**2
+        return self._stack_jacobian([d_b, d_a, d_nu0, d_gamma], IR)
+
+    def jacobian_DHO_elastic(self, nu, ae, be, a, nu0, gamma, IR = None):
+        """Jacobian of the DHO model with elastic correction with respect to its parameters
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        ae : float
+            The slope of the first order Taylor expansion of the elastic peak at the position of the peak fitted
+        be : float
+            The constant offset of the data
+        a : float
+            The amplitude of the peak
+        nu0 : float
+            The center position of the function
+        gamma : float
+            The linewidth of the function
+        IR : array, optional
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the function with respect to be, a, nu0, gamma and ae, stacked along the last axis
+        """
+        jacobian = self.jacobian_DHO(nu, be, a, nu0, gamma)
+        d_ae = np.broadcast_to(nu, jacobian.shape[:-1])
+        return self._stack_jacobian([jacobian[..., i] for i in range(4)] + [d_ae], IR)
+
+    def jacobian_gaussian(self, nu, b, a, nu0, gamma, IR = None):
+        """Jacobian of the gaussian model with respect to its parameters
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        b : float
+            The constant offset of the data
+        a : float
+            The amplitude of the peak
+        nu0 : float
+            The center position of the function
+        gamma : float
+            The linewidth of the function
+        IR : array, optional
+            The impulse response of the instrument, either as an array or as an ImpulseResponse, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the function with respect to b, a, nu0 and gamma, stacked along the last axis
+        """
+        # The derivatives are expressed with 1/sigma = gamma/(2 ln 2) so that they remain defined for a null linewidth
+        inverse_sigma = gamma/(2*np.log(2))
+        exponential = np.exp(-(nu-nu0)**2*inverse_sigma**2/2)
+        d_b = np.ones_like(nu, dtype = float)
+        d_a = exponential
+        d_nu0 = a*exponential*(nu-nu0)*inverse_sigma**2
+        d_gamma = -a*exponential*(nu-nu0)**2*inverse_sigma/(2*np.log(2))
+        return self._stack_jacobian([d_b, d_a, d_nu0, d_gamma], IR)
+
+    def _stack_jacobian(self, derivatives, IR = None):
+        # Stack the derivatives along the last axis, broadcasting them against each other, and convolve them with the impulse response if given
+        jacobian = np.stack(np.broadcast_arrays(*derivatives), axis = -1)
+        if IR is not None:
+            jacobian = self.convolve(jacobian, IR, axis = -2)
+        return jacobian
+
+
+class ModelEntry:
+    """
+    Entry of the registry of models, gathering all that the fits need to know about a model. The entries are created with register_model and can't be modified once registered.
+
+    Attributes
+    ----------
+    name: str
+        The name of the model.
+    function: function
+        The model, called as function(nu, *parameters), the parameters broadcasting against the frequency axis.
+    jacobian: function or None
+        The jacobian of the model, called as jacobian(nu, *parameters) and returning the derivatives with respect to each parameter stacked along the last axis. None if the jacobian is estimated by finite differences.
+    parameters: tuple of str
+        The names of the parameters, the first four being the offset, the amplitude, the shift and the linewidth of the peak.
+    bounds: 2-tuple of tuples of float
+        The default lower and upper bounds of the parameters.
+    guess: function
+        The heuristic giving the initial guess of the parameters of a peak, called as guess(nu, PSD, offset, shift, linewidth, peak) where nu and PSD are the fitted window, offset, shift and linewidth the guesses of these parameters and peak the frequency and the intensity of the sampled point closest to the peak. It returns the list of the guesses of all the parameters.
+    """
+    def __init__(self, name, function, jacobian, parameters, bounds, guess):
+        for attribute, value in [("name", name), ("function", function), ("jacobian", jacobian), ("parameters", parameters), ("bounds", bounds), ("guess", guess)]:
+            object.__setattr__(self, attribute, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"The entries of the registry of models can't be modified (model '{self.name}').")
+
+    def evaluate(self, nu, *parameters, IR = None):
+        """Evaluates the model, convolved with the impulse response of the instrument if given.
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        *parameters : float or array
+            The parameters of the model
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, by default None
+
+        Returns
+        -------
+        array
+            The values of the model
+        """
+        return _convolve(self.function(nu, *parameters), IR)
+
+    def evaluate_jacobian(self, nu, *parameters, IR = None):
+        """Evaluates the jacobian of the model, convolved with the impulse response of the instrument if given.
+
+        Parameters
+        ----------
+        nu : array
+            The frequency array
+        *parameters : float or array
+            The parameters of the model
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, by default None
+
+        Returns
+        -------
+        array
+            The derivatives of the model with respect to each parameter, stacked along the last axis
+        """
+        return _convolve(self.jacobian(nu, *parameters), IR, axis = -2)
+
+    def vectorized(self, nb_peaks = 1, IR = None):
+        """Returns a vectorized version of the model, evaluating the model for a batch of parameter sets at once. When more than one peak is given, the contributions of all the peaks are summed.
+
+        Parameters
+        ----------
+        nb_peaks : int, optional
+            The number of peaks of the model, the parameters of each peak following each other, by default 1
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, convolved with the sum of the contributions of the peaks, by default None
+
+        Returns
+        -------
+        function
+            A function f(nu, params) where nu is the frequency array of shape (M,) and params an array of shape (N, N_params), returning an array of shape (N, M)
+        """
+        def func(nu, params):
+            # Each parameter is given as a column so that it broadcasts against the frequency axis
+            params = params.reshape((params.shape[0], nb_peaks, -1))
+            return _convolve(sum(self.function(nu, *params[:, i].T[:, :, None]) for i in range(nb_peaks)), IR)
+        return func
+
+    def vectorized_jacobian(self, nb_peaks = 1, IR = None):
+        """Returns a vectorized version of the jacobian of the model, evaluating the jacobian for a batch of parameter sets at once. When more than one peak is given, the jacobians of the peaks are concatenated, following the order of the parameters given to the function returned by "vectorized".
+
+        Parameters
+        ----------
+        nb_peaks : int, optional
+            The number of peaks of the model, the parameters of each peak following each other, by default 1
+        IR : array or ImpulseResponse, optional
+            The impulse response of the instrument, convolved with the jacobian of each parameter, by default None
+
+        Returns
+        -------
+        function or None
+            A function f(nu, params) where nu is the frequency array of shape (M,) and params an array of shape (N, N_params), returning an array of shape (N, M, N_params). None if the model has no jacobian.
+        """
+        if self.jacobian is None:
+            return None
+        def func(nu, params):
+            # Each parameter is given as a column so that it broadcasts against the frequency axis
+            params = params.reshape((params.shape[0], nb_peaks, -1))
+            return _convolve(np.concatenate([self.jacobian(nu, *params[:, i].T[:, :, None]) for i in range(nb_peaks)], axis = -1), IR, axis = -2)
+        return func
+
+def register_model(name, function, parameters, jacobian = None, bounds = None, guess = None):
+    """Adds a model to the registry of models, so that it can be selected with Treat.define_model and fitted by the treatment. The models already registered can't be replaced.
+
+    Parameters
+    ----------
+    name : str
+        The name of the model
+    function : function
+        The model, called as function(nu, *parameters). The parameters must broadcast against the frequency axis, so that the model can be evaluated for a batch of parameter sets at once.
+    parameters : list of str
+        The names of the parameters, the first four being "offset", "amplitude", "shift" and "linewidth"
+    jacobian : function, optional
+        The jacobian of the model, called as jacobian(nu, *parameters) and returning the derivatives with respect to each parameter stacked along the last axis, by default None means that the jacobian is estimated by finite differences
+    bounds : 2-list of lists of float, optional
+        The default lower and upper bounds of the parameters, by default None means that the amplitude and the linewidth are positive and the other parameters are not bounded
+    guess : function, optional
+        The heuristic giving the initial guess of the parameters of a peak (see ModelEntry), by default None means that the intensity of the peak is used as the amplitude guess and the other parameters are guessed to 0
+
+    Returns
+    -------
+    ModelEntry
+        The entry of the model in the registry
+
+    Raises
+    ------
+    ValueError
+        If a model with the same name is already registered, or if the parameters or the bounds are not consistent.
+    """
+    parameters = tuple(parameters)
+    if name in _REGISTRY:
+        raise ValueError(f"The model {name} is already registered.")
+    if parameters[:4] != ("offset", "amplitude", "shift", "linewidth"):
+        raise ValueError(f"The first four parameters of a model must be 'offset', 'amplitude', 'shift' and 'linewidth' (here {parameters}).")
+
+    # By default, only the amplitude and the linewidth are bounded
+    if bounds is None:
+        bounds = [[-np.inf, 0, -np.inf, 0] + [-np.inf]*(len(parameters)-4), [np.inf]*len(parameters)]
+    bounds = (tuple(bounds[0]), tuple(bounds[1]))
+    if len(bounds[0]) != len(parameters) or len(bounds[1]) != len(parameters):
+        raise ValueError(f"The bounds of the model {name} must have one value per parameter ({len(parameters)}).")
+
+    # By default, the parameters that are not the ones of the peak are guessed to 0
+    if guess is None:
+        guess = lambda nu, PSD, offset, shift, linewidth, peak: _guess_peak(nu, PSD, offset, shift, linewidth, peak) + [0]*(len(parameters)-4)
+
+    _REGISTRY[name] = ModelEntry(name, function, jacobian, parameters, bounds, guess)
+    return _REGISTRY[name]
+
+def _convolve(values, IR, axis = -1):
+    # Convolve the values with the impulse response if given, through the fast Fourier transform
+    if IR is None:
+        return values
+    if not isinstance(IR, ImpulseResponse):
+        IR = ImpulseResponse(IR)
+    return IR.convolve(values, axis = axis)
+
+def _guess_peak(nu, PSD, offset, shift, linewidth, peak):
+    # The amplitude is guessed as the intensity of the sampled point closest to the peak
+    return [offset, peak[1], shift, linewidth]
+
+def _guess_peak_elastic(nu, PSD, offset, shift, linewidth, peak):
+    # Estimate the slope from the first and last points of the window
+    slope = (PSD[-1] - PSD[0])/(nu[-1] - nu[0])
+
+    # Adjust the offset accordingly
+    if PSD[0] < PSD[-1]:
+        offset = offset - slope*nu[0]
+    else:
+        offset = offset - slope*nu[-1]
+
+    # Adjust the amplitude accordingly
+    amplitude = peak[1] - offset - slope*peak[0]
+    return [offset, amplitude, shift, linewidth, slope]
+
+# The registry of models, read-only, the models being added with register_model
+_REGISTRY = {}
+MODELS = MappingProxyType(_REGISTRY)
 
+# Register the lineshapes defined in the Models class
+_lineshapes = Models()
+_peak = ("offset", "amplitude", "shift", "linewidth")
+_elastic_bounds = [[-np.inf, -np.inf, -np.inf, 0, -np.inf], [np.inf, np.inf, np.inf, np.inf, np.inf]]
+register_model("Lorentzian", lambda nu, b, a, nu0, gamma: _lineshapes.lorentzian(nu, b, a, nu0, gamma), _peak,
+               jacobian = lambda nu, b, a, nu0, gamma: _lineshapes.jacobian_lorentzian(nu, b, a, nu0, gamma), guess = _guess_peak)
+register_model("Lorentzian elastic", lambda nu, be, a, nu0, gamma, ae: _lineshapes.lorentzian_elastic(nu, ae, be, a, nu0, gamma), _peak + ("slope",),
+               jacobian = lambda nu, be, a, nu0, gamma, ae: _lineshapes.jacobian_lorentzian_elastic(nu, ae, be, a, nu0, gamma), bounds = _elastic_bounds, guess = _guess_peak_elastic)
+register_model("DHO", lambda nu, b, a, nu0, gamma: _lineshapes.DHO(nu, b, a, nu0, gamma), _peak,
+               jacobian = lambda nu, b, a, nu0, gamma: _lineshapes.jacobian_DHO(nu, b, a, nu0, gamma), guess = _guess_peak)
+register_model("DHO elastic", lambda nu, be, a, nu0, gamma, ae: _lineshapes.DHO_elastic(nu, ae, be, a, nu0, gamma), _peak + ("slope",),
+               jacobian = lambda nu, be, a, nu0, gamma, ae: _lineshapes.jacobian_DHO_elastic(nu, ae, be, a, nu0, gamma), bounds = _elastic_bounds, guess = _guess_peak_elastic)
+register_model("Gaussian", lambda nu, b, a, nu0, gamma: _lineshapes.gaussian(nu, b, a, nu0, gamma), _peak,
+               jacobian = lambda nu, b, a, nu0, gamma: _lineshapes.jacobian_gaussian(nu, b, a, nu0, gamma), guess = _guess_peak)
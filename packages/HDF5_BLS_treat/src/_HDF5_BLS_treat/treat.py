@@ -2,15 +2,32 @@ import numpy as np
 from scipy import optimize
 import json
 import inspect
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
-from HDF5_BLS_treat import Treat_backend, Models, TreatmentError
+from HDF5_BLS_treat import Treat_backend, MODELS, TreatmentError, batch_curve_fit, AlgorithmPlan, FrequencyIndex, ImpulseResponse
 
 Treat_version = 0.1
 
 class Treat(Treat_backend):
     """This class is a class inherited from the Treat_backend class used to define functions to treat the data. Each function is meant to perform the minimum of operation so as to give the user a total control over the treatment. 
     """
-    def __init__(self, frequency: np.ndarray, PSD: np.ndarray):
+    SHARED_ATTRIBUTES = ["offset", "shift", "linewidth", "amplitude", "shift_var", "linewidth_var", "amplitude_var", "BLT", "BLT_var"] # The global attributes placed in shared memory when the treatment is distributed on several processes
+    CHUNKS_PER_WORKER = 8 # The number of chunks given to each worker when the treatment is distributed on several processes
+    FIT_FUNCTIONS = ["single_fit_all_inelastic", "multi_fit_all_inelastic", "fit_all_inelastic_of_curve"] # The steps of the algorithms fitting the peaks
+
+    def __init__(self, frequency: np.ndarray, PSD: np.ndarray, block_size: int = 4096):
+        """Initializes the class with the frequency axis and the PSD to treat.
+
+        Parameters
+        ----------
+        frequency : np.ndarray
+            An array corresponding to the frequency axis of the PSD
+        PSD : np.ndarray or dataset
+            The power spectral density to treat. Datasets that are read lazily (for example a HDF5_BLS.DatasetView returned by a wrapper or an h5py dataset) are not loaded in memory: the spectra are read by blocks when the algorithm is applied to all of them (see apply_algorithm_on_all).
+        block_size : int, optional
+            The maximal number of spectra read at once when the PSD is read lazily, by default 4096
+        """
         super().__init__(frequency = frequency, PSD = PSD)
 
         self._algorithm = {
@@ -22,13 +39,38 @@ class Treat(Treat_backend):
         } 
         self._history = []
 
-        # Initializing main attributes
-        self.frequency = frequency
-        self.PSD = PSD
+        # Initializing main attributes, a single spectrum being read at once
+        self.frequency = np.asarray(frequency)
+        self.PSD = PSD if len(PSD.shape) > 1 else np.asarray(PSD)
+        self.block_size = block_size
+
+        # Initializing the block of spectra read from the PSD when it is read lazily, and the index of its first element along the first dimension of the map (None when the spectra are read directly from the PSD)
+        self._PSD_block = None
+        self._PSD_block_start = 0
 
         # Initializing treatment applicator selection attributes
         self._treat_selection = "sampled"
 
+        # Initializing the queue of fits used by the batched engine (None when the fits are performed directly)
+        self._fit_queue = None
+
+        # Initializing the index of the sampled frequency axis, built when first needed
+        self._frequency_index = None
+
+        # Initializing the impulse response of the instrument convolved with the models, and its versions cropped to the length of each fitted window (None when the models are not convolved)
+        self._impulse_response = None
+        self._impulse_response_windows = {}
+
+        # Initializing the guesses seeded from the neighboring spectra when the algorithm is applied to all the spectra (None when the guesses of the algorithm are used)
+        self._warm_start = None
+
+        # Initializing the checkpoint storing the results as the spectra are treated, and the rows of the spectra completed before the treatment of a block (None when no checkpoint is used)
+        self._checkpoint = None
+        self._completed_rows = None
+
+        # Initializing the maps of the points marked as errors, one structured array per type of error
+        self.error_maps = {}
+
         # Delete unused dimensions
         new_shape = []
         for s in self.frequency.shape:
@@ -42,9 +84,12 @@ class Treat(Treat_backend):
         # Initializing array sample attributes WARNING: ONLY 1D frequency arrays are supported for now
         if len(self.frequency.shape) == 1:
             self.frequency_sample = self.frequency
-            self.PSD_sample = self.PSD
-            while len(self.PSD_sample.shape) > 1:
-                self.PSD_sample = np.average(self.PSD_sample, axis = 0) 
+            if isinstance(self.PSD, np.ndarray):
+                self.PSD_sample = self.PSD
+                while len(self.PSD_sample.shape) > 1:
+                    self.PSD_sample = np.average(self.PSD_sample, axis = 0) 
+            else:
+                self.PSD_sample = self._get_average_spectrum()
         else:
             raise ValueError(f"Only 1D frequency arrays are supported for now. The given frequency array has the following dimension: {self.frequency.shape}.")
 
@@ -79,7 +124,7 @@ class Treat(Treat_backend):
                 The window surrounding the peak. The format is [start, end].
             """
             # Extract the windowed abscissa and ordinate arrays
-            pos = np.where((frequency >= window[0]) & (frequency <= window[1]))
+            pos = self._get_frequency_index().window(window)
             wndw_x = frequency[pos] 
             wndw_y = PSD[pos]
 
@@ -201,7 +246,8 @@ class Treat(Treat_backend):
         peaks = [p[1] for p in self.points if p[0][0] not in ["E", "W"]]
 
         # Calculate the average intensity of the peaks
-        position_peaks = np.array([np.argmin(np.abs(self.frequency_sample - p)) for p in peaks])
+        frequency_index = self._get_frequency_index()
+        position_peaks = np.array([frequency_index.nearest(p) for p in peaks])
         average_intensity_peaks = np.average(self.PSD_sample[position_peaks])
 
         # Get all regions corresponding to noise (i.e. regions with intensity below 10% of the average intensity of the peaks)
@@ -242,7 +288,7 @@ class Treat(Treat_backend):
                 p = self.points[i][1]
     
                 # Extract the peak position
-                pos_peak = np.argmin(np.abs(self.frequency_sample - p))
+                pos_peak = self._get_frequency_index().nearest(p)
 
                 # Guess the width of the peak by finding the points at half the height
                 pos_half = pos_peak
@@ -273,7 +319,7 @@ class Treat(Treat_backend):
         Parameters
         ----------
         model : str, optional
-            The model to be used. The models should match the names of the attribute "models" of the class Models, by default "Lorentzian"
+            The model to be used. The models should match the names of the models of the registry MODELS (see register_model), by default "Lorentzian"
         elastic_correction : bool, optional
             Whether to correct for the presence of an elastic peak by setting adding a linear function to the model, by default False
         """
@@ -281,36 +327,42 @@ class Treat(Treat_backend):
             model = model + " elastic"
 
         # Try selecting the model, raise an error if the model is not found
-        Model = Models()
-        if model not in Model.models.keys():
+        if model not in MODELS:
             raise ValueError(f"The model {model} is not recognized.")
         self.fit_model = model
 
     # Algorithm application functions
 
-    def apply_algorithm_on_all(self):
+    def apply_algorithm_on_all(self, engine: str = "sequential", workers: int = 1, warm_start: str = None):
         """
         Takes all the steps of the algorithm up to the moment this function is called and applies the steps to each individual spectrum in the dataset. 
         This function updates the global attributes of the class concerning the shift, the linewidth and the amplitude together with their variance, taking into account error propagation. 
         If a spectrum could not be fitted, its value is set to 0 in the global attributes.
         All the points where the spectra could not be fitted are marked with the "fit_error_marker" parameter in the global attributes (shift, linewidth, amplitude, shift_var, linewidth_var, amplitude_var) and their coordinates are stored in the "point_error" list. The "point_error_type" attribute is also updated with the type of error returned by the fit function (see scipy.optimize.curve_fit documentation). The function returns the number of spectra that could not be fitted.
+        Two engines are available. The "sequential" engine fits each spectrum with scipy.optimize.curve_fit as the algorithm is run on it. The "batched" engine runs the steps of the algorithm on each spectrum but only stores the fits, which are then solved for all the spectra at once with a vectorized Levenberg-Marquardt algorithm (see batch_curve_fit). As the results of the fits are only known once all the spectra are treated, the "batched" engine can't be used when a fit updating the position of the points (update_point_position) is followed by other steps of the algorithm reading these positions.
+        The spectra can also be distributed on several processes with the "workers" parameter, each process treating its share of the spectra with the selected engine.
+        If a checkpoint was given with silent_set_checkpoint, the spectra are treated by blocks along the first dimension of the map and the results are saved in the checkpoint after each block. The blocks already stored in the checkpoint are loaded instead of being treated again, so that an interrupted treatment can be resumed.
+        If the PSD is read lazily, the spectra are also treated by blocks along the first dimension of the map, each block being read from the file before being treated so that only one block of spectra is in memory at a time. The blocks hold at most "block_size" spectra (see the constructor) and are aligned on the chunks of the dataset when they are known, unless a checkpoint is used in which case the blocks of the checkpoint are read. Combined with a checkpoint, the results of each block are also written in the file as soon as the block is treated.
+        With the "sequential" engine, the initial guesses of the shift and linewidth of each spectrum can be seeded from the neighboring spectra already fitted by setting "warm_start" to "neighbors". The guesses are then the average of the results of the previous spectrum along each dimension of the map (for example the spectrum on the left, the one above and the one of the previous plane), the guesses of the algorithm being used for the peaks that could not be fitted on any of these neighbors. When the spectra are distributed on several processes, only the neighbors treated by the same process are used.
 
+        Parameters
+        ----------
+        engine : str, optional
+            The engine used to fit the spectra, either "sequential" or "batched", by default "sequential"
+        workers : int, optional
+            The number of processes used to treat the spectra, by default 1 means that the spectra are treated in the current process
+        warm_start : str, optional
+            The strategy used to seed the initial guesses of the fits, either None or "neighbors", by default None means that the guesses of the algorithm are used
        """
-        def plus_one(shape, max_shape, dim):
-            if dim == -1: 
-                return None
-            if shape[dim] == max_shape[dim]-1:
-                shape[dim] = 0
-                return plus_one(shape, max_shape, dim-1)
-            else:
-                shape[dim] += 1
-                return shape
+        def check_batched_algorithm(functions):
+            # With the batched engine, the fits return their initial guesses, so the steps following a fit that updates the position of the points would read these guesses instead of the fitted shifts
+            for i, function in enumerate(functions[:-1]):
+                if function["function"] in self.FIT_FUNCTIONS and function["parameters"].get("update_point_position", True):
+                    raise ValueError(f"The step {i} ({function['function']}) updates the position of the points with the results of its fit, which are read by the following steps of the algorithm. These results are only known once all the spectra are fitted with the 'batched' engine. Please use the 'sequential' engine or set 'update_point_position' to False.")
 
         def initialize():    
-            # Initialize the list of points that could not be fitted
-            self.point_error = []
-            self.point_error_type = []
-            self.point_error_value = []
+            # Initialize the maps of the points that could not be fitted
+            self.error_maps = {}
 
             # Initialize the list of fitted points
             dim = list(self.PSD.shape[:-1])+[len(self.shift_sample)]
@@ -322,11 +374,18 @@ class Treat(Treat_backend):
             self.amplitude = np.zeros(dim).astype(float)        
             self.amplitude_var = np.zeros(dim).astype(float)
 
-            # Initialize the index of the selected spectrum
-            return np.zeros(len(self.PSD.shape[:-1])).astype(int)
+        # Check the engine and the warm start strategy
+        if engine not in ["sequential", "batched"]:
+            raise ValueError(f"The engine {engine} is not recognized. Please use 'sequential' or 'batched'.")
+        if warm_start not in [None, "neighbors"]:
+            raise ValueError(f"The warm start strategy {warm_start} is not recognized. Please use None or 'neighbors'.")
+        if warm_start is not None and engine == "batched":
+            raise ValueError("The guesses can't be seeded from the neighboring spectra with the 'batched' engine as the spectra are fitted all at once. Please use the 'sequential' engine.")
+        if engine == "batched":
+            check_batched_algorithm(self._algorithm["functions"][:-1])
 
-        # Initialize the list of fitted points, error point and index of selected spectrum
-        PSD_i = initialize()
+        # Initialize the list of fitted points and error points
+        initialize()
 
         # Set the treat selection to "all"
         self._treat_selection = "all"
@@ -338,43 +397,50 @@ class Treat(Treat_backend):
         # Sets the frequency array to the main frequency array (assuming 1D frequency array)
         self.frequency_sample = self.frequency
 
-        # Initialize the attributes for the progress callback
-        count = 0
-        total = np.prod(self.PSD.shape[:-1])
-
-        # Iterate on each spectrum of the PSD array
-        while PSD_i is not None:
-            # Assign the current PSD and frequency arrays to the corresponding variables
-            self.PSD_sample = self.PSD[tuple(PSD_i)]
-
-            # Run the algorithm on the current PSD and frequency arrays
-            self.silent_run_algorithm()
-
-            self.offset[tuple(PSD_i)] = self.offset_sample
-            self.shift[tuple(PSD_i)] = self.shift_sample
-            self.linewidth[tuple(PSD_i)] = self.linewidth_sample
-            self.shift_var[tuple(PSD_i)] = self.shift_err_sample
-            self.linewidth_var[tuple(PSD_i)] = self.linewidth_err_sample
-            self.amplitude[tuple(PSD_i)] = self.amplitude_sample
-            self.amplitude_var[tuple(PSD_i)] = self.amplitude_err_sample
-
-            if np.all(np.isnan(self.shift[tuple(PSD_i)])):
-                self.point_error.append(PSD_i.copy())
-                self.point_error_type.append("fit_error")
-                self.point_error_value.append(np.nan)
-
-            PSD_i = plus_one(PSD_i, self.PSD.shape[:-1], len(PSD_i)-1)
+        # Treat all the spectra, identified by their row in the PSD array flattened on all its dimensions but the last one, either in this process or on a pool of processes
+        rows = np.arange(int(np.prod(self.PSD.shape[:-1])))
+        if self._checkpoint is not None or not isinstance(self.PSD, np.ndarray):
+            self._apply_algorithm_on_blocks(engine = engine, workers = workers, warm_start = warm_start)
+        elif workers > 1:
+            self._run_in_workers("_apply_algorithm_on_rows", rows, workers, engine = engine, warm_start = warm_start)
+        else:
+            self._apply_algorithm_on_rows(rows, engine = engine, warm_start = warm_start)
 
-            if self._progress_callback is not None:
-                count += 1
-                self._progress_callback(count, total)
+        # Mark the spectra that could not be fitted, their results being already undefined
+        self._mark_errors("fit_error", np.all(np.isnan(self.shift), axis = -1), invalidate = False)
         
         self.BLT = self.linewidth/self.shift
         self.BLT_var = self.BLT**2 * ((self.shift_var/self.shift)**2 + (self.linewidth_var/self.linewidth)**2)
 
         self._algorithm["functions"].append(temp_algorithm)
 
-    def adjust_treatment_on_errors(self, position = None, new_parameters = None):
+    def silent_set_impulse_response(self, impulse_response = None):
+        """Sets the impulse response of the instrument, convolved with the models when the spectra are fitted. The impulse response can be given as an array or as a dataset read lazily, for example the PSD of an "Impulse_response" group of a wrapper (wrapper["path/to/group/PSD"]), which is then read only once. When several spectra are given, their average is used. The impulse response is expected to be sampled with the same frequency step as the PSD, the zero frequency being at the center of the array. For each length of the fitted windows, the impulse response is cropped around its center to the length of the window, normalized so that its sum is 1, and its Fourier transform is computed once for all the fits (see ImpulseResponse). The impulse response is not stored in the algorithm.
+
+        Parameters
+        ----------
+        impulse_response : array or dataset, optional
+            The impulse response of the instrument, by default None means that the models are not convolved
+        """
+        self._impulse_response_windows = {}
+        if impulse_response is None:
+            self._impulse_response = None
+            return
+        impulse_response = np.asarray(impulse_response, dtype = float)
+        impulse_response = impulse_response.reshape((-1, impulse_response.shape[-1])).mean(axis = 0)
+        self._impulse_response = impulse_response
+
+    def silent_set_checkpoint(self, checkpoint = None):
+        """Sets the checkpoint where the results are stored as the spectra are treated by apply_algorithm_on_all, for example a HDF5_BLS.TreatmentCheckpoint returned by Wrapper.open_checkpoint. The checkpoint is not stored in the algorithm.
+
+        Parameters
+        ----------
+        checkpoint : object, optional
+            The checkpoint, by default None means that no checkpoint is used. The checkpoint has a "block_size" attribute giving the number of elements of the first dimension of the map treated between two saves, a "load()" method returning the stored results (or None) and a "save(results, start, end)" method storing the results of the elements "start" to "end" (excluded) of the first dimension of the map. The results are given as a dictionary of arrays named after the global attributes ("shift", "linewidth", ...) together with a "completed" boolean array with the shape of the map.
+        """
+        self._checkpoint = checkpoint
+
+    def adjust_treatment_on_errors(self, position = None, new_parameters = None, workers: int = 1):
         """ Reapplies the treatment on the point error located at the position "position" with the new parameters "new_parameters".
 
         Parameters
@@ -383,6 +449,8 @@ class Treat(Treat_backend):
             The position of the point error to be adjusted. Default is None.
         new_parameters : list of dictionnaries, optional 
             The list of new parameters to be applied to re-run the treatment on the errors. Each element is either None (if we don't change the parameters) or a dictionnary of the parameters to be passed to the function. Default is None, means that all the parameters used earlier are used.
+        workers : int, optional
+            The number of processes used to treat the points, by default 1 means that the points are treated in the current process. When the PSD is read lazily, the points are always treated in the current process.
         """
         def extract_initial_algorithm():
             """Extracts the functions that are applied before the apply_algorithm_on_all function.
@@ -415,18 +483,14 @@ class Treat(Treat_backend):
                     passed_apply_on_all = True
             return algorithm, combine_algotihm, mark_errors_algorithm
 
-        def set_position(algorithm, position):
-            for f in algorithm["functions"]:
-                if f["function"] == "combine_results_FSR":
-                    f["parameters"]["position"] = position
-            return algorithm
-
         # Extract the algorithm that was used to initially treat the data, the one used to mark the errors and the parameters used to store the extracted values
         algorithm, combine_algorithm, mark_errors_algorithm = extract_initial_algorithm()
 
         # Update the parameters with the new values. If new value is None, keep as is, if False, don't add step, else update with the provided new values
         new_algorithm = {"functions": []}
-        if not new_parameters is None:
+        if new_parameters is None:
+            new_algorithm["functions"] = algorithm["functions"]
+        else:
             for i in range(len(algorithm["functions"])):
                 if new_parameters[i] is None:
                     new_algorithm["functions"].append(algorithm["functions"][i])
@@ -441,37 +505,542 @@ class Treat(Treat_backend):
         
         # If no position are specified, we apply the algorithm on all the points that had errors
         if position is None:
-            position = self.point_error.copy()
+            position = self.point_error
         
         # Sets the _treat_selection attribute to "errors". This makes sure that the algorithm doesn't store the results in _history (reduces the memory usage and time complexity)
         self._treat_selection = "errors"
 
-        # Initialize the list of error points
-        self.point_error = []
-        self.point_error_type = []
-        self.point_error_value = []
+        # Initialize the maps of error points
+        self.error_maps = {}
+
+        # Apply the algorithm on either the provided positions or all the points that had errors, either in this process or on a pool of processes
+        if workers > 1 and isinstance(self.PSD, np.ndarray):
+            self._run_in_workers("_adjust_positions", position, workers, algorithm = new_algorithm, combine_algorithm = combine_algorithm)
+        else:
+            self._adjust_positions(position, algorithm = new_algorithm, combine_algorithm = combine_algorithm)
+
+        # And we mark the errors again.
+        self.silent_run_algorithm(algorithm = mark_errors_algorithm)
+
+    def _adjust_positions(self, positions, algorithm, combine_algorithm, previous = None):
+        """Runs an algorithm on the spectra at the given positions, then combines the results of all these spectra in the global attributes at once. This is the core of adjust_treatment_on_errors, also run by each worker when the treatment is distributed on several processes.
+
+        Parameters
+        ----------
+        positions : list
+            The positions of the spectra to treat
+        algorithm : dict
+            The algorithm to run on each spectrum
+        combine_algorithm : dict
+            The algorithm combining the results of the spectra, its "combine_results_FSR" steps being given the positions of all the spectra
+        previous : list, optional
+            The position treated before the first position when all the positions are treated in a single process, by default None
+        """
+        # Compile the algorithms once for all the positions
+        plan = AlgorithmPlan(self, algorithm)
+        combine_plan = AlgorithmPlan(self, combine_algorithm)
+
+        # Run the algorithm on the previous position so that the points and windows are in the same state as when all the positions are treated in a single process
+        if previous is not None:
+            self.PSD_sample = self._get_spectrum(tuple(previous))
+            plan.run()
 
         # Initialize the callback for the progress bar
         count = 0
-        total = len(position)
+        total = len(positions)
+
+        # Initialize the results of the spectra, combined all at once after they are treated
+        names = ["offset_sample", "shift_sample", "linewidth_sample", "amplitude_sample", "shift_err_sample", "linewidth_err_sample", "amplitude_err_sample"]
+        samples = {name: [] for name in names}
 
-        # Apply the algorithm on either the provided positions or all the points that had errors
-        for PSD_i in position:
-            self.PSD_sample = self.PSD[tuple(PSD_i)]
-            self.silent_run_algorithm(algorithm = new_algorithm)
+        for PSD_i in positions:
+            self.PSD_sample = self._get_spectrum(tuple(PSD_i))
+            plan.run()
 
-            combine_algorithm = set_position(algorithm = combine_algorithm, position = PSD_i)
-            self.silent_run_algorithm(algorithm = combine_algorithm)
+            for name in names:
+                samples[name].append(np.array(getattr(self, name), dtype = float))
 
             if self._progress_callback is not None:
                 count += 1
                 self._progress_callback(count, total)
 
-        # And we mark the errors again.
-        self.silent_run_algorithm(algorithm = mark_errors_algorithm)
+        # Combine the results of all the spectra in a single pass, then leave the sampled results of the last spectrum
+        if total > 0 and len(combine_plan.steps) > 0:
+            for name in names:
+                setattr(self, name, np.array(samples[name]))
+            combine_plan.set_parameters("combine_results_FSR", position = np.asarray(positions))
+            combine_plan.run()
+            for name in names:
+                setattr(self, name, getattr(self, name)[-1].tolist())
+
+    def _apply_algorithm_on_blocks(self, engine = "sequential", workers = 1, warm_start = None):
+        """Applies the algorithm on all the spectra by blocks along the first dimension of the map. When the PSD is read lazily, the spectra of each block are read at once before the block is treated. When a checkpoint is used, the results of each block are saved in the checkpoint once the block is treated, and the blocks whose results are already stored in the checkpoint are loaded instead of being treated.
+
+        Parameters
+        ----------
+        engine : str, optional
+            The engine used to fit the spectra, either "sequential" or "batched", by default "sequential"
+        workers : int, optional
+            The number of processes used to treat each block, by default 1
+        warm_start : str, optional
+            The strategy used to seed the initial guesses of the fits, either None or "neighbors", by default None
+
+        Raises
+        ------
+        ValueError
+            If the PSD array has no dimension to split in blocks or if the stored results don't match the shape of the global attributes.
+        """
+        shape = self.PSD.shape[:-1]
+        if len(shape) == 0:
+            raise ValueError("The treatment of a single spectrum can't be split in blocks.")
+        names = ["offset", "shift", "linewidth", "amplitude", "shift_var", "linewidth_var", "amplitude_var"]
+
+        # Load the results of the spectra already treated
+        completed = np.zeros(shape, dtype = bool)
+        stored = self._checkpoint.load() if self._checkpoint is not None else None
+        if stored is not None:
+            if stored["completed"].shape != shape or any(stored[name].shape != getattr(self, name).shape for name in names):
+                raise ValueError("The results stored in the checkpoint don't match the shape of the treated data.")
+            completed = stored["completed"]
+            for name in names:
+                getattr(self, name)[completed] = stored[name][completed]
+
+        # Report the progress on all the spectra, the ones already treated included
+        callback = self._progress_callback
+        total = int(np.prod(shape))
+        line = total // shape[0]
+
+        if self._checkpoint is not None:
+            block_size = max(int(self._checkpoint.block_size), 1)
+        else:
+            block_size = self._get_block_length()
+        previous_treated = True
+        try:
+            for start in range(0, shape[0], block_size):
+                end = min(start + block_size, shape[0])
+
+                # Skip the blocks already treated
+                if np.all(completed[start:end]):
+                    previous_treated = False
+                    continue
+
+                # Treat the block, the spectra completed before being usable as neighbors for the warm start
+                rows = np.arange(start * line, end * line)
+                self._completed_rows = completed.reshape(-1).copy()
+                if callback is not None:
+                    done = int(np.count_nonzero(completed))
+                    self._progress_callback = lambda count, _: callback(done + count, total)
+
+                # Read the spectra of the block when the PSD is read lazily, together with the last spectrum of the previous block if it is needed
+                if not isinstance(self.PSD, np.ndarray):
+                    self._PSD_block_start = max(start - 1, 0) if not previous_treated else start
+                    self._PSD_block = None
+                    self._PSD_block = np.asarray(self.PSD[self._PSD_block_start:end])
+
+                if workers > 1:
+                    self._run_in_workers("_apply_algorithm_on_rows", rows, workers, engine = engine, warm_start = warm_start)
+                else:
+                    # If the previous block was not treated, run the algorithm on its last spectrum so that the points and windows are in the same state as when all the spectra are treated
+                    previous = rows[0] - 1 if not previous_treated and rows[0] > 0 else None
+                    self._apply_algorithm_on_rows(rows, engine = engine, previous = previous, warm_start = warm_start)
+                previous_treated = True
+
+                # Save the results of the block
+                completed[start:end] = True
+                if self._checkpoint is not None:
+                    results = {name: getattr(self, name) for name in names}
+                    results["completed"] = completed
+                    self._checkpoint.save(results, start, end)
+        finally:
+            self._progress_callback = callback
+            self._completed_rows = None
+            self._PSD_block = None
+
+    def _apply_algorithm_on_rows(self, rows, engine = "sequential", previous = None, warm_start = None):
+        """Runs the algorithm on the spectra at the given rows of the PSD array flattened on all its dimensions but the last one, and stores the results in the global attributes. This is the core of apply_algorithm_on_all, also run by each worker when the treatment is distributed on several processes.
+
+        Parameters
+        ----------
+        rows : array of int
+            The rows of the spectra to treat
+        engine : str, optional
+            The engine used to fit the spectra, either "sequential" or "batched", by default "sequential"
+        previous : int, optional
+            The row treated before the first row when all the spectra are treated in a single process, by default None
+        warm_start : str, optional
+            The strategy used to seed the initial guesses of the fits, either None or "neighbors", by default None
+        """
+        def solve_fit_queue(queue):
+            """Solves the fits queued by the batched engine. The fits sharing the same model, frequency axis and bounds are grouped and solved at once, then the results are stored in the global attributes.
+
+            Parameters
+            ----------
+            queue : dict
+                The queued fits grouped by model, frequency axis and bounds. Each group stores the rows of the spectra in the flattened global attributes, the PSD arrays to fit and the initial guesses.
+            """
+            nb_peaks_sample = self.shift.shape[-1]
+            for (model, nb_peaks, first_peak, _, bounds), group in queue.items():
+                # Fit all the spectra of the group at once
+                if bounds is None:
+                    bounds = (-np.inf, np.inf)
+                IR = self._get_impulse_response(len(group["xdata"]))
+                popt, pcov, _ = batch_curve_fit(f = MODELS[model].vectorized(nb_peaks, IR = IR), 
+                                                xdata = group["xdata"], 
+                                                ydata = np.array(group["ydata"]), 
+                                                p0 = np.array(group["p0"]),
+                                                bounds = bounds,
+                                                jac = MODELS[model].vectorized_jacobian(nb_peaks, IR = IR))
+
+                # Extract the offset, amplitude, shift and linewidth of each peak, the other parameters of the model (for example the slope of the elastic models) being ignored
+                nb_parameters = len(MODELS[model].parameters)
+                std = np.sqrt(np.diagonal(pcov, axis1 = 1, axis2 = 2))
+                popt = popt.reshape((-1, nb_peaks, nb_parameters))[:, :, :4]
+                std = std.reshape((-1, nb_peaks, nb_parameters))[:, :, :4]
+
+                # Store the results in the global attributes
+                rows = np.array(group["rows"])
+                peaks = slice(first_peak, first_peak + nb_peaks)
+                self.offset.reshape((-1, nb_peaks_sample))[rows, peaks] = popt[:, :, 0]
+                self.amplitude.reshape((-1, nb_peaks_sample))[rows, peaks] = popt[:, :, 1]
+                self.shift.reshape((-1, nb_peaks_sample))[rows, peaks] = popt[:, :, 2]
+                self.linewidth.reshape((-1, nb_peaks_sample))[rows, peaks] = np.abs(popt[:, :, 3])
+                self.amplitude_var.reshape((-1, nb_peaks_sample))[rows, peaks] = std[:, :, 1]
+                self.shift_var.reshape((-1, nb_peaks_sample))[rows, peaks] = std[:, :, 2]
+                self.linewidth_var.reshape((-1, nb_peaks_sample))[rows, peaks] = std[:, :, 3]
+
+        # With the batched engine, the fits are queued while the algorithm is run on each spectrum
+        if engine == "batched":
+            self._fit_queue = []
+            queue = {}
+
+        # Compile the algorithm once for all the spectra
+        plan = AlgorithmPlan(self)
+
+        # Run the algorithm on the previous spectrum so that the points and windows are in the same state as when all the spectra are treated in a single process
+        if previous is not None:
+            self.PSD_sample = self._get_spectrum(np.unravel_index(previous, self.shift.shape[:-1]))
+            plan.run()
+            if engine == "batched":
+                self._fit_queue = []
+
+        # Initialize the attributes for the progress callback
+        count = 0
+        total = len(rows)
+
+        # Iterate on each spectrum of the PSD array
+        for row in rows:
+            # Assign the current PSD and frequency arrays to the corresponding variables
+            # The position of the spectrum is given by the shape of the global attributes, the PSD array being only shared with the workers through the block of spectra read when it is read lazily
+            PSD_i = np.unravel_index(row, self.shift.shape[:-1])
+            self.PSD_sample = self._get_spectrum(PSD_i)
+
+            # Seed the guesses of the fits with the results of the neighboring spectra already treated
+            if warm_start == "neighbors":
+                self._warm_start = self._get_neighbor_guesses(PSD_i, first_row = rows[0])
+
+            # Run the algorithm on the current PSD and frequency arrays
+            plan.run()
+
+            self.offset[PSD_i] = self.offset_sample
+            self.shift[PSD_i] = self.shift_sample
+            self.linewidth[PSD_i] = self.linewidth_sample
+            self.shift_var[PSD_i] = self.shift_err_sample
+            self.linewidth_var[PSD_i] = self.linewidth_err_sample
+            self.amplitude[PSD_i] = self.amplitude_sample
+            self.amplitude_var[PSD_i] = self.amplitude_err_sample
+
+            # Group the queued fits by model, frequency axis and bounds, keeping the row of the spectrum in the flattened global attributes
+            if engine == "batched":
+                for fit in self._fit_queue:
+                    bounds = None if fit["bounds"] is None else tuple(tuple(b) for b in fit["bounds"])
+                    key = (fit["model"], fit["nb_peaks"], fit["first_peak"], fit["xdata"].tobytes(), bounds)
+                    if key not in queue:
+                        queue[key] = {"xdata": fit["xdata"], "rows": [], "ydata": [], "p0": []}
+                    queue[key]["rows"].append(row)
+                    queue[key]["ydata"].append(fit["ydata"])
+                    queue[key]["p0"].append(fit["p0"])
+                self._fit_queue = []
+
+            if self._progress_callback is not None:
+                count += 1
+                self._progress_callback(count, total)
+
+        # With the batched engine, solve all the queued fits
+        if engine == "batched":
+            self._fit_queue = None
+            solve_fit_queue(queue)
+
+        self._warm_start = None
+
+    def _run_in_workers(self, task, positions, workers, **parameters):
+        """Distributes a treatment on a pool of processes. The positions to treat are split in chunks that are given to the workers together with a copy of the state of the class (including the algorithm) and the position preceding the chunk, on which the algorithm is run first so that each chunk is treated as if all the positions were treated in a single process. The PSD array and the global attributes are placed in shared memory so that the workers read the spectra and write their results directly in the arrays of the class. The progress callback is called from this process each time a chunk is treated.
+
+        Parameters
+        ----------
+        task : str
+            The name of the method run by the workers on their chunk of positions, either "_apply_algorithm_on_rows" or "_adjust_positions"
+        positions : array or list
+            The positions (or rows) to treat
+        workers : int
+            The number of processes
+        **parameters
+            The parameters given to the task in addition to the positions and the preceding position
+        """
+        # Nothing to distribute if there are no positions to treat
+        if len(positions) == 0:
+            return
+
+        originals, blocks, shared = {}, [], {}
+        try:
+            # Place the PSD array (or the block of spectra read from it when it is read lazily) and the global attributes in shared memory
+            lazy = not isinstance(self.PSD, np.ndarray)
+            for name in (["_PSD_block"] if lazy else ["PSD"]) + self.SHARED_ATTRIBUTES:
+                value = self.__dict__.get(name, None)
+                if value is None:
+                    continue
+                array = np.asarray(value)
+                block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+                blocks.append(block)
+                view = np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)
+                view[...] = array
+                originals[name] = value
+                setattr(self, name, view)
+                shared[name] = (block.name, array.shape, array.dtype.str)
+
+            # Copy the state of the class for the workers, without the shared arrays, the lazily read PSD, the history and the progress callback
+            state = {k: v for k, v in self.__dict__.items() if k not in shared and k not in ["PSD", "_history", "_history_base", "_progress_callback", "_checkpoint"]}
+            state["PSD"] = None
+            state["_history"] = []
+            state["_progress_callback"] = None
+            state["_checkpoint"] = None
+
+            # Split the positions in chunks, each one being given the position that precedes it
+            positions = np.asarray(positions)
+            total = len(positions)
+            limits = np.linspace(0, total, min(total, workers * self.CHUNKS_PER_WORKER) + 1).astype(int)
+            chunks = [(positions[a:b], positions[a-1] if a > 0 else None) for a, b in zip(limits[:-1], limits[1:])]
+
+            # Distribute the chunks and call the progress callback as they are treated
+            count = 0
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                futures = [executor.submit(_treatment_worker, state, shared, task, chunk, {**parameters, "previous": previous}) for chunk, previous in chunks]
+                for future in as_completed(futures):
+                    count += future.result()
+                    if self._progress_callback is not None:
+                        self._progress_callback(count, total)
+        finally:
+            # Get the results out of the shared memory and release it
+            for name in shared:
+                if name in ["PSD", "_PSD_block"]:
+                    setattr(self, name, originals[name])
+                else:
+                    setattr(self, name, np.array(getattr(self, name)))
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def _get_spectrum(self, position):
+        """Returns the spectrum at a given position of the map. When the PSD is read lazily, the spectrum is taken from the block of spectra read by apply_algorithm_on_all if it belongs to it, and read from the PSD otherwise.
+
+        Parameters
+        ----------
+        position : tuple
+            The position of the spectrum in the map
+
+        Returns
+        -------
+        np.ndarray
+            The spectrum
+        """
+        position = tuple(int(i) for i in position)
+        if self._PSD_block is not None and 0 <= position[0] - self._PSD_block_start < len(self._PSD_block):
+            return self._PSD_block[(position[0] - self._PSD_block_start,) + position[1:]]
+        if isinstance(self.PSD, np.ndarray):
+            return self.PSD[position]
+        return np.asarray(self.PSD[position])
+
+    def _get_block_length(self):
+        """Returns the number of elements of the first dimension of the map read at once when the PSD is read lazily, so that a block holds at most "block_size" spectra. When the chunks of the dataset are known, the blocks are aligned on the chunks along the first dimension.
+
+        Returns
+        -------
+        int
+            The number of elements of the first dimension of the map in a block
+        """
+        shape = self.PSD.shape
+        length = max(int(self.block_size) // max(int(np.prod(shape[1:-1])), 1), 1)
+
+        # Align the blocks on the chunks of the dataset so that each chunk is read only once
+        chunks = getattr(self.PSD, "chunks", None)
+        if chunks is not None and len(chunks) == len(shape) and length > chunks[0]:
+            length -= length % chunks[0]
+        return min(length, shape[0])
+
+    def _get_average_spectrum(self):
+        """Returns the average of all the spectra of a PSD read lazily, the spectra being read by blocks (see _get_block_length).
+
+        Returns
+        -------
+        np.ndarray
+            The average spectrum
+        """
+        shape = self.PSD.shape
+        length = self._get_block_length()
+        total = np.zeros(shape[-1])
+        for start in range(0, shape[0], length):
+            total += np.asarray(self.PSD[start:start + length], dtype = float).reshape((-1, shape[-1])).sum(axis = 0)
+        return total / int(np.prod(shape[:-1]))
+
+    def _get_frequency_index(self):
+        """Returns the index of the sampled frequency axis used to locate the points and windows on the axis. The index is built again only when the frequency_sample attribute is replaced, so that it is shared by all the spectra treated with the same frequency axis.
+
+        Returns
+        -------
+        FrequencyIndex
+            The index of the sampled frequency axis
+        """
+        if self._frequency_index is None or self._frequency_index.frequency is not self.frequency_sample:
+            self._frequency_index = FrequencyIndex(self.frequency_sample)
+        return self._frequency_index
+
+    def _get_impulse_response(self, length):
+        """Returns the impulse response convolved with the models fitted on a window of a given length, that is the impulse response cropped around its center to the length of the window and normalized so that its sum is 1. The impulse responses are kept for each length, so that their Fourier transforms are computed once for all the fits.
+
+        Parameters
+        ----------
+        length : int
+            The number of points of the fitted window
+
+        Returns
+        -------
+        ImpulseResponse or None
+            The impulse response, None if no impulse response was set with silent_set_impulse_response
+        """
+        if self._impulse_response is None:
+            return None
+        if length not in self._impulse_response_windows:
+            size = min(length, len(self._impulse_response))
+            start = (len(self._impulse_response) - 1) // 2 - (size - 1) // 2
+            impulse_response = self._impulse_response[start:start + size]
+            self._impulse_response_windows[length] = ImpulseResponse(impulse_response / np.sum(impulse_response))
+        return self._impulse_response_windows[length]
+
+    def _get_neighbor_guesses(self, position, first_row = 0):
+        """Returns the guesses of the shift and linewidth of the peaks of a spectrum seeded from the neighboring spectra already fitted, that is the previous spectrum along each dimension of the map. The results of the peaks that could not be fitted are ignored.
+
+        Parameters
+        ----------
+        position : tuple
+            The position of the spectrum in the map
+        first_row : int, optional
+            The first row treated, the spectra of the previous rows of the PSD array flattened on all its dimensions but the last one being ignored unless they were completed before the treatment started (see _apply_algorithm_on_blocks), by default 0
+
+        Returns
+        -------
+        dict or None
+            The guesses of the shift and linewidth of each peak, NaN for the peaks without any fitted neighbor. None if the spectrum has no neighbor.
+        """
+        # Retrieve the results of the neighbors treated before the spectrum
+        shape = self.shift.shape[:-1]
+        shift, linewidth = [], []
+        for axis in range(len(shape)):
+            if position[axis] == 0:
+                continue
+            neighbor = tuple(p - 1 if i == axis else p for i, p in enumerate(position))
+            row = np.ravel_multi_index(neighbor, shape)
+            if row < first_row and (self._completed_rows is None or not self._completed_rows[row]):
+                continue
+            shift.append(self.shift[neighbor])
+            linewidth.append(self.linewidth[neighbor])
+        if len(shift) == 0:
+            return None
+
+        # Average the results of the neighbors for each peak, ignoring the peaks that could not be fitted
+        shift, linewidth = np.array(shift), np.array(linewidth)
+        valid = np.isfinite(shift) & np.isfinite(linewidth)
+        count = np.sum(valid, axis = 0)
+        mean = lambda a: np.where(count > 0, np.sum(np.where(valid, a, 0), axis = 0) / np.maximum(count, 1), np.nan)
+        return {"shift": mean(shift), "linewidth": mean(linewidth)}
+
+    def _warm_start_guesses(self, peaks, guess_gamma):
+        """Replaces the guesses of the shift and linewidth of the peaks with the ones seeded from the neighboring spectra, when the algorithm is applied to all the spectra with a warm start. The guesses of the peaks that could not be seeded are kept.
+
+        Parameters
+        ----------
+        peaks : list
+            The guesses of the shift of the peaks
+        guess_gamma : list
+            The guesses of the linewidth of the peaks
+
+        Returns
+        -------
+        2-tuple of lists
+            The guesses of the shift and linewidth of the peaks
+        """
+        if self._warm_start is None:
+            return peaks, guess_gamma
+        peaks, guess_gamma = list(peaks), list(guess_gamma)
+        for i, (shift, linewidth) in enumerate(zip(self._warm_start["shift"], self._warm_start["linewidth"])):
+            if i < len(peaks) and np.isfinite(shift):
+                peaks[i] = float(shift)
+                guess_gamma[i] = float(linewidth)
+        return peaks, guess_gamma
 
     # Fitting functions
 
+    def _curve_fit(self, model, xdata, ydata, p0, bounds = None, nb_peaks = 1):
+        """Fits a model of the registry of models to the data with scipy.optimize.curve_fit, using the analytic jacobian of the model. If an impulse response was set with silent_set_impulse_response, the model and its jacobian are convolved with it. When the algorithm is applied to all the spectra with the batched engine, the fit is not performed but stored in the _fit_queue attribute to be solved later together with the fits of all the other spectra. The initial guess is then returned in place of the fitted parameters, so that the following steps of the algorithm can still be run (see apply_algorithm_on_all for the algorithms that can't be batched).
+
+        Parameters
+        ----------
+        model : str
+            The name of the model in the registry of models
+        xdata : array
+            The frequency array to fit
+        ydata : array
+            The PSD array to fit
+        p0 : list
+            The initial guess of the parameters
+        bounds : list, optional
+            The lower and upper bounds of the parameters, by default None means no bounds
+        nb_peaks : int, optional
+            The number of peaks fitted at once, their contributions being summed, by default 1
+
+        Returns
+        -------
+        2-tuple of arrays
+            The fitted parameters and their covariance matrix
+        """
+        # If the fits are queued, store the fit together with the index of its first peak in the fitted lists
+        if self._fit_queue is not None:
+            self._fit_queue.append({"model": model,
+                                    "nb_peaks": nb_peaks,
+                                    "first_peak": len(self.shift_sample),
+                                    "xdata": xdata,
+                                    "ydata": ydata,
+                                    "p0": p0,
+                                    "bounds": bounds})
+            return np.array(p0, dtype = float), np.full((len(p0), len(p0)), np.nan)
+
+        # Select the model and its jacobian, summing the contributions of the peaks if more than one peak is fitted, and convolving them with the impulse response of the instrument if it is set
+        entry = MODELS[model]
+        IR = self._get_impulse_response(len(xdata))
+        if nb_peaks == 1 and IR is None:
+            f = entry.function
+            jac = entry.jacobian
+        elif nb_peaks == 1:
+            f = lambda x, *p: entry.evaluate(x, *p, IR = IR)
+            jac = None if entry.jacobian is None else lambda x, *p: entry.evaluate_jacobian(x, *p, IR = IR)
+        else:
+            vectorized_model = entry.vectorized(nb_peaks, IR = IR)
+            vectorized_jacobian = entry.vectorized_jacobian(nb_peaks, IR = IR)
+            f = lambda x, *p: vectorized_model(x, np.array([p]))[0]
+            jac = None if vectorized_jacobian is None else lambda x, *p: vectorized_jacobian(x, np.array([p]))[0]
+
+        if bounds is None:
+            return optimize.curve_fit(f, xdata, ydata, p0 = p0, jac = jac)
+        return optimize.curve_fit(f, xdata, ydata, p0 = p0, bounds = bounds, jac = jac)
+
     def single_fit_all_inelastic(self, default_width: float = 1, guess_offset: bool = False, update_point_position: bool = True, bound_shift: list = None, bound_linewidth: list = None):
         """
         Fits each inelastically scattered peak individually. The linewidth can be estimated beforehand using the function estimate_width_inelastic_peaks. If not estimated, a fixed width is used (default_width). The offset can also be guessed or not (guess_offset). In the case the offset is guessed, the minimum of the data on the selected window is used as an initial guess. 
@@ -505,15 +1074,17 @@ class Treat(Treat_backend):
 
             Returns
             -------
-            3-tuple of lists
+            4-tuple of lists
+                indices: the indices of the peaks in the list of points
                 peaks: the list of peaks
                 windows: the list of windows around the peaks
                 guess_gamma: the list of guess for the width of the peaks
             """
-            peaks, windows, guess_gamma = [], [], []
+            indices, peaks, windows, guess_gamma = [], [], [], []
             for i in range(len(self.points)):
                 # If the selected peak is an inelastic peak, extract the peak position and the window around it
                 if self.points[i][0].split("_")[0] in ["Anti-Stokes", "Stokes"]:
+                    indices.append(i)
                     peaks.append(self.points[i][1])
                     windows.append(self.windows[i])
 
@@ -522,7 +1093,7 @@ class Treat(Treat_backend):
                         guess_gamma.append(self.width_estimator[i])
                     else:
                         guess_gamma.append(default_width)
-            return peaks, windows, guess_gamma
+            return indices, peaks, windows, guess_gamma
 
         def update_results(popt = None, pcov = None, all_nan=False):
             """
@@ -563,13 +1134,20 @@ class Treat(Treat_backend):
             raise ValueError("The model has not been defined. Please use the function 'define_model' to define the model before calling 'fit_all_inelastic_of_curve'.")
     
         # Extract the points to fit, select only the ones of type Stokes or Anti-Stokes. Also extract the guess for the width of the peaks or if it is not defined, use the default width
-        peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+        indices, peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+
+        # Seed the guesses of the shift and linewidth with the results of the neighboring spectra when the algorithm is applied with a warm start
+        peaks, guess_gamma = self._warm_start_guesses(peaks, guess_gamma)
         
+        # Retrieve the index of the frequency axis to locate the peaks and the windows, and the entry of the model in the registry of models
+        frequency_index = self._get_frequency_index()
+        entry = MODELS[self.fit_model]
+
         # Fit each peak that has been selected
-        for peak, window, gamma, bs, bl in zip(peaks, windows, guess_gamma, bound_shift, bound_linewidth):
+        for index, peak, window, gamma, bs, bl in zip(indices, peaks, windows, guess_gamma, bound_shift, bound_linewidth):
             # Extract the peak position and the window around the peak
-            pos_peak = np.argmin(np.abs(self.frequency_sample - peak))
-            pos_window = np.where((self.frequency_sample >= window[0]) & (self.frequency_sample <= window[1]))
+            pos_peak = frequency_index.nearest(peak)
+            pos_window = frequency_index.window(window)
 
             # Guess the amplitude of the peak by selecting its intensity
             amplitude_guess = self.PSD_sample[pos_peak]
@@ -580,69 +1158,32 @@ class Treat(Treat_backend):
             else: 
                 offset_guess = 0
 
-            # Check if we want to correct for the presence of an elastic peak and apply the fitting
-            models = Models()
-
-            if "elastic" in self.fit_model:
-                # Define the bounds for the fit (ensure the linewidth is positive)
-                bounds = [[-np.inf, -np.inf, -np.inf, 0, -np.inf], [np.inf, np.inf, np.inf, np.inf, np.inf]]
+            # Define the bounds for the fit from the default bounds of the model (which ensure for example that the linewidth is positive)
+            bounds = [list(entry.bounds[0]), list(entry.bounds[1])]
 
-                # If bounds are provided for the shift or the linewidth , update them accordingly
-                if bound_shift is not None:
-                    bounds[0][2] = bs[0]
-                    bounds[1][2] = bs[1]
-                    peak = min(max(peak, bounds[0][2]), bounds[1][2])  # Ensure the peak is within the bounds
-                if bound_linewidth is not None:
-                    bounds[0][3] = bl[0]
-                    bounds[1][3] = bl[1]
-                    gamma = min(max(gamma, bounds[0][3]), bounds[1][3])  # Ensure the gamma is within the bounds
-
-                # Estimate the slope from the first and last points of the window
-                slope_guess = (self.PSD_sample[pos_window[0][-1]] - self.PSD_sample[pos_window[0][0]])/(self.frequency_sample[pos_window[0][-1]] - self.frequency_sample[pos_window[0][0]])
+            # If bounds are provided for the shift or the linewidth , update them accordingly
+            if bound_shift is not None:
+                bounds[0][2] = bs[0]
+                bounds[1][2] = bs[1]
+                peak = min(max(peak, bounds[0][2]), bounds[1][2])  # Ensure the peak is within the bounds
+            if bound_linewidth is not None:
+                bounds[0][3] = bl[0]
+                bounds[1][3] = bl[1]
+                gamma = min(max(gamma, bounds[0][3]), bounds[1][3])  # Ensure the gamma is within the bounds
 
-                # Adjust the offset accordingly
-                if self.PSD_sample[pos_window[0][0]] < self.PSD_sample[pos_window[0][-1]]:
-                    offset_guess = offset_guess - slope_guess*self.frequency_sample[pos_window[0][0]]
-                else:
-                    offset_guess = offset_guess - slope_guess*self.frequency_sample[pos_window[0][-1]]
-                
-                # Adjust the amplitude accordingly
-                amplitude_guess = amplitude_guess - offset_guess - slope_guess * (self.frequency_sample[pos_peak])
-
-                error_fit = False
-                try:
-                    popt, pcov = optimize.curve_fit(f = models.models[self.fit_model], 
-                                                    xdata = self.frequency_sample[pos_window], 
-                                                    ydata = self.PSD_sample[pos_window], 
-                                                    p0 = [offset_guess, amplitude_guess, peak, gamma, slope_guess],
-                                                    bounds = bounds)
-                except Exception as e:
-                    print(e)
-                    error_fit = True
-            else:
-                # Define the bounds for the fit (ensure the linewidth and amplitude are positive)
-                bounds = [[-np.inf, 0, -np.inf, 0], [np.inf, np.inf, np.inf, np.inf]]
+            # Guess the parameters of the model, for example the slope of an elastic correction from the first and last points of the window
+            p0 = entry.guess(self.frequency_sample[pos_window], self.PSD_sample[pos_window], offset_guess, peak, gamma, (self.frequency_sample[pos_peak], amplitude_guess))
 
-                # If bounds are provided for the shift or the linewidth , update them accordingly
-                if bound_shift is not None:
-                    bounds[0][2] = bs[0]
-                    bounds[1][2] = bs[1]
-                    peak = min(max(peak, bounds[0][2]), bounds[1][2])  # Ensure the peak is within the bounds
-                if bound_linewidth is not None:
-                    bounds[0][3] = bl[0]
-                    bounds[1][3] = bl[1]
-                    gamma = min(max(gamma, bounds[0][3]), bounds[1][3])  # Ensure the gamma is within the bounds
-
-                error_fit = False
-                try:
-                    popt, pcov = optimize.curve_fit(f = models.models[self.fit_model], 
-                                                    xdata = self.frequency_sample[pos_window], 
-                                                    ydata = self.PSD_sample[pos_window], 
-                                                    p0 = [offset_guess, amplitude_guess, peak, gamma],
-                                                    bounds = bounds)
-                except Exception as e:
-                    print(e)
-                    error_fit = True
+            error_fit = False
+            try:
+                popt, pcov = self._curve_fit(model = self.fit_model, 
+                                             xdata = self.frequency_sample[pos_window], 
+                                             ydata = self.PSD_sample[pos_window], 
+                                             p0 = p0,
+                                             bounds = bounds)
+            except Exception as e:
+                print(e)
+                error_fit = True
 
             # If the fit succeeded, update the parameters, if not store np.nan
             if not error_fit:
@@ -652,12 +1193,7 @@ class Treat(Treat_backend):
 
             # If the user want to update the peak position with the fitted shift, update the point positions
             if update_point_position:
-                for i, elt in enumerate(self.points):                
-                    if elt[1] == peak:
-                        index = i
-                        pos_peak = self.shift_sample[-1]
-                        self.points[index][1] = pos_peak
-                        break
+                self.points[index][1] = self.shift_sample[-1]
 
     def multi_fit_all_inelastic(self, default_width: float = 1, guess_offset: bool = False, update_point_position: bool = True, bound_shift: list = None, bound_linewidth: list = None):
         """
@@ -692,15 +1228,17 @@ class Treat(Treat_backend):
 
             Returns
             -------
-            3-tuple of lists
+            4-tuple of lists
+                indices: the indices of the peaks in the list of points
                 peaks: the list of peaks
                 windows: the list of windows around the peaks
                 guess_gamma: the list of guess for the width of the peaks
             """
-            peaks, windows, guess_gamma = [], [], []
+            indices, peaks, windows, guess_gamma = [], [], [], []
             for i in range(len(self.points)):
                 # If the selected peak is an inelastic peak, extract the peak position and the window around it
                 if self.points[i][0].split("_")[0] in ["Anti-Stokes", "Stokes"]:
+                    indices.append(i)
                     peaks.append(self.points[i][1])
                     windows.append(self.windows[i])
 
@@ -709,7 +1247,7 @@ class Treat(Treat_backend):
                         guess_gamma.append(self.width_estimator[i])
                     else:
                         guess_gamma.append(default_width)
-            return peaks, windows, guess_gamma
+            return indices, peaks, windows, guess_gamma
 
         def update_results(popt = None, pcov = None, all_nan=False):
             """
@@ -729,8 +1267,10 @@ class Treat(Treat_backend):
                 popt = np.array([np.nan for i in range(len(popt))])
                 pcov = np.array([[np.nan for i in range(len(popt))] for i in range(len(popt))])
             
-            popt = popt.reshape((-1,4))
-            std = np.sqrt(np.diag(pcov)).reshape((-1,4))
+            # Extract the offset, amplitude, shift and linewidth of each peak, the other parameters of the model being ignored
+            nb_parameters = len(MODELS[self.fit_model].parameters)
+            popt = popt.reshape((-1, nb_parameters))[:, :4]
+            std = np.sqrt(np.diag(pcov)).reshape((-1, nb_parameters))[:, :4]
 
             # Save the fitted parameters in the corresponding sample lists
             self.offset_sample = popt[:, 0].tolist()
@@ -751,7 +1291,10 @@ class Treat(Treat_backend):
             raise ValueError("The model has not been defined. Please use the function 'define_model' to define the model before calling 'fit_all_inelastic_of_curve'.")
     
         # Extract the points to fit, select only the ones of type Stokes or Anti-Stokes. Also extract the guess for the width of the peaks or if it is not defined, use the default width
-        peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+        indices, peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+
+        # Seed the guesses of the shift and linewidth with the results of the neighboring spectra when the algorithm is applied with a warm start
+        peaks, guess_gamma = self._warm_start_guesses(peaks, guess_gamma)
 
         # Initializes the initial conditions and boundary conditions for the fit
         p0 = []
@@ -760,11 +1303,15 @@ class Treat(Treat_backend):
         # Initializes the window for the fit
         wndw_fit = np.array([])
         
+        # Retrieve the index of the frequency axis to locate the peaks and the windows, and the entry of the model in the registry of models
+        frequency_index = self._get_frequency_index()
+        entry = MODELS[self.fit_model]
+
         # Fit each peak that has been selected
-        for peak, window, gamma, bs, bl in zip(peaks, windows, guess_gamma, bound_shift, bound_linewidth):
+        for index, peak, window, gamma, bs, bl in zip(indices, peaks, windows, guess_gamma, bound_shift, bound_linewidth):
             # Extract the peak position and the window around the peak
-            pos_peak = np.argmin(np.abs(self.frequency_sample - peak))
-            pos_window = np.where((self.frequency_sample >= window[0]) & (self.frequency_sample <= window[1]))
+            pos_peak = frequency_index.nearest(peak)
+            pos_window = frequency_index.window(window)
             wndw_fit = np.append(wndw_fit, pos_window)
 
             # Guess the amplitude of the peak by selecting its intensity
@@ -776,15 +1323,12 @@ class Treat(Treat_backend):
             else: 
                 offset_guess = 0
 
-            # Check if we want to correct for the presence of an elastic peak and apply the fitting
-            models = Models()
-
             # Check if the model is elastic and if so, raise an error if the fit_model is not compatible with the elastic correction
             if "elastic" in self.fit_model:
                 raise ValueError("The multi-fit for inelastic peaks does not support the elastic correction. Please use the single fit for inelastic peaks instead.")
             
-            # Define the bounds for the fit (ensure the linewidth and amplitude are positive)
-            temp_bounds = [[-np.inf, 0, -np.inf, 0], [np.inf, np.inf, np.inf, np.inf]]
+            # Define the bounds for the fit from the default bounds of the model (which ensure for example that the linewidth and amplitude are positive)
+            temp_bounds = [list(entry.bounds[0]), list(entry.bounds[1])]
 
             # If bounds are provided for the shift or the linewidth , update them accordingly
             if bound_shift is not None:
@@ -797,48 +1341,28 @@ class Treat(Treat_backend):
                 gamma = min(max(gamma, bl[0]), bl[1])  # Ensure the gamma is within the bounds
 
             # Append the initial conditions to the list of initial conditions
-            if len(p0) == 0:
-                # If this is the first peak, we initialize the initial conditions
-                p0 += [offset_guess, amplitude_guess, peak, gamma]
-            else:
+            guess = entry.guess(self.frequency_sample[pos_window], self.PSD_sample[pos_window], offset_guess, peak, gamma, (self.frequency_sample[pos_peak], amplitude_guess))
+            if len(p0) > 0:
                 # Ensure that only one constant parameter is used for all the curve
                 temp_bounds[0][0] = -1e-10
                 temp_bounds[1][0] = 1e-10
-                p0 += [0, amplitude_guess, peak, gamma]
+                guess[0] = 0
+            p0 += guess
 
             # Append the bounds to the list of bounds
             bounds[0] += temp_bounds[0]
             bounds[1] += temp_bounds[1]
         
-        def func(x, *p0):
-            """
-            The function to fit the data. It sums the contributions of all the peaks defined in p0.
-
-            Parameters
-            ----------
-            x : array-like
-                The frequency array to fit
-            p0 : list 
-                The list of initial conditions for each peak
-
-            Returns
-            -------
-            array-like
-                The sum of the contributions of all the peaks at the given frequencies
-            """
-            p0 = np.array(p0).reshape((-1, 4))
-            # Sum the contributions of all the peaks defined in p0
-            return sum(models.models[self.fit_model](x, *params) for params in p0)
-
         wndw_fit = np.unique(wndw_fit.astype(int))
 
         error_fit = False
         try:
-            popt, pcov = optimize.curve_fit(f = func, 
-                                            xdata = self.frequency_sample[wndw_fit], 
-                                            ydata = self.PSD_sample[wndw_fit], 
-                                            p0 = p0,
-                                            bounds = bounds)
+            popt, pcov = self._curve_fit(model = self.fit_model, 
+                                         xdata = self.frequency_sample[wndw_fit], 
+                                         ydata = self.PSD_sample[wndw_fit], 
+                                         p0 = p0,
+                                         bounds = bounds,
+                                         nb_peaks = len(p0) // len(entry.parameters))
         except Exception as e:
             print(e)
             error_fit = True
@@ -852,12 +1376,7 @@ class Treat(Treat_backend):
 
         # If the user want to update the peak position with the fitted shift, update the point positions
         if update_point_position:
-            for i, elt in enumerate(self.points):                
-                if elt[1] == peak:
-                    index = i
-                    pos_peak = self.shift_sample[-1]
-                    self.points[index][1] = pos_peak
-                    break
+            self.points[index][1] = self.shift_sample[-1]
 
     def fit_all_inelastic_of_curve(self, default_width: float = 1, guess_offset: bool = False, update_point_position: bool = True, bound_shift: list = None, bound_linewidth: list = None):
         """
@@ -887,16 +1406,17 @@ class Treat(Treat_backend):
             self.slope_sample = []
         
         def extract_point_window_gammaGuess():
-            peaks, windows, guess_gamma = [], [], []
+            indices, peaks, windows, guess_gamma = [], [], [], []
             for i in range(len(self.points)):
                 if self.points[i][0].split("_")[0] in ["Anti-Stokes", "Stokes"]:
+                    indices.append(i)
                     peaks.append(self.points[i][1])
                     windows.append(self.windows[i])
                     if len(self.width_estimator) > 0:
                         guess_gamma.append(self.width_estimator[i])
                     else:
                         guess_gamma.append(default_width)
-            return peaks, windows, guess_gamma
+            return indices, peaks, windows, guess_gamma
 
         def update_results(popt = None, pcov = None, all_nan=False):
             if all_nan:
@@ -921,13 +1441,20 @@ class Treat(Treat_backend):
             raise ValueError("The model has not been defined. Please use the function 'define_model' to define the model before calling 'fit_all_inelastic_of_curve'.")
     
         # Extract the points to fit, select only the ones of type Stokes or Anti-Stokes. Also extract the guess for the width of the peaks or if it is not defined, use the default width
-        peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+        indices, peaks, windows, guess_gamma = extract_point_window_gammaGuess()
+
+        # Seed the guesses of the shift and linewidth with the results of the neighboring spectra when the algorithm is applied with a warm start
+        peaks, guess_gamma = self._warm_start_guesses(peaks, guess_gamma)
         
+        # Retrieve the index of the frequency axis to locate the peaks and the windows, and the entry of the model in the registry of models
+        frequency_index = self._get_frequency_index()
+        entry = MODELS[self.fit_model]
+
         # Fit each peak that has been selected
-        for peak, window, gamma in zip(peaks, windows, guess_gamma):
+        for index, peak, window, gamma in zip(indices, peaks, windows, guess_gamma):
             # Extract the peak position and the window around the peak
-            pos_peak = np.argmin(np.abs(self.frequency_sample - peak))
-            pos_window = np.where((self.frequency_sample >= window[0]) & (self.frequency_sample <= window[1]))
+            pos_peak = frequency_index.nearest(peak)
+            pos_window = frequency_index.window(window)
 
             # Guess the amplitude of the peak by selecting its intensity
             amplitude_guess = self.PSD_sample[pos_peak]
@@ -938,39 +1465,17 @@ class Treat(Treat_backend):
             else: 
                 offset_guess = 0
 
-            # Check if we want to correct for the presence of an elastic peak and apply the fitting
-            models = Models()
-
-            if "elastic" in self.fit_model:
-                # Estimate the slope from the first and last points of the window
-                slope_guess = (self.PSD_sample[pos_window[0][-1]] - self.PSD_sample[pos_window[0][0]])/(self.frequency_sample[pos_window[0][-1]] - self.frequency_sample[pos_window[0][0]])
+            # Guess the parameters of the model, for example the slope of an elastic correction from the first and last points of the window, and apply the fitting
+            p0 = entry.guess(self.frequency_sample[pos_window], self.PSD_sample[pos_window], offset_guess, peak, gamma, (self.frequency_sample[pos_peak], amplitude_guess))
 
-                # Adjust the offset accordingly
-                if self.PSD_sample[pos_window[0][0]] < self.PSD_sample[pos_window[0][-1]]:
-                    offset_guess = offset_guess - slope_guess*self.frequency_sample[pos_window[0][0]]
-                else:
-                    offset_guess = offset_guess - slope_guess*self.frequency_sample[pos_window[0][-1]]
-                
-                # Adjust the amplitude accordingly
-                amplitude_guess = amplitude_guess - offset_guess - slope_guess * (self.frequency_sample[pos_peak])
-
-                error_fit = False
-                try:
-                    popt, pcov = optimize.curve_fit(models.models[self.fit_model], 
-                                                    self.frequency_sample[pos_window], 
-                                                    self.PSD_sample[pos_window], 
-                                                    p0=[offset_guess, amplitude_guess, peak, gamma, slope_guess])
-                except:
-                    error_fit = True
-            else:
-                error_fit = False
-                try:
-                    popt, pcov = optimize.curve_fit(models.models[self.fit_model], 
-                                                    self.frequency_sample[pos_window], 
-                                                    self.PSD_sample[pos_window], 
-                                                    p0=[offset_guess, amplitude_guess, peak, gamma])
-                except:
-                    error_fit = True
+            error_fit = False
+            try:
+                popt, pcov = self._curve_fit(self.fit_model, 
+                                             self.frequency_sample[pos_window], 
+                                             self.PSD_sample[pos_window], 
+                                             p0=p0)
+            except:
+                error_fit = True
 
             # If the fit succeeded, check that the bounds are not violated and update the parameters, if not store np.nan
             if not error_fit:
@@ -987,12 +1492,7 @@ class Treat(Treat_backend):
 
             # Update the points with the fitted shift of the peak.
             if update_point_position:
-                for i, elt in enumerate(self.points):                
-                    if elt[1] == peak:
-                        index = i
-                        pos_peak = self.shift_sample[-1]
-                        self.points[index][1] = pos_peak
-                        break
+                self.points[index][1] = self.shift_sample[-1]
 
     # Post-treatment functions
 
@@ -1018,7 +1518,7 @@ class Treat(Treat_backend):
             sel = 0
             I = 0
             for i, p in enumerate(peaks):
-                pos = np.argmin(np.abs(self.frequency_sample - p))
+                pos = self._get_frequency_index().nearest(p)
                 if self.PSD_sample[pos] > I:
                     sel = i
                     I = self.PSD_sample[pos]
@@ -1026,12 +1526,11 @@ class Treat(Treat_backend):
             window = windows[sel]
 
             # Estimate the width of the peaks
-            models = Models()
-            lorentzian = models.models["Lorentzian"]
+            lorentzian = MODELS["Lorentzian"].function
 
             # Fit the peak
             try:
-                popt, pcov = curve_fit(lorentzian, self.frequency_sample[window[0]:window[1]], self.PSD_sample[window[0]:window[1]], p0=[0, I, peak, 1])
+                popt, pcov = optimize.curve_fit(lorentzian, self.frequency_sample[window[0]:window[1]], self.PSD_sample[window[0]:window[1]], p0=[0, I, peak, 1])
             except:
                 return
             
@@ -1044,6 +1543,7 @@ class Treat(Treat_backend):
         """
         Combines the results of the algorithm to have a value for frequency shift based on a known Free Spectral Range (FSR) value. The end shift value is obtained by "moving" the peak by a FSR value until the peak is within the [-FSR/2, FSR/2] range. Then the absolute value of the shift is taken as the end shift value.
         The combination of the result is done by taking the average of all the values by default. Alternatively, the user can choose to keep the maximum of the amplitude of the peak by setting the "keep_max_amplitude" parameter to True. The user can also choose to weight the shift and linewidth by the amplitude of the peak by setting the "amplitude_weight" parameter to True. Note that in the latter case, the precise knowledge of the frequency axis is a must as averaging slightly uncentered peaks will lead to a wrong result.
+        The results of all the peaks are combined at once on arrays of shape (..., n_peaks), whether these arrays are the global attributes or the results of one or several re-fitted spectra.
 
         Parameters
         ----------
@@ -1056,7 +1556,7 @@ class Treat(Treat_backend):
         shift_err_weight : bool, optional
             If True, the inverse of the standard deviation of the shift is used to weight the shift and linewidth. If set to false, a simple average is performed. Default is False.
         position: list, optional
-            The position of the spectrum to be updated in case we combine the sampled results. This is used to update the values of a spectrum that has been re-fitted.  
+            The position of the spectrum to be updated in case we combine the sampled results. This is used to update the values of a spectrum that has been re-fitted. A list of positions can also be given to update several spectra at once, the sampled results being then arrays of shape (n_positions, n_peaks).
         """
         def nature_peaks():
             """
@@ -1069,11 +1569,56 @@ class Treat(Treat_backend):
                     tpe.append(self.points[i][0].split("_")[0])
             return tpe
 
+        def combine(offset, shift, linewidth, amplitude, shift_var, linewidth_var, amplitude_var):
+            """Combines the results of all the peaks, given as arrays of shape (..., n_peaks), into arrays of shape (...).
+
+            Returns
+            -------
+            7-tuple of arrays
+                The combined offset, shift, linewidth, amplitude, shift variance, linewidth variance and amplitude variance
+            """
+            # Select the results of the peak of maximal amplitude
+            if keep_max_amplitude:
+                max_indices = np.expand_dims(np.argmax(amplitude, axis = -1), axis = -1)
+                return tuple(np.take_along_axis(a, max_indices, axis = -1).squeeze(-1) for a in [offset, shift, linewidth, amplitude, shift_var, linewidth_var, amplitude_var])
+
+            # Average the results weighted by the amplitude of the peaks
+            if amplitude_weight:
+                norm = np.sum(amplitude**2, axis = -1)
+                return (np.average(offset, axis = -1, weights = amplitude),
+                        np.average(shift, axis = -1, weights = amplitude),
+                        np.average(linewidth, axis = -1, weights = amplitude),
+                        np.average(amplitude, axis = -1, weights = amplitude),
+                        np.sum(shift_var**2 * amplitude**2, axis = -1) / norm,
+                        np.sum(linewidth_var**2 * amplitude**2, axis = -1) / norm,
+                        np.sum(amplitude_var**4, axis = -1) / norm)
+
+            # Average the results weighted by the inverse of the variance of the shift
+            if shift_err_weight:
+                norm = np.sum(1 / shift_var**2, axis = -1)
+                return (np.average(offset, axis = -1, weights = 1 / shift_var),
+                        np.average(shift, axis = -1, weights = 1 / shift_var),
+                        np.average(linewidth, axis = -1, weights = 1 / shift_var),
+                        np.average(amplitude, axis = -1, weights = 1 / shift_var),
+                        shift_var.shape[-1] / norm,
+                        np.sum(linewidth_var**2 / shift_var**2, axis = -1) / norm,
+                        np.sum(amplitude_var**2 / shift_var**2, axis = -1) / norm)
+
+            # Average the results, ignoring the peaks that could not be fitted
+            return (np.nanmean(offset, axis = -1),
+                    np.nanmean(shift, axis = -1),
+                    np.nanmean(linewidth, axis = -1),
+                    np.nanmean(amplitude, axis = -1),
+                    np.nanmean(shift_var**2, axis = -1),
+                    np.nanmean(linewidth_var**2, axis = -1),
+                    np.nanmean(amplitude_var**2, axis = -1))
+
         # Check if the user has set both combining methods to True, if so raise an error
         if keep_max_amplitude and amplitude_weight:
             raise ValueError("The parameters 'keep_max_amplitude' and 'amplitude_weight' cannot be both set to True.")
 
         if position is None:
+            results = [self.offset, self.shift, self.linewidth, self.amplitude, self.shift_var, self.linewidth_var, self.amplitude_var]
             if len(self.shift.shape) == 1:
                 shift = self.shift
             else:
@@ -1082,133 +1627,122 @@ class Treat(Treat_backend):
                 while shift.ndim > 1:
                     shift = np.mean(shift, axis = 0)
         else:
-            shift = self.shift_sample
-        
-        # Get the nature of the peaks (Stokes or Anti-Stokes)
-        nature = nature_peaks()
+            results = [np.array(a, dtype = float) for a in [self.offset_sample, self.shift_sample, self.linewidth_sample, self.amplitude_sample, self.shift_err_sample, self.linewidth_err_sample, self.amplitude_err_sample]]
+            shift = results[1]
 
-        # Compute the correction factor to ensure the shift is contained in [-FSR/2, FSR/2]
-        k = []
-        for s in shift:
-            temp = -(s+FSR/2)/FSR
-            k.append(np.ceil(temp))
+        # Get the sign of the shift of each fitted peak, the shift of the Anti-Stokes peaks being reversed. The points are added again each time the algorithm is run on a spectrum, so only the natures of the first fitted peaks are used
+        sign = np.where(np.array(nature_peaks()[:results[1].shape[-1]]) == "Anti-Stokes", -1, 1)
+
+        # Move the shift values by a multiple of the FSR to ensure they are contained in [-FSR/2, FSR/2], then reverse the Anti-Stokes ones
+        k = np.ceil(-(shift+FSR/2)/FSR)
+        results[1] = (results[1] + k * FSR) * sign
+
+        # Combine the results of the peaks and compute the BLT
+        offset, shift, linewidth, amplitude, shift_var, linewidth_var, amplitude_var = combine(*results)
+        BLT = linewidth / shift
+        BLT_var = BLT**2 * ((linewidth_var / linewidth)**2 + (shift_var / shift)**2)
 
         if position is None:
-            # Realign the shift values
-            if len(self.shift.shape) > 1:
-                self.shift = np.moveaxis(self.shift, [0, -1], [-1, 0])
-                for i in range(len(k)):
-                    self.shift[i] += k[i] * FSR
-                    if nature[i] == "Anti-Stokes":
-                        self.shift[i] = -self.shift[i]
-                self.shift = np.moveaxis(self.shift, [-1, 0], [0, -1])
-            else:
-                for i in range(len(k)):
-                    self.shift[i] += k[i] * FSR
-                    if nature[i] == "Anti-Stokes":
-                        self.shift[i] = -self.shift[i]
-        else:
-            for i in range(len(k)):
-                self.shift_sample[i] += k[i] * FSR
-                if nature[i] == "Anti-Stokes":
-                    self.shift_sample[i] = -self.shift_sample[i]
-            offset_sample = np.array(self.offset_sample)
-            shift_sample = np.array(self.shift_sample)
-            linewidth_sample = np.array(self.linewidth_sample)
-            amplitude_sample = np.array(self.amplitude_sample)
-            shift_err_sample = np.array(self.shift_err_sample)
-            linewidth_err_sample = np.array(self.linewidth_err_sample)
-            amplitude_err_sample = np.array(self.amplitude_err_sample)
-
-
-        # If keep_max_amplitude is set to True, we select only the shift corresponding to the maximum amplitude
-        if keep_max_amplitude:
-            if position is None:
-                # For each set of amplitudes along the last axis, find the index of the maximum amplitude
-                max_indices = np.argmax(self.amplitude, axis=-1)
-                # Use advanced indexing to select the corresponding shift values
-                self.offset = np.take_along_axis(self.offset, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.shift = np.take_along_axis(self.shift, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.amplitude = np.take_along_axis(self.amplitude, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.linewidth = np.take_along_axis(self.linewidth, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.shift_var = np.take_along_axis(self.shift_var, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.linewidth_var = np.take_along_axis(self.linewidth_var, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-                self.amplitude_var = np.take_along_axis(self.amplitude_var, np.expand_dims(max_indices, axis=-1), axis=-1).squeeze(-1)
-            else:
-                pos = np.argmax(amplitude_sample)
-                self.offset[tuple(position)] = offset_sample[pos]
-                self.shift[tuple(position)] = shift_sample[pos]
-                self.linewidth[tuple(position)] = linewidth_sample[pos]
-                self.shift_var[tuple(position)] = shift_err_sample[pos]
-                self.linewidth_var[tuple(position)] = linewidth_err_sample[pos]
-                self.amplitude[tuple(position)] = amplitude_sample[pos]
-                self.amplitude_var[tuple(position)] = amplitude_err_sample[pos]
-        
-        elif amplitude_weight:
-            if position is None:
-                # For each set of amplitudes along the last axis, calculate the weighted average of the shift and linewidth
-                self.offset = np.average(self.offset, axis=-1, weights=self.amplitude)
-                self.shift = np.average(self.shift, axis=-1, weights=self.amplitude)
-                self.linewidth = np.average(self.linewidth, axis=-1, weights=self.amplitude)
-                self.amplitude = np.average(self.amplitude, axis=-1, weights=self.amplitude)
-                self.shift_var = np.sum(self.shift_var**2 * self.amplitude**2, axis = -1) / np.sum(self.amplitude**2, axis=-1)
-                self.linewidth_var = np.sum(self.linewidth_var**2 * self.amplitude**2, axis = -1) / np.sum(self.amplitude**2, axis=-1)
-                self.amplitude_var = np.sum(self.amplitude_var**4, axis = -1) / np.sum(self.amplitude**2, axis=-1)
-            else:
-                self.offset[tuple(position)] = np.average(offset_sample)
-                self.shift[tuple(position)] = np.average(shift_sample)
-                self.linewidth[tuple(position)] = np.average(linewidth_sample)
-                self.shift_var[tuple(position)] = np.sum(shift_err_sample**2 * amplitude_sample**2) / np.sum(amplitude_sample**2, axis=-1)
-                self.linewidth_var[tuple(position)] = np.sum(linewidth_err_sample**2 * amplitude_sample**2) / np.sum(amplitude_sample**2, axis=-1)
-                self.amplitude[tuple(position)] = np.average(amplitude_sample)
-                self.amplitude_var[tuple(position)] = np.sum(amplitude_err_sample**4) / np.sum(amplitude_sample**2, axis=-1)
-
-        elif shift_err_weight:
-            if position is None:
-                # For each set of amplitudes along the last axis, calculate the weighted average of the shift and linewidth
-                self.offset = np.average(self.offset, axis=-1, weights=1/self.shift_var)
-                self.shift = np.average(self.shift, axis=-1, weights=1/self.shift_var)
-                self.linewidth = np.average(self.linewidth, axis=-1, weights=1/self.shift_var)
-                self.amplitude = np.average(self.amplitude, axis=-1, weights=1/self.shift_var)
-                self.linewidth_var = np.sum(self.linewidth_var**2 / self.shift_var**2, axis = -1) / np.sum(1/self.shift_var**2, axis=-1)
-                self.amplitude_var = np.sum(self.amplitude_var**2 / self.shift_var**2, axis = -1) / np.sum(1/self.shift_var**2, axis=-1)
-                self.shift_var = self.shift_var.shape[-1] / np.sum(1/self.shift_var**2, axis=-1)
-            else:
-                self.offset[tuple(position)] = np.average(offset_sample, weights=1/shift_err_sample)
-                self.shift[tuple(position)] = np.average(shift_sample, weights=1/shift_err_sample)
-                self.linewidth[tuple(position)] = np.average(linewidth_sample, weights=1/shift_err_sample)
-                self.amplitude[tuple(position)] = np.average(amplitude_sample, weights=1/shift_err_sample)
-                self.shift_var[tuple(position)] = len(shift_err_sample) / np.sum(1/shift_err_sample**2)
-                self.linewidth_var[tuple(position)] = np.sum(linewidth_err_sample**2 / shift_err_sample**2) / np.sum(1 / shift_err_sample**2)
-                self.amplitude_var[tuple(position)] = np.sum(amplitude_err_sample**2 / shift_err_sample**2) / np.sum(1 / shift_err_sample**2)
-        
-        else:
-            if position is None:
-                self.offset = np.nanmean(self.offset, axis=-1)
-                self.shift = np.nanmean(self.shift, axis=-1)
-                self.linewidth = np.nanmean(self.linewidth, axis=-1)
-                self.amplitude = np.nanmean(self.amplitude, axis=-1)
-                self.linewidth_var = np.nanmean(self.linewidth_var**2, axis = -1)
-                self.amplitude_var = np.nanmean(self.amplitude_var**2, axis = -1)
-                self.shift_var = np.nanmean(self.shift_var**2, axis = -1)
-            else:
-                self.offset[tuple(position)] = np.nanmean(offset_sample)
-                self.shift[tuple(position)] = np.nanmean(shift_sample)
-                self.linewidth[tuple(position)] = np.nanmean(linewidth_sample)
-                self.amplitude[tuple(position)] = np.nanmean(amplitude_sample)
-                self.linewidth_var[tuple(position)] = np.nanmean(linewidth_err_sample**2)
-                self.amplitude_var[tuple(position)] = np.nanmean(amplitude_err_sample**2)
-                self.shift_var[tuple(position)] = np.nanmean(shift_err_sample**2)
-        
-        if position is None:
-            self.BLT = self.linewidth / self.shift 
-            self.BLT_var = self.BLT**2 * ((self.linewidth_var / self.linewidth)**2 + (self.shift_var / self.shift)**2)
+            self.offset, self.shift, self.linewidth, self.amplitude = offset, shift, linewidth, amplitude
+            self.shift_var, self.linewidth_var, self.amplitude_var = shift_var, linewidth_var, amplitude_var
+            self.BLT, self.BLT_var = BLT, BLT_var
         else:
-            self.BLT[tuple(position)] = self.linewidth[tuple(position)] / self.shift[tuple(position)]
-            self.BLT_var[tuple(position)] = self.BLT[tuple(position)]**2 * ((self.linewidth_var[tuple(position)] / self.linewidth[tuple(position)])**2 + (self.shift_var[tuple(position)] / self.shift[tuple(position)])**2)
+            self.shift_sample = results[1]
+
+            # Update the spectra at the given positions, one or several positions being given
+            position = np.asarray(position)
+            index = tuple(position) if position.ndim == 1 else tuple(position.T)
+            self.offset[index], self.shift[index], self.linewidth[index], self.amplitude[index] = offset, shift, linewidth, amplitude
+            self.shift_var[index], self.linewidth_var[index], self.amplitude_var[index] = shift_var, linewidth_var, amplitude_var
+            self.BLT[index], self.BLT_var[index] = BLT, BLT_var
 
     # Outliers 
 
+    ERROR_DTYPE = np.dtype([("marked", bool), ("value", float)]) # The structure of the maps of errors: whether a point is marked as an error and the value that made it an error
+
+    @property
+    def point_error(self):
+        """The positions of the points marked as errors, grouped by type of error in the order the types were first marked. This list is generated from the error_maps attribute each time it is accessed.
+        """
+        return [position for error in self.error_maps.values() for position in np.argwhere(error["marked"]).tolist()]
+
+    @point_error.setter
+    def point_error(self, value):
+        self._clear_errors(value)
+
+    @property
+    def point_error_type(self):
+        """The types of the errors of the points listed in point_error. This list is generated from the error_maps attribute each time it is accessed.
+        """
+        return [error_type for error_type, error in self.error_maps.items() for _ in range(int(np.count_nonzero(error["marked"])))]
+
+    @point_error_type.setter
+    def point_error_type(self, value):
+        self._clear_errors(value)
+
+    @property
+    def point_error_value(self):
+        """The values that made the points listed in point_error errors (NaN for errors that are not related to a value). This list is generated from the error_maps attribute each time it is accessed.
+        """
+        return [value for error in self.error_maps.values() for value in error["value"][error["marked"]].tolist()]
+
+    @point_error_value.setter
+    def point_error_value(self, value):
+        self._clear_errors(value)
+
+    def _clear_errors(self, value):
+        """Removes all the errors when an empty list is assigned to point_error, point_error_type or point_error_value. These lists being views of the error_maps attribute, they can't be assigned other values.
+
+        Parameters
+        ----------
+        value : list
+            The value assigned to the list
+
+        Raises
+        ------
+        ValueError
+            If the value is not empty
+        """
+        if len(value) > 0:
+            raise ValueError("The lists of errors are generated from the error_maps attribute and can only be emptied. Use mark_point_error to mark a point as an error.")
+        self.error_maps = {}
+
+    def _mark_errors(self, error_type, marked, values = None, invalidate = True):
+        """Stores the points marked with a given type of error in the error_maps attribute and sets their results to NaN in the global attributes.
+
+        Parameters
+        ----------
+        error_type : str
+            The type of the error
+        marked : array of bool
+            The points to mark as errors, with the shape of the global attributes or of their first dimensions
+        values : array, optional
+            The values that made the points errors, with the same shape as marked, by default None means that no value is stored (NaN)
+        invalidate : bool, optional
+            Whether to set the results of the marked points to NaN in the global attributes, by default True
+
+        Raises
+        ------
+        ValueError
+            If the type of error was already marked on maps of another shape
+        """
+        # Create the map of this type of error, or merge the new points with the existing map
+        error = self.error_maps.get(error_type, None)
+        if error is None:
+            error = np.zeros(marked.shape, dtype = self.ERROR_DTYPE)
+            error["value"] = np.nan
+            self.error_maps[error_type] = error
+        elif error.shape != marked.shape:
+            raise ValueError(f"The errors of type {error_type} are stored on maps of shape {error.shape}, points can't be marked on maps of shape {marked.shape}.")
+        error["marked"] |= marked
+        if values is not None:
+            error["value"][marked] = values[marked]
+
+        # Invalidate the results of the marked points
+        if invalidate:
+            for name in ["shift_var", "shift", "linewidth_var", "linewidth", "amplitude_var", "amplitude", "BLT_var", "BLT"]:
+                getattr(self, name)[marked] = np.nan
+
     def mark_errors_shift(self, min_shift: float = 0, max_shift: float = 10):
         """Marks the points that present a value of shift above or below given thresholds.
 
@@ -1219,35 +1753,8 @@ class Treat(Treat_backend):
         max_shift: float, optional
             The threshold above which the shift is marked as an error , by default 10GHz
         """
-        positions = np.where(self.shift > max_shift)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("shift_max")
-            self.point_error_value.append(self.shift[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
-
-        positions = np.where(self.shift < min_shift)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("shift_min")
-            self.point_error_value.append(self.shift[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("shift_max", self.shift > max_shift, self.shift)
+        self._mark_errors("shift_min", self.shift < min_shift, self.shift)
 
     def mark_errors_std_shift(self, max_error_shift_variance: float = 0.005):
         """Marks the points that present a variance of the shift greater than a certain threshold.
@@ -1257,20 +1764,7 @@ class Treat(Treat_backend):
         max_error_shift_err : float, optional
             The threshold above which the shift is marked as an error , by default 5MHz
         """
-        positions = np.where(self.shift_var > max_error_shift_variance)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("shift_var")
-            self.point_error_value.append(self.shift_var[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("shift_var", self.shift_var > max_error_shift_variance, self.shift_var)
 
     def mark_errors_linewidth(self, min_linewidth: float = 0, max_linewidth: float = 10):
         """Marks the points that present a value of linewidth above or below given thresholds.
@@ -1282,35 +1776,8 @@ class Treat(Treat_backend):
         max_linewidth: float, optional
             The threshold above which the linewidth is marked as an error , by default 10GHz
         """
-        positions = np.where(self.linewidth > max_linewidth)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("linewidth_max")
-            self.point_error_value.append(self.linewidth[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
-
-        positions = np.where(self.linewidth < min_linewidth)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("linewidth_min")
-            self.point_error_value.append(self.linewidth[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("linewidth_max", self.linewidth > max_linewidth, self.linewidth)
+        self._mark_errors("linewidth_min", self.linewidth < min_linewidth, self.linewidth)
 
     def mark_errors_std_linewidth(self, max_error_linewidth_variance: float = 0.005):
         """Marks the points that present a variance of the linewidth greater than a certain threshold.
@@ -1320,20 +1787,7 @@ class Treat(Treat_backend):
         max_error_linewidth_variance : float, optional
             The threshold above which the linewidth is marked as an error , by default 5MHz
         """
-        positions = np.where(self.linewidth_var > max_error_linewidth_variance)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("linewidth_var")
-            self.point_error_value.append(self.linewidth_var[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("linewidth_var", self.linewidth_var > max_error_linewidth_variance, self.linewidth_var)
 
     def mark_errors_BLT(self, min_BLT: float = 0, max_BLT: float = 10):
         """Marks the points that present a value of BLT above or below given thresholds.
@@ -1345,35 +1799,8 @@ class Treat(Treat_backend):
         max_shift: float, optional
             The threshold above which the shift is marked as an error , by default 10GHz
         """
-        positions = np.where(self.BLT > max_BLT)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("BLT_max")
-            self.point_error_value.append(self.BLT[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
-
-        positions = np.where(self.BLT < min_BLT)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("BLT_min")
-            self.point_error_value.append(self.BLT[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("BLT_max", self.BLT > max_BLT, self.BLT)
+        self._mark_errors("BLT_min", self.BLT < min_BLT, self.BLT)
 
     def mark_errors_std_BLT(self, max_error_BLT_variance: float = 0.005):
         """Marks the points that present a variance of the BLT greater than a certain threshold.
@@ -1383,20 +1810,7 @@ class Treat(Treat_backend):
         max_error_shift_err : float, optional
             The threshold above which the shift is marked as an error , by default 5MHz
         """
-        positions = np.where(self.BLT_var > max_error_BLT_variance)
-        for i in range(len(positions[0])):
-            pos = [int(p[i]) for p in positions]
-            self.point_error.append(pos)
-            self.point_error_type.append("BLT_var")
-            self.point_error_value.append(self.BLT_var[tuple(pos)])
-        self.shift_var[positions] = np.nan
-        self.shift[positions] = np.nan
-        self.linewidth_var[positions] = np.nan   
-        self.linewidth[positions] = np.nan
-        self.amplitude_var[positions] = np.nan
-        self.amplitude[positions] = np.nan
-        self.BLT_var[positions] = np.nan
-        self.BLT[positions] = np.nan
+        self._mark_errors("BLT_var", self.BLT_var > max_error_BLT_variance, self.BLT_var)
 
     def mark_point_error(self, position : list):
         """ Forces a point located at the position "position" to be considered as an error.
@@ -1410,15 +1824,47 @@ class Treat(Treat_backend):
         -------
         None
         """
-        self.point_error.append(position)
-        self.point_error_type.append("point_error")
-        self.point_error_value.append(np.nan)
-        self.shift_var[tuple(position)] = np.nan
-        self.shift[tuple(position)] = np.nan
-        self.linewidth_var[tuple(position)] = np.nan   
-        self.linewidth[tuple(position)] = np.nan
-        self.amplitude_var[tuple(position)] = np.nan
-        self.amplitude[tuple(position)] = np.nan
-        self.BLT_var[tuple(position)] = np.nan
-        self.BLT[tuple(position)] = np.nan
-
+        marked = np.zeros(self.shift.shape[:len(position)], dtype = bool)
+        marked[tuple(position)] = True
+        self._mark_errors("point_error", marked)
+
+def _treatment_worker(state, shared, task, positions, parameters):
+    """Runs a task of the treatment on a chunk of positions in a worker process. The class is rebuilt from the copy of its state, the PSD array and the global attributes being attached from shared memory.
+
+    Parameters
+    ----------
+    state : dict
+        The attributes of the class, except for the shared arrays
+    shared : dict
+        The name of the shared memory block, the shape and the dtype of each shared array
+    task : str
+        The name of the method to run
+    positions : array
+        The positions (or rows) to treat
+    parameters : dict
+        The parameters given to the method in addition to the positions
+
+    Returns
+    -------
+    int
+        The number of positions treated
+    """
+    blocks = []
+    treat = object.__new__(Treat)
+    treat.__dict__.update(state)
+    try:
+        # Attach the shared arrays
+        for name, (block_name, shape, dtype) in shared.items():
+            block = shared_memory.SharedMemory(name = block_name)
+            blocks.append(block)
+            treat.__dict__[name] = np.ndarray(shape, dtype = dtype, buffer = block.buf)
+
+        # Run the task
+        getattr(treat, task)(positions, **parameters)
+    finally:
+        # Release the references to the shared memory before detaching it
+        for name in shared:
+            treat.__dict__.pop(name, None)
+        for block in blocks:
+            block.close()
+    return len(positions)
@@ -2,6 +2,8 @@ import numpy as np
 import json
 import inspect
 
+from .algorithm_plan import AlgorithmPlan
+
 class Treat_backend:
     """This class is the base class for all the treat classes. Its purpose is to provide the basic silent functions to open, create and save algorithms, and to store the different steps of the treatment and their effects on the data.
 
@@ -27,7 +29,8 @@ class Treat_backend:
 
     When a treatment fails or is identified as not well fitted, the class stores the information in the following attributes:
 
-    - point_errors: the list of points that are not well fitted
+    - error_maps: a dictionnary storing, for each type of error, a structured array with the shape of the results marking the points that are not well fitted and the values that made them errors
+    - point_error, point_error_type, point_error_value: the lists of these points, their type of error and their values, generated from error_maps
 
     Additionally, the class uses sub-attributes to test the treatment on particular spectra. These sub-attributes are:
 
@@ -54,6 +57,7 @@ class Treat_backend:
     
     """
     _record_algorithm = True # This attribute is used to record the steps of the analysis
+    _function_specs = {} # The description and default parameters of the public functions of the class, filled when a class inheriting from Treat_backend is defined
 
     def __init__(self, frequency: np.ndarray, PSD: np.ndarray, frequency_sample_dimension = None):
         """Initializes the class by storing the PSD and frequency arrays. Also initializes the sample sub-arrays using the frequency_sample_dimension parameter.
@@ -106,19 +110,39 @@ class Treat_backend:
         # Initializes the progress callback
         self._progress_callback = None
 
-    def __getattribute__(self, name: str):
-        """This function is used to override the __getattribute__ function of the class. It is used to keep track of the history of the algorithm, its impact on the classes attributes, and to store the algorithm in the _algorithm attribute so as to be able to save it or run it later.
+    def __init_subclass__(cls, **kwargs):
+        """Stores the description and the default parameters of the public functions of a new class inheriting from Treat_backend, so that they are not extracted from the docstring and the signature of the functions each time they are called.
+        """
+        super().__init_subclass__(**kwargs)
+        cls._function_specs = {}
+        for name in dir(cls):
+            if not name.startswith('_') and not name.startswith('silent_') and callable(getattr(cls, name)):
+                cls._function_specs[name] = Treat_backend._extract_function_spec(getattr(cls, name))
+
+    @staticmethod
+    def _extract_function_spec(function):
+        """Extracts the description of a function from the first paragraph of its docstring and its default parameters from its signature.
 
         Parameters
         ----------
-        name : str
-            The name of a function of the class.
+        function : callable
+            The function to inspect.
 
         Returns
         -------
-        The result of the function call.
+        2-tuple
+            The description of the function and the dictionary of its default parameters.
         """
-        """This function is used to override the __getattribute__ function of the class. It is used to keep track of the history of the algorithm, its impact on the classes attributes, and to store the algorithm in the _algorithm attribute so as to be able to save it or run it later.
+        docstring = inspect.getdoc(function)
+        description = docstring.split('\n\n')[0] if docstring else ""
+        signature = inspect.signature(function)
+        default_kwargs = {
+            k: v.default for k, v in signature.parameters.items() if v.default is not inspect.Parameter.empty
+        }
+        return description, default_kwargs
+
+    def __getattribute__(self, name: str):
+        """This function is used to override the __getattribute__ function of the class. It is used to keep track of the history of the algorithm, its impact on the classes attributes, and to store the algorithm in the _algorithm attribute so as to be able to save it or run it later. When the algorithm is neither recorded nor stored in the history (for example when it is applied to all the spectra), the functions are returned as they are so that running them costs nothing more than the function itself.
 
         Parameters
         ----------
@@ -129,62 +153,64 @@ class Treat_backend:
         -------
         The result of the function call.
         """
-        # If the attribute is a function, we call it with the given arguments
         attribute = super().__getattribute__(name)
 
-        # If the attribute is a function, and its name doesn't start with an underscore, we run the intermediate function "wrapper"
-        if callable(attribute) and not name.startswith('_') and not name.startswith('silent_'):
-            def wrapper(*args, **kwargs):
-                # Extract the description of the function from the docstring
-                docstring = inspect.getdoc(attribute)
-                description = docstring.split('\n\n')[0] if docstring else ""
-
-                # Get the default parameter values from the function signature
-                signature = inspect.signature(attribute)
-                default_kwargs = {
-                    k: v.default for k, v in signature.parameters.items() if v.default is not inspect.Parameter.empty
-                }
-
-                # Merge default kwargs with provided kwargs
-                merged_kwargs = {**default_kwargs, **kwargs}
-
-                # If the attribute _record_algorithm is True, add the function to the algorithm
-                if self._record_algorithm:
-                    # If the same function has already been run in the algorithm, change the description to "See previous run"
-                    if name in [func["function"] for func in self._algorithm["functions"]]:
-                        description = "See previous run"
-
-                    self._algorithm["functions"].append({
-                        "function": name,
-                        "parameters": merged_kwargs,
-                        "description": description
-                    })
-
-                # Store the attributes of the class in memory to compare them to the ones after the function is run
-                if self._treat_selection == "sampled":
-                    temp_PSD_sample = self.PSD_sample.copy()
-                    temp_frequency_sample = self.frequency_sample.copy()
-                    temp_points = self.points.copy()
-                    temp_windows = self.windows.copy()
-
-                # Run the function
-                result = attribute(*args, **kwargs)
-
-                # If the attribute _save_history is True, compare the attributes of the class with the ones stored in memory and update the history if needed
-                if self._treat_selection == "sampled":
-                    self._history.append({"function": name})
-                    if not np.all(self.PSD_sample == temp_PSD_sample):
-                        self._history[-1]["PSD_sample"] = self.PSD_sample.copy().tolist()
-                    if not np.all(self.frequency_sample == temp_frequency_sample):
-                        self._history[-1]["frequency_sample"] = self.frequency_sample.copy().tolist()
-                    if self.points != temp_points:
-                        self._history[-1]["points"] = self.points.copy()
-                    if self.windows != temp_windows:
-                        self._history[-1]["windows"] = self.windows.copy()
-                
-                return result
-            return wrapper
-        return attribute
+        # Attributes that are not functions, as well as private and silent functions, are returned directly
+        if not callable(attribute) or name[0] == '_' or name.startswith('silent_'):
+            return attribute
+
+        # If the algorithm is not recorded and the history is not stored, the function is run directly
+        if not self._record_algorithm and self._treat_selection != "sampled":
+            return attribute
+
+        # Retrieve the description and the default parameters of the function, stored when the class was defined
+        spec = type(self)._function_specs.get(name)
+        if spec is None:
+            spec = Treat_backend._extract_function_spec(attribute)
+        description, default_kwargs = spec
+
+        def wrapper(*args, **kwargs):
+            # Merge default kwargs with provided kwargs
+            merged_kwargs = {**default_kwargs, **kwargs}
+
+            # If the attribute _record_algorithm is True, add the function to the algorithm
+            if self._record_algorithm:
+                # If the same function has already been run in the algorithm, change the description to "See previous run"
+                if any(func["function"] == name for func in self._algorithm["functions"]):
+                    step_description = "See previous run"
+                else:
+                    step_description = description
+
+                self._algorithm["functions"].append({
+                    "function": name,
+                    "parameters": merged_kwargs,
+                    "description": step_description
+                })
+
+            # Store the attributes of the class in memory to compare them to the ones after the function is run
+            if self._treat_selection == "sampled":
+                temp_PSD_sample = self.PSD_sample.copy()
+                temp_frequency_sample = self.frequency_sample.copy()
+                temp_points = self.points.copy()
+                temp_windows = self.windows.copy()
+
+            # Run the function
+            result = attribute(*args, **kwargs)
+
+            # If the attribute _save_history is True, compare the attributes of the class with the ones stored in memory and update the history if needed
+            if self._treat_selection == "sampled":
+                self._history.append({"function": name})
+                if not np.all(self.PSD_sample == temp_PSD_sample):
+                    self._history[-1]["PSD_sample"] = self.PSD_sample.copy().tolist()
+                if not np.all(self.frequency_sample == temp_frequency_sample):
+                    self._history[-1]["frequency_sample"] = self.frequency_sample.copy().tolist()
+                if self.points != temp_points:
+                    self._history[-1]["points"] = self.points.copy()
+                if self.windows != temp_windows:
+                    self._history[-1]["windows"] = self.windows.copy()
+            
+            return result
+        return wrapper
 
     def silent_clear_points(self):
         """
@@ -327,8 +353,8 @@ class Treat_backend:
             """
             function_name = algorithm["functions"][step]["function"]
             parameters = algorithm["functions"][step]["parameters"]
-            if hasattr(self, function_name) and callable(getattr(self, function_name)):
-                func_to_call = getattr(self, function_name)
+            func_to_call = getattr(self, function_name, None)
+            if callable(func_to_call):
                 func_to_call(**parameters)
 
         # If the algorithm is None, set the algorithm to the _algorithm attribute of the class
@@ -402,8 +428,7 @@ class Treat_backend:
 
         # If the _treat_selection attribute is set to "all" or "errors", the _history attribute is not used and the functions are run sequentially from the first step to the given step (included)
         elif self._treat_selection in ["all", "errors"]:
-            for s in range(step+1):
-                run_step(self, s)
+            AlgorithmPlan(self, algorithm, step).run()
 
         self._record_algorithm = True
 
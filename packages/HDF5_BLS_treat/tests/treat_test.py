@@ -0,0 +1,258 @@
+from pathlib import Path
+import pytest
+import numpy as np
+from scipy.optimize import curve_fit
+from HDF5_BLS_treat import Treat, AlgorithmPlan, MODELS, batch_curve_fit, FrequencyIndex, ImpulseResponse, register_model
+
+# Creates a map of spectra with an Anti-Stokes and a Stokes Lorentzian peak, the shift drifting along the second dimension of the map
+def create_map(shape = (6, 7), shift = 5, drift = 0, noise = 0.01, seed = 0):
+    rng = np.random.default_rng(seed)
+    frequency = np.linspace(-10, 10, 400)
+    lorentzian = lambda x, a, s, g: a * (g/2)**2 / ((x - s)**2 + (g/2)**2)
+    PSD = np.zeros(shape + (frequency.size,))
+    for position in np.ndindex(shape):
+        s = shift + drift * position[-1]
+        PSD[position] = lorentzian(frequency, 1, -s, 1) + lorentzian(frequency, 1, s, 1) + noise * rng.standard_normal(frequency.size)
+    return frequency, PSD
+
+# Creates a treatment of a map, fitting the Anti-Stokes and Stokes peaks individually
+def create_treatment(frequency, PSD, update_point_position = True):
+    treat = Treat(frequency, PSD)
+    treat.add_point(position_center_window = -5, window_width = 4, type_pnt = "Anti-Stokes")
+    treat.add_point(position_center_window = 5, window_width = 4, type_pnt = "Stokes")
+    treat.define_model(model = "Lorentzian")
+    treat.single_fit_all_inelastic(update_point_position = update_point_position, bound_shift = [[-10, 10], [-10, 10]], bound_linewidth = [[0, 5], [0, 5]])
+    return treat
+
+# Test that the batched engine gives the results of the sequential engine on a map whose peaks drift
+def test_batched_engine():
+    frequency, PSD = create_map(drift = 0.15)
+    sequential = create_treatment(frequency, PSD)
+    sequential.apply_algorithm_on_all(engine = "sequential")
+    batched = create_treatment(frequency, PSD)
+    batched.apply_algorithm_on_all(engine = "batched")
+    for name in ["offset", "shift", "linewidth", "amplitude", "shift_var", "linewidth_var", "amplitude_var"]:
+        assert np.allclose(getattr(batched, name), getattr(sequential, name), rtol = 1e-5, atol = 1e-6), name
+    assert np.allclose(sequential.shift[0, :, 1], 5 + 0.15 * np.arange(7), atol = 0.01)
+
+    # Steps reading the points moved by a fit can't be batched
+    batched = create_treatment(frequency, PSD)
+    batched.single_fit_all_inelastic(bound_shift = [[-10, 10], [-10, 10]], bound_linewidth = [[0, 5], [0, 5]])
+    with pytest.raises(ValueError):
+        batched.apply_algorithm_on_all(engine = "batched")
+    batched = create_treatment(frequency, PSD, update_point_position = False)
+    batched.single_fit_all_inelastic(bound_shift = [[-10, 10], [-10, 10]], bound_linewidth = [[0, 5], [0, 5]])
+    batched.apply_algorithm_on_all(engine = "batched")
+
+# Test that the peaks of a model with more than four parameters per peak are fitted together by both engines
+def test_multi_fit_parameters():
+    def pseudo_voigt(nu, b, a, nu0, gamma, eta):
+        x = (nu - nu0) / (gamma / 2)
+        return b + a * ((1 - eta) / (1 + x**2) + eta * np.exp(-np.log(2) * x**2))
+    def jacobian(nu, b, a, nu0, gamma, eta):
+        x = (nu - nu0) / (gamma / 2)
+        lorentzian, gaussian = 1 / (1 + x**2), np.exp(-np.log(2) * x**2)
+        d_x = a * (-(1 - eta) * 2 * x * lorentzian**2 - eta * 2 * np.log(2) * x * gaussian)
+        return np.stack(np.broadcast_arrays(np.ones_like(x), (1 - eta) * lorentzian + eta * gaussian, -d_x * 2 / gamma, -d_x * x / gamma, a * (gaussian - lorentzian)), axis = -1)
+    register_model("Pseudo-Voigt multi-fit test", pseudo_voigt, ["offset", "amplitude", "shift", "linewidth", "eta"], jacobian = jacobian, bounds = [[-np.inf, 0, -np.inf, 0, 0], [np.inf, np.inf, np.inf, np.inf, 1]])
+    frequency, PSD = create_map(shape = (2, 3))
+    treatments = {}
+    for engine in ["sequential", "batched"]:
+        treat = Treat(frequency, PSD)
+        treat.add_point(position_center_window = -5, window_width = 4, type_pnt = "Anti-Stokes")
+        treat.add_point(position_center_window = 5, window_width = 4, type_pnt = "Stokes")
+        treat.define_model(model = "Pseudo-Voigt multi-fit test")
+        treat.multi_fit_all_inelastic(update_point_position = False, bound_shift = [[-10, 0], [0, 10]], bound_linewidth = [[0, 5], [0, 5]])
+        treat.apply_algorithm_on_all(engine = engine)
+        treatments[engine] = treat
+    for name in ["shift", "linewidth", "amplitude"]:
+        assert np.allclose(getattr(treatments["batched"], name), getattr(treatments["sequential"], name), rtol = 1e-3, atol = 1e-4), name
+    assert np.allclose(treatments["sequential"].shift, [-5, 5], atol = 0.01)
+    assert np.allclose(treatments["sequential"].linewidth, 1, atol = 0.02)
+    assert np.allclose(treatments["sequential"].amplitude, 1, atol = 0.02)
+
+# Test that the batched fits give the results of scipy.optimize.curve_fit, with the analytic jacobian and with finite differences
+def test_batch_curve_fit():
+    rng = np.random.default_rng(0)
+    model = MODELS["Lorentzian"]
+    nu = np.linspace(-3, 3, 200)
+    truth = np.column_stack([rng.uniform(-0.1, 0.1, 20), rng.uniform(0.5, 2, 20), rng.uniform(-1, 1, 20), rng.uniform(0.3, 1, 20)])
+    ydata = model.vectorized()(nu, truth) + 0.01 * rng.standard_normal((20, nu.size))
+    p0 = truth * rng.uniform(0.8, 1.2, truth.shape)
+    bounds = ([-np.inf, 0, -np.inf, 0], [np.inf, np.inf, np.inf, np.inf])
+    for jac in [model.vectorized_jacobian(), None]:
+        popt, pcov, success = batch_curve_fit(f = model.vectorized(), xdata = nu, ydata = ydata, p0 = p0, bounds = bounds, jac = jac)
+        assert np.all(success)
+        for i in range(20):
+            popt_scipy, pcov_scipy = curve_fit(model.function, nu, ydata[i], p0 = p0[i], bounds = bounds)
+            assert np.allclose(popt[i], popt_scipy, rtol = 1e-5, atol = 1e-7)
+            assert np.allclose(pcov[i], pcov_scipy, rtol = 1e-3, atol = 1e-12)
+
+# Test that the analytic jacobians of the registered models match their finite differences, with and without impulse response
+def test_jacobians():
+    nu = np.linspace(-5, 5, 201)
+    IR = np.exp(-np.linspace(-1, 1, 21)**2 / 0.1)
+    for name, model in MODELS.items():
+        parameters = np.array([0.1, 1.2, 1.5, 0.8, 0.05][:len(model.parameters)])
+        for ir in [None, IR / IR.sum()]:
+            jacobian = model.evaluate_jacobian(nu, *parameters, IR = ir)
+            assert jacobian.shape == (nu.size, len(parameters)), name
+            for i in range(len(parameters)):
+                step = np.zeros(len(parameters))
+                step[i] = 1e-6
+                derivative = (model.evaluate(nu, *(parameters + step), IR = ir) - model.evaluate(nu, *(parameters - step), IR = ir)) / 2e-6
+                assert np.allclose(jacobian[:, i], derivative, rtol = 1e-5, atol = 1e-6), (name, model.parameters[i])
+
+            # The vectorized jacobian stacks the jacobians of the peaks
+            params = np.tile(parameters, (3, 2))
+            assert np.allclose(model.vectorized_jacobian(2, IR = ir)(nu, params), np.tile(jacobian, (3, 1, 2)))
+
+# Test that the convolution with the impulse response gives the result of np.convolve
+def test_impulse_response():
+    rng = np.random.default_rng(0)
+    for length, IR_length in [(100, 11), (100, 12), (101, 30), (10, 31), (64, 64)]:
+        IR = rng.random(IR_length)
+        data = rng.random((3, length))
+        convolved = ImpulseResponse(IR).convolve(data)
+        for i in range(3):
+            assert np.allclose(convolved[i], np.convolve(data[i], IR, "same"))
+        assert np.allclose(ImpulseResponse(IR).convolve(data.T, axis = 0), convolved.T)
+
+# Test that the impulse response cropped to a window narrower than its support is normalized, so that the amplitude of the peaks is recovered
+def test_impulse_response_window():
+    frequency = np.linspace(-2, 2, 81)
+    IR = np.exp(-np.arange(-100, 101)**2 / 50) + 0.05
+    cropped = IR[60:141] / np.sum(IR[60:141])
+    PSD = np.convolve(1 / (1 + (2 * frequency)**2), cropped, "same")
+    treat = Treat(frequency, np.array([PSD, PSD]))
+    treat.silent_set_impulse_response(IR)
+    assert np.allclose(treat._get_impulse_response(frequency.size).convolve(np.ones(frequency.size))[40], 1)
+    treat.add_point(position_center_window = 0, window_width = 10, type_pnt = "Stokes")
+    treat.define_model(model = "Lorentzian")
+    treat.single_fit_all_inelastic(bound_shift = [[-1, 1]], bound_linewidth = [[0, 5]])
+    treat.apply_algorithm_on_all()
+    assert np.allclose(treat.amplitude, 1, rtol = 1e-6)
+    assert np.allclose(treat.shift, 0, atol = 1e-6)
+    assert np.allclose(treat.linewidth, 1, rtol = 1e-6)
+
+# Test that the frequency index gives the indices found with np.argmin and np.where, on increasing, decreasing and unordered axes
+def test_frequency_index():
+    rng = np.random.default_rng(0)
+    increasing = np.sort(rng.uniform(-10, 10, 300))
+    for frequency in [increasing, increasing[::-1], np.linspace(-10, 10, 201), rng.uniform(-10, 10, 300)]:
+        index = FrequencyIndex(frequency)
+        values = np.concatenate([rng.uniform(-12, 12, 200), frequency[::37], [0.05, -0.05, np.inf, -np.inf, np.nan]])
+        for value in values:
+            assert index.nearest(value) == np.argmin(np.abs(frequency - value))
+        for window in rng.uniform(-12, 12, (100, 2)).tolist() + [[frequency[3], frequency[40]], [np.nan, 1]]:
+            assert np.array_equal(index.window(window), np.where((frequency >= window[0]) & (frequency <= window[1]))[0])
+
+# Test that the treatment gives the same results when the spectra are distributed on several processes
+@pytest.mark.parametrize("engine", ["sequential", "batched"])
+def test_workers(engine):
+    frequency, PSD = create_map(drift = 0.15)
+    single = create_treatment(frequency, PSD, update_point_position = engine == "sequential")
+    single.apply_algorithm_on_all(engine = engine)
+    distributed = create_treatment(frequency, PSD, update_point_position = engine == "sequential")
+    distributed.apply_algorithm_on_all(engine = engine, workers = 2)
+    for name in Treat.SHARED_ATTRIBUTES:
+        assert np.allclose(getattr(distributed, name), getattr(single, name), equal_nan = True), name
+
+# Test that seeding the guesses from the neighboring spectra gives the results obtained with the guesses of the algorithm
+def test_warm_start():
+    frequency, PSD = create_map(drift = 0.15)
+    for update_point_position in [False, True]:
+        cold = create_treatment(frequency, PSD, update_point_position = update_point_position)
+        cold.apply_algorithm_on_all()
+        warm = create_treatment(frequency, PSD, update_point_position = update_point_position)
+        warm.apply_algorithm_on_all(warm_start = "neighbors")
+        for name in ["offset", "shift", "linewidth", "amplitude"]:
+            assert np.allclose(getattr(warm, name), getattr(cold, name), rtol = 1e-5, atol = 1e-6), name
+
+    # The points fitted are moved to the shifts fitted on the last spectrum
+    for treat in [cold, warm]:
+        assert np.allclose([treat.points[0][1], treat.points[1][1]], treat.shift[-1, -1])
+    with pytest.raises(ValueError):
+        warm.apply_algorithm_on_all(engine = "batched", warm_start = "neighbors")
+
+# Test that a PSD read lazily from a HDF5 file gives the results of the PSD loaded in memory
+def test_lazy_treatment(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    frequency, PSD = create_map(drift = 0.15)
+    in_memory = create_treatment(frequency, PSD)
+    in_memory.apply_algorithm_on_all()
+    with h5py.File(tmp_path / "PSD.h5", "w") as file:
+        file.create_dataset("PSD", data = PSD, chunks = (2, 7, 400))
+    with h5py.File(tmp_path / "PSD.h5", "r") as file:
+        lazy = create_treatment(frequency, file["PSD"])
+        lazy.block_size = 10
+        lazy.apply_algorithm_on_all()
+    for name in Treat.SHARED_ATTRIBUTES:
+        assert np.allclose(getattr(lazy, name), getattr(in_memory, name), equal_nan = True), name
+
+# Test that replaying a compiled algorithm gives the results of running the algorithm with silent_run_algorithm
+def test_algorithm_plan():
+    frequency, PSD = create_map(drift = 0.15)
+    run = create_treatment(frequency, PSD)
+    replayed = create_treatment(frequency, PSD)
+    plan = AlgorithmPlan(replayed)
+    for position in [(0, 0), (3, 4), (5, 6)]:
+        run.PSD_sample = PSD[position]
+        run.silent_run_algorithm()
+        replayed.PSD_sample = PSD[position]
+        plan.run()
+        for name in ["offset_sample", "shift_sample", "linewidth_sample", "amplitude_sample", "shift_err_sample", "linewidth_err_sample", "amplitude_err_sample"]:
+            assert np.allclose(getattr(replayed, name), getattr(run, name)), name
+    assert replayed._algorithm == run._algorithm
+
+    # The plan checks the parameters of the steps against their functions
+    run._algorithm["functions"][0]["parameters"]["unknown_parameter"] = 0
+    with pytest.raises(ValueError):
+        AlgorithmPlan(run)
+
+# Test that the lists of errors are generated from the maps of errors
+def test_error_maps():
+    frequency, PSD = create_map()
+    treat = create_treatment(frequency, PSD, update_point_position = False)
+    treat.apply_algorithm_on_all()
+    shift = treat.shift.copy()
+    shift[1, 4, 1] = 7
+    treat.shift[1, 4, 1] = 7
+    treat.mark_errors_shift(min_shift = -6, max_shift = 6)
+    assert treat.error_maps["shift_max"].dtype == Treat.ERROR_DTYPE
+    assert treat.point_error[:1] == [[1, 4, 1]]
+    assert treat.point_error_type[:1] == ["shift_max"]
+    assert treat.point_error_value[:1] == [7]
+    marked = treat.error_maps["shift_max"]["marked"] | treat.error_maps["shift_min"]["marked"]
+    assert np.array_equal(marked, (shift > 6) | (shift < -6))
+    assert np.all(np.isnan(treat.shift[marked]))
+    assert len(treat.point_error) == len(treat.point_error_type) == len(treat.point_error_value) == np.count_nonzero(marked)
+
+    # The lists can only be emptied
+    with pytest.raises(ValueError):
+        treat.point_error = [[0, 0, 0]]
+    treat.point_error = []
+    assert treat.error_maps == {} and treat.point_error == []
+
+# Test that the results of a map can be combined, marked and adjusted after the algorithm has been applied to all the spectra, the points being added again for each spectrum
+@pytest.mark.parametrize("workers", [1, 2])
+def test_combine_and_adjust(workers):
+    frequency, PSD = create_map()
+    PSD[2, 3] = 0.01 * np.random.default_rng(1).standard_normal(frequency.size)
+    treat = create_treatment(frequency, PSD, update_point_position = False)
+    treat.apply_algorithm_on_all(workers = workers)
+    treat.combine_results_FSR(FSR = 15)
+    assert treat.shift.shape == (6, 7)
+    assert np.allclose(np.delete(treat.shift.reshape(-1), 2*7+3), 5, atol = 0.01)
+    treat.mark_errors_shift(min_shift = 4, max_shift = 6)
+    assert [2, 3] in [list(p) for p in treat.point_error]
+    treat.adjust_treatment_on_errors(workers = workers)
+    assert treat.shift.shape == (6, 7)
+    assert np.allclose(np.delete(treat.shift.reshape(-1), 2*7+3), 5, atol = 0.01)
+
+# Test that the copies of the algorithm plans of HDF5_BLS_treat and HDF5_BLS_analyse are identical
+def test_algorithm_plan_copies():
+    packages = Path(__file__).resolve().parents[2]
+    treat_plan = packages / "HDF5_BLS_treat" / "src" / "_HDF5_BLS_treat" / "algorithm_plan.py"
+    analyse_plan = packages / "HDF5_BLS_analyse" / "src" / "_HDF5_BLS_analyse" / "algorithm_plan.py"
+    assert treat_plan.read_text() == analyse_plan.read_text()